@@ -0,0 +1,161 @@
+import threading
+import time
+from collections import deque
+from logger import get_logger
+
+logger = get_logger('download')
+
+class AIMDController:
+    def __init__(self, min_limit=1, max_limit=16, increase_step=1, decrease_factor=0.5,
+                 growth_threshold=0.05, drop_threshold=0.3, stall_seconds=15, probe_interval=6):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.growth_threshold = growth_threshold
+        self.drop_threshold = drop_threshold
+        self.stall_seconds = stall_seconds
+        self.probe_interval = probe_interval
+        
+        self._lock = threading.Lock()
+        self._last_sizes = {}
+        self._last_progress = {}
+        self._stalled = set()
+        self._finished_bytes = 0
+        self._last_sample_time = None
+        self._last_rate_limit_hits = 0
+        self._prev_throughput = None
+        self._prev_per_task = None
+        self._probing = False
+        self._hold_samples = 0
+        
+        self.decisions = deque(maxlen=200)
+        self.metrics = {
+            'limit': None,
+            'throughput': 0,
+            'per_task_throughput': 0,
+            'active': 0,
+            'increases': 0,
+            'decreases': 0,
+            'rate_limit_events': 0,
+            'stalls': 0,
+            'last_reason': None
+        }
+    
+    def task_finished(self, task):
+        with self._lock:
+            last = self._last_sizes.pop(task, 0)
+            self._finished_bytes += max(0, task.received_size - last)
+            self._last_progress.pop(task, None)
+            self._stalled.discard(task)
+    
+    def _collect(self, active_tasks, now):
+        downloaded = self._finished_bytes
+        self._finished_bytes = 0
+        stalled = 0
+        
+        for task in active_tasks:
+            size = task.received_size
+            last = self._last_sizes.get(task)
+            if last is None or size != last or not task.transferring:
+                self._last_progress[task] = now
+                self._stalled.discard(task)
+            downloaded += max(0, size - (last or 0))
+            self._last_sizes[task] = size
+            
+            if task.status == 'downloading' and task not in self._stalled and now - self._last_progress.get(task, now) > self.stall_seconds:
+                self._stalled.add(task)
+                stalled += 1
+        return downloaded, stalled
+    
+    def _decide(self, limit, throughput, per_task, saturated, rate_limited, stalled):
+        if rate_limited:
+            return self._decrease(limit), f'API限流 {rate_limited} 次'
+        if stalled:
+            return self._decrease(limit), f'{stalled} 个任务停滞'
+        if not saturated or self._prev_throughput is None:
+            self._probing = False
+            return limit, None
+        
+        if self._probing:
+            if throughput > self._prev_throughput * (1 + self.growth_threshold):
+                return self._increase(limit), '总吞吐量上升'
+            self._probing = False
+            self._hold_samples = self.probe_interval
+            return limit, None
+        
+        if self._prev_per_task and per_task < self._prev_per_task * (1 - self.drop_threshold):
+            return self._decrease(limit), '单任务吞吐量下降'
+        
+        if self._hold_samples > 0:
+            self._hold_samples -= 1
+            return limit, None
+        return self._increase(limit), '探测更高并发'
+    
+    def _increase(self, limit):
+        if limit >= self.max_limit:
+            self._probing = False
+            return limit
+        self._probing = True
+        return min(self.max_limit, limit + self.increase_step)
+    
+    def _decrease(self, limit):
+        self._probing = False
+        self._hold_samples = self.probe_interval
+        return max(self.min_limit, int(limit * self.decrease_factor))
+    
+    def sample(self, limit, active_tasks, queued, rate_limit_hits):
+        now = time.time()
+        with self._lock:
+            downloaded, stalled = self._collect(active_tasks, now)
+            if self._last_sample_time is None:
+                self._last_sample_time = now
+                self._last_rate_limit_hits = rate_limit_hits
+                self.metrics['limit'] = limit
+                return limit
+            
+            elapsed = max(now - self._last_sample_time, 1e-6)
+            throughput = downloaded / elapsed
+            active = len(active_tasks)
+            per_task = throughput / active if active else 0
+            rate_limited = max(0, rate_limit_hits - self._last_rate_limit_hits)
+            saturated = active >= limit and queued > 0
+            
+            new_limit, reason = self._decide(limit, throughput, per_task, saturated, rate_limited, stalled)
+            
+            self._last_sample_time = now
+            self._last_rate_limit_hits = rate_limit_hits
+            if active:
+                self._prev_throughput = throughput
+                self._prev_per_task = per_task
+            
+            self.metrics.update({
+                'limit': new_limit,
+                'throughput': throughput,
+                'per_task_throughput': per_task,
+                'active': active
+            })
+            self.metrics['rate_limit_events'] += rate_limited
+            self.metrics['stalls'] += stalled
+            
+            if new_limit != limit:
+                key = 'increases' if new_limit > limit else 'decreases'
+                self.metrics[key] += 1
+                self.metrics['last_reason'] = reason
+                self.decisions.append({
+                    'time': now,
+                    'from': limit,
+                    'to': new_limit,
+                    'reason': reason,
+                    'throughput': throughput,
+                    'per_task_throughput': per_task
+                })
+                logger.info('自适应并发: %s -> %s (%s, 总吞吐 %.0f KB/s, 单任务 %.0f KB/s)', limit, new_limit, reason, throughput / 1024, per_task / 1024)
+            
+            return new_limit
+    
+    def get_metrics(self):
+        with self._lock:
+            metrics = dict(self.metrics)
+            metrics['decisions'] = list(self.decisions)[-20:]
+            return metrics
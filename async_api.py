@@ -0,0 +1,228 @@
+import asyncio
+import threading
+import httpx
+from logger import get_logger
+from bilibili_api import api
+from url_router import route_url
+from metrics import api_requests, retries, endpoint_of
+
+logger = get_logger('api')
+
+class AsyncBilibiliAPI:
+    def __init__(self, sync_api=api, timeout=10.0, max_connections=20):
+        self.sync_api = sync_api
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._client = None
+        self._cookie_jar = None
+    
+    async def _get_client(self):
+        cookie_jar = self.sync_api.session.cookies
+        if self._client is not None and not self._client.is_closed and self._cookie_jar is cookie_jar:
+            return self._client
+        
+        previous = self._client
+        self._client = httpx.AsyncClient(
+            http2=True,
+            headers=dict(self.sync_api.session.headers),
+            cookies=cookie_jar,
+            timeout=httpx.Timeout(self.timeout),
+            limits=httpx.Limits(max_connections=self.max_connections)
+        )
+        self._cookie_jar = cookie_jar
+        if previous is not None:
+            await previous.aclose()
+        return self._client
+    
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _wait_rate_limit(self):
+        wait = self.sync_api._reserve_request_slot()
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    async def _request_with_retry(self, url, max_retries=None, rate_limited=True):
+        if max_retries is None:
+            max_retries = self.sync_api.max_retries
+        
+        endpoint = endpoint_of(url)
+        
+        for attempt in range(max_retries):
+            try:
+                if rate_limited:
+                    await self._wait_rate_limit()
+                
+                client = await self._get_client()
+                response = await client.get(url)
+                data = response.json()
+                api_requests.inc(endpoint=endpoint, code=data.get('code'))
+                
+                if data.get('code') == -799:
+                    self.sync_api.rate_limit_hits += 1
+                    logger.warning('请求被限制，等待后重试 (尝试 %s/%s)', attempt + 1, max_retries)
+                    if attempt < max_retries - 1:
+                        retries.inc(kind='api')
+                        await asyncio.sleep((attempt + 1) * 3)
+                        continue
+                    else:
+                        logger.error('达到最大重试次数，放弃请求')
+                        return None
+                
+                return data
+            except (httpx.HTTPError, ValueError) as e:
+                api_requests.inc(endpoint=endpoint, code='error')
+                logger.error('请求异常 (尝试 %s/%s): %s', attempt + 1, max_retries, e)
+                if attempt < max_retries - 1:
+                    retries.inc(kind='api')
+                    await asyncio.sleep((attempt + 1) * 3)
+                    continue
+                else:
+                    return None
+        return None
+    
+    async def get_video_info(self, url):
+        route = route_url(url)
+        if route is not None and route.kind == 'short':
+            url = await asyncio.to_thread(self.sync_api.resolve_short_url, url) or ''
+        
+        api_url = self.sync_api._view_api_url(url)
+        if not api_url:
+            logger.error('无法提取BVID: %s', url)
+            return None
+        
+        data = await self._request_with_retry(api_url)
+        if data is None:
+            return None
+        
+        if data.get('code') == 0:
+            return self.sync_api._parse_view_data(data['data'])
+        logger.error('获取视频信息失败: %s', data)
+        return None
+    
+    async def get_video_streams(self, bvid, cid, quality='1080P'):
+        data = await self._request_with_retry(self.sync_api._playurl_api_url(bvid, cid, quality))
+        if data is None:
+            return None
+        
+        if data.get('code') == 0:
+            return data['data']
+        logger.error('获取视频流失败: %s', data)
+        return None
+    
+    async def get_series_info(self, sid, series_type):
+        data = await self._request_with_retry(self.sync_api._series_api_url(sid, series_type))
+        if data is None or data.get('code') != 0:
+            return None
+        return self.sync_api._parse_series_data(data, series_type)
+    
+    async def get_user_videos_page(self, mid, page, page_size=30):
+        data = await self._request_with_retry(self.sync_api._user_videos_api_url(mid, page, page_size))
+        if data is None:
+            return None
+        
+        if data.get('code') != 0:
+            logger.error('获取用户视频列表失败: %s', data)
+            return None
+        return self.sync_api._parse_user_videos_data(data)
+    
+    async def get_qrcode(self):
+        data = await self._request_with_retry(f'{self.sync_api.passport_base}/x/passport-login/web/qrcode/generate', rate_limited=False)
+        if data is None or data.get('code') != 0:
+            logger.error('获取二维码失败: %s', data)
+            return None, None
+        return data['data']['qrcode_key'], self.sync_api._qrcode_image(data['data']['url'])
+    
+    async def check_qrcode_status(self, qrcode_key):
+        data = await self._request_with_retry(
+            f'{self.sync_api.passport_base}/x/passport-login/web/qrcode/poll?qrcode_key={qrcode_key}',
+            max_retries=1,
+            rate_limited=False
+        )
+        if data is None or data.get('code') != 0:
+            return 'error'
+        
+        status = data['data']['code']
+        if status == 86101:
+            return 'waiting'
+        elif status == 86090:
+            return 'scanned'
+        elif status == 0:
+            url = data['data']['url']
+            if url:
+                for cookie in url.split('?')[1].split('&'):
+                    key, value = cookie.split('=')
+                    self.sync_api.cookies[key] = value
+                self.sync_api.session.cookies.update(self.sync_api.cookies)
+                self.sync_api.is_logged_in = True
+                logger.info('登录成功')
+                return 'success'
+        return 'expired'
+    
+    async def resolve_video_infos(self, urls):
+        results = await asyncio.gather(*(self.get_video_info(url) for url in urls), return_exceptions=True)
+        
+        infos = {}
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                logger.error('获取视频信息异常: %s, %s', url, result)
+                result = None
+            infos[url] = result
+        return infos
+
+class BlockingAsyncAPI:
+    def __init__(self, async_api=None):
+        self.async_api = async_api or AsyncBilibiliAPI()
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+                self._thread.start()
+        return self._loop
+    
+    def run(self, coro, timeout=None):
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        try:
+            return future.result(timeout)
+        except TimeoutError:
+            future.cancel()
+            logger.error('请求超时 (%s 秒)', timeout)
+            return None
+    
+    def get_video_info(self, url, timeout=None):
+        return self.run(self.async_api.get_video_info(url), timeout)
+    
+    def get_video_streams(self, bvid, cid, quality='1080P', timeout=None):
+        return self.run(self.async_api.get_video_streams(bvid, cid, quality), timeout)
+    
+    def get_series_info(self, sid, series_type, timeout=None):
+        return self.run(self.async_api.get_series_info(sid, series_type), timeout)
+    
+    def get_user_videos_page(self, mid, page, page_size=30, timeout=None):
+        return self.run(self.async_api.get_user_videos_page(mid, page, page_size), timeout)
+    
+    def get_qrcode(self, timeout=None):
+        return self.run(self.async_api.get_qrcode(), timeout)
+    
+    def check_qrcode_status(self, qrcode_key, timeout=None):
+        return self.run(self.async_api.check_qrcode_status(qrcode_key), timeout)
+    
+    def resolve_video_infos(self, urls, timeout=None):
+        return self.run(self.async_api.resolve_video_infos(urls), timeout) or {}
+    
+    def close(self):
+        if self._loop is None:
+            return
+        self.run(self.async_api.close(), 5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+
+async_api = BlockingAsyncAPI()
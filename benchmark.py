@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+WORK_DIR = tempfile.mkdtemp(prefix='bili-bench-')
+os.environ.setdefault('BILI_DATA_DIR', os.path.join(WORK_DIR, 'data'))
+os.environ.setdefault('BILI_CONFIG_DIR', os.path.join(WORK_DIR, 'config'))
+os.environ.setdefault('BILI_LOGS_DIR', os.path.join(WORK_DIR, 'logs'))
+
+from config import BASE_DIR
+from logger import logger
+from bilibili_api import api
+from link_ingest import LinkIngester
+from download_manager import DownloadTask, download_manager, check_ffmpeg
+from standin_server import StandInServer
+
+BASELINE_FILE = os.path.join(BASE_DIR, 'benchmark_baseline.json')
+FINISHED_STATUSES = ('completed', 'skipped', 'error')
+SCENARIOS = {
+    'single': {'description': '单个长视频', 'videos': 1, 'duration': 300},
+    'collection': {'description': '大型合集', 'collections': 3, 'size': 30, 'duration': 20},
+    'space': {'description': 'UP主空间', 'space': 75, 'duration': 20}
+}
+HIGHER_IS_BETTER = {'tasks_per_min': True, 'mb_per_s': True, 'api_calls_per_task': False}
+
+def build_links(server, scenario):
+    links = [server.video_url(server.add_video(duration=scenario['duration'])) for _ in range(scenario.get('videos', 0))]
+    for _ in range(scenario.get('collections', 0)):
+        links.append(server.add_collection(scenario['size'], scenario['duration']))
+    if scenario.get('space'):
+        links.append(server.add_space(scenario['space'], scenario['duration']))
+    return links
+
+def run_scenario(name, server, args):
+    scenario = SCENARIOS[name]
+    links = build_links(server, scenario)
+    output_path = os.path.join(WORK_DIR, 'output', name)
+    os.makedirs(output_path, exist_ok=True)
+    
+    server.reset_stats()
+    started = time.time()
+    tasks = []
+    for batch in LinkIngester().iter_batches(links):
+        for video_info in batch:
+            task = DownloadTask(video_info, output_path, args.quality, 'mp4', False, max_retries=api.max_retries, skip_exists_check=True)
+            tasks.append(task)
+            download_manager.add_task(task)
+    
+    deadline = started + args.timeout
+    while any(task.status not in FINISHED_STATUSES for task in tasks):
+        if time.time() > deadline:
+            for task in tasks:
+                if task.status not in FINISHED_STATUSES:
+                    task.stop()
+            break
+        time.sleep(0.1)
+    elapsed = max(time.time() - started, 1e-6)
+    
+    stats = server.get_stats()
+    downloaded = sum(task.downloaded_size for task in tasks)
+    count = max(len(tasks), 1)
+    return {
+        'tasks': len(tasks),
+        'failed': sum(1 for task in tasks if task.status != 'completed'),
+        'seconds': round(elapsed, 2),
+        'tasks_per_min': round(len(tasks) / elapsed * 60, 2),
+        'mb_per_s': round(downloaded / elapsed / 1048576, 2),
+        'api_calls_per_task': round(stats['api_calls'] / count, 2),
+        'rate_limited': stats.get('rate_limited', 0),
+        'cdn_failures': stats.get('cdn_failures', 0)
+    }
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_baseline(path, results, params):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'params': params, 'platform': platform.platform(), 'python': platform.python_version(), 'results': results}, f, ensure_ascii=False, indent=2)
+    print(f'基准数据已保存: {path}')
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        base = (baseline.get('results') or {}).get(name)
+        print(f'\n[{name}] {SCENARIOS[name]["description"]}: {result["tasks"]} 个任务, 失败 {result["failed"]}, 耗时 {result["seconds"]}s')
+        for metric, higher_is_better in HIGHER_IS_BETTER.items():
+            current = result[metric]
+            if not base or not base.get(metric):
+                print(f'  {metric:<20} {current:>10}')
+                continue
+            
+            previous = base[metric]
+            change = (current - previous) / previous
+            worse = -change if higher_is_better else change
+            mark = ''
+            if worse > tolerance:
+                mark = '  <- 退化'
+                regressions.append(f'{name}.{metric}')
+            elif -worse > tolerance:
+                mark = '  <- 提升'
+            print(f'  {metric:<20} {current:>10}  基准 {previous:>10}  {change:+.1%}{mark}')
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='下载性能测试 (使用本地模拟服务)')
+    parser.add_argument('scenarios', nargs='*', help=f'要运行的场景: {", ".join(SCENARIOS)}, 默认全部')
+    parser.add_argument('-j', '--jobs', type=int, default=5, help='最大同时下载数')
+    parser.add_argument('-q', '--quality', default='1080P', help='清晰度')
+    parser.add_argument('--latency', type=float, default=0.05, help='每个API请求附加的延迟 (秒)')
+    parser.add_argument('--throttle', type=float, default=8.0, help='每个CDN连接的限速 (MB/s), 0 表示不限速')
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='返回 -799 的请求比例')
+    parser.add_argument('--backup-hosts', type=int, default=1, help='备用CDN主机数量')
+    parser.add_argument('--primary-failure-ratio', type=float, default=0.0, help='主CDN主机返回 503 的比例')
+    parser.add_argument('--request-delay', type=float, default=api.request_delay, help='API请求间隔 (秒), 默认与正式下载相同')
+    parser.add_argument('--timeout', type=float, default=1800, help='每个场景的超时时间 (秒)')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='基准数据文件')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基准数据')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='允许的性能波动比例')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f'未知的场景: {", ".join(unknown)}')
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not check_ffmpeg():
+        sys.stderr.write('FFmpeg未安装，无法进行性能测试。请先安装FFmpeg。\n')
+        return 3
+    
+    params = {
+        'jobs': args.jobs,
+        'quality': args.quality,
+        'latency': args.latency,
+        'throttle': args.throttle,
+        'rate_limit_ratio': args.rate_limit_ratio,
+        'backup_hosts': args.backup_hosts,
+        'primary_failure_ratio': args.primary_failure_ratio,
+        'request_delay': args.request_delay
+    }
+    server = StandInServer(
+        latency=args.latency,
+        throttle=int(args.throttle * 1048576),
+        rate_limit_ratio=args.rate_limit_ratio,
+        backup_hosts=args.backup_hosts,
+        primary_failure_ratio=args.primary_failure_ratio,
+        media_dir=os.path.join(WORK_DIR, 'media')
+    ).start()
+    api.api_base = server.url
+    api.passport_base = server.url
+    api.request_delay = args.request_delay
+    download_manager.set_max_concurrent(args.jobs)
+    
+    results = {}
+    try:
+        for name in args.scenarios:
+            logger.info('开始性能测试场景: %s', name)
+            results[name] = run_scenario(name, server, args)
+    finally:
+        server.stop()
+    
+    if args.json:
+        print(json.dumps({'params': params, 'results': results}, ensure_ascii=False, indent=2))
+    
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        baseline = load_baseline(args.baseline)
+        if baseline and baseline.get('params') != params:
+            print('注意: 本次测试参数与基准数据不同, 对比结果仅供参考')
+        regressions = compare(results, baseline or {}, args.tolerance)
+        
+        if args.save_baseline:
+            save_baseline(args.baseline, results, params)
+            return 0
+        if regressions:
+            print(f'\n性能退化: {", ".join(regressions)}')
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
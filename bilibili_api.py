@@ -1,13 +1,22 @@
 import requests
 import time
 import json
-import qrcode
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-from PIL import Image
-from logger import logger
+from logger import get_logger
+from config import DATA_DIR, QUALITY_IDS, API_BASE, PASSPORT_BASE
+from url_router import route_url, BVID_PATTERN, SPACE_PATTERN
+from tracing import tracer
+from metrics import api_requests, rate_limit_wait_seconds, retries, endpoint_of
+
+logger = get_logger('api')
 
 COOKIE_FILE = 'cookies.json'
+LOGIN_STATE_FILE = os.path.join(DATA_DIR, 'login_state.json')
+SPACE_CHECKPOINT_FILE = os.path.join(DATA_DIR, 'space_checkpoints.json')
+PLAYURL_FNVAL = 16 | 128 | 256 | 2048
 
 class BilibiliAPI:
     def __init__(self):
@@ -16,12 +25,18 @@ class BilibiliAPI:
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Referer': 'https://www.bilibili.com'
         })
+        self.api_base = API_BASE
+        self.passport_base = PASSPORT_BASE
         self.cookies = {}
         self.is_logged_in = False
+        self.user_name = None
         self.last_request_time = 0
         self.request_delay = 2.0
         self.max_retries = 5
-        self.load_cookies()
+        self.rate_limit_hits = 0
+        self._rate_lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+        self.load_cookies(verify=False)
     
     def save_cookies(self):
         try:
@@ -31,26 +46,64 @@ class BilibiliAPI:
         except Exception as e:
             logger.error(f'保存Cookies失败: {e}')
     
-    def load_cookies(self):
+    def load_cookies(self, verify=True):
         try:
             if os.path.exists(COOKIE_FILE):
                 with open(COOKIE_FILE, 'r', encoding='utf-8') as f:
                     self.cookies = json.load(f)
                     self.session.cookies.update(self.cookies)
                     logger.info('Cookies已加载')
-                    
-                    if self.verify_login():
-                        self.is_logged_in = True
-                        logger.info('自动登录成功')
-                        return True
+                
+                if not verify:
+                    state = self.load_login_state()
+                    self.is_logged_in = bool(state.get('logged_in'))
+                    self.user_name = state.get('user_name')
+                    return self.is_logged_in
+                
+                if self.check_login():
+                    logger.info('自动登录成功')
+                    return True
             return False
         except Exception as e:
             logger.error(f'加载Cookies失败: {e}')
             return False
     
+    def load_login_state(self):
+        try:
+            with open(LOGIN_STATE_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def save_login_state(self):
+        try:
+            os.makedirs(os.path.dirname(LOGIN_STATE_FILE), exist_ok=True)
+            with open(LOGIN_STATE_FILE, 'w', encoding='utf-8') as f:
+                json.dump({'logged_in': self.is_logged_in, 'user_name': self.user_name, 'checked_at': int(time.time())}, f, ensure_ascii=False)
+        except Exception as e:
+            logger.error('保存登录状态失败: %s', e)
+    
+    def check_login(self):
+        if not self.cookies:
+            self.is_logged_in = False
+            self.user_name = None
+            return False
+        
+        try:
+            response = self.session.get(f'{self.api_base}/x/space/myinfo', timeout=10)
+            data = response.json()
+        except Exception as e:
+            logger.warning('验证登录状态失败, 沿用上次的登录状态: %s', e)
+            return self.is_logged_in
+        
+        self.is_logged_in = data.get('code') == 0
+        self.user_name = (data.get('data') or {}).get('name') if self.is_logged_in else None
+        self.save_login_state()
+        return self.is_logged_in
+    
     def verify_login(self):
         try:
-            url = 'https://api.bilibili.com/x/space/myinfo'
+            url = f'{self.api_base}/x/space/myinfo'
             response = self.session.get(url)
             data = response.json()
             return data.get('code') == 0
@@ -64,35 +117,55 @@ class BilibiliAPI:
             self.cookies = {}
             self.session.cookies.clear()
             self.is_logged_in = False
+            self.user_name = None
+            self.save_login_state()
             logger.info('Cookies已清除')
         except Exception as e:
             logger.error(f'清除Cookies失败: {e}')
     
+    def _reserve_request_slot(self):
+        with self._rate_lock:
+            current_time = time.time()
+            next_slot = max(current_time, self.last_request_time + self.request_delay)
+            self.last_request_time = next_slot
+        
+        rate_limit_wait_seconds.observe(next_slot - current_time)
+        return next_slot - current_time
+    
+    def _wait_rate_limit(self):
+        wait = self._reserve_request_slot()
+        if wait > 0:
+            with tracer.span('sleep', 'api', reason='rate_limit'):
+                time.sleep(wait)
+    
     def _request_with_retry(self, url, max_retries=None):
         if max_retries is None:
             max_retries = self.max_retries
         
-        time.sleep(1)
+        with tracer.span('sleep', 'api', reason='fixed'):
+            time.sleep(1)
+        endpoint = endpoint_of(url)
         
         for attempt in range(max_retries):
             try:
-                current_time = time.time()
-                time_since_last = current_time - self.last_request_time
-                
-                if time_since_last < self.request_delay:
-                    time.sleep(self.request_delay - time_since_last)
+                self._wait_rate_limit()
                 
-                response = self.session.get(url)
-                self.last_request_time = time.time()
-                
-                data = response.json()
+                with tracer.span(endpoint, 'api', attempt=attempt + 1) as span:
+                    response = self.session.get(url)
+                    
+                    data = response.json()
+                    span.set(code=data.get('code'))
+                api_requests.inc(endpoint=endpoint, code=data.get('code'))
                 
                 if data.get('code') == -799:
+                    self.rate_limit_hits += 1
                     logger.warning(f'请求被限制，等待后重试 (尝试 {attempt + 1}/{max_retries})')
                     if attempt < max_retries - 1:
                         wait_time = (attempt + 1) * 3
                         logger.info(f'等待 {wait_time} 秒后重试...')
-                        time.sleep(wait_time)
+                        retries.inc(kind='api')
+                        with tracer.span('sleep', 'api', reason='backoff'):
+                            time.sleep(wait_time)
                         continue
                     else:
                         logger.error(f'达到最大重试次数，放弃请求')
@@ -100,34 +173,37 @@ class BilibiliAPI:
                 
                 return response
             except Exception as e:
+                api_requests.inc(endpoint=endpoint, code='error')
                 logger.error(f'请求异常 (尝试 {attempt + 1}/{max_retries}): {e}')
                 if attempt < max_retries -1:
-                    time.sleep((attempt + 1) * 3)
+                    retries.inc(kind='api')
+                    with tracer.span('sleep', 'api', reason='backoff'):
+                        time.sleep((attempt + 1) * 3)
                     continue
                 else:
                     return None
         return None
     
+    def _qrcode_image(self, qrcode_url):
+        import qrcode
+        
+        qr = qrcode.QRCode(version=1, box_size=10, border=2)
+        qr.add_data(qrcode_url)
+        qr.make(fit=True)
+        
+        img = qr.make_image(fill_color="black", back_color="white")
+        buffered = BytesIO()
+        img.save(buffered, format="PNG")
+        return buffered.getvalue()
+    
     def get_qrcode(self):
         try:
-            url = 'https://passport.bilibili.com/x/passport-login/web/qrcode/generate'
+            url = f'{self.passport_base}/x/passport-login/web/qrcode/generate'
             response = self.session.get(url)
             data = response.json()
             
             if data.get('code') == 0:
-                qrcode_key = data['data']['qrcode_key']
-                qrcode_url = data['data']['url']
-                
-                qr = qrcode.QRCode(version=1, box_size=10, border=2)
-                qr.add_data(qrcode_url)
-                qr.make(fit=True)
-                
-                img = qr.make_image(fill_color="black", back_color="white")
-                buffered = BytesIO()
-                img.save(buffered, format="PNG")
-                img_str = buffered.getvalue()
-                
-                return qrcode_key, img_str
+                return data['data']['qrcode_key'], self._qrcode_image(data['data']['url'])
             else:
                 logger.error(f'获取二维码失败: {data}')
                 return None, None
@@ -137,7 +213,7 @@ class BilibiliAPI:
     
     def check_qrcode_status(self, qrcode_key):
         try:
-            url = f'https://passport.bilibili.com/x/passport-login/web/qrcode/poll?qrcode_key={qrcode_key}'
+            url = f'{self.passport_base}/x/passport-login/web/qrcode/poll?qrcode_key={qrcode_key}'
             response = self.session.get(url)
             data = response.json()
             
@@ -170,7 +246,7 @@ class BilibiliAPI:
             return None
         
         try:
-            url = 'https://api.bilibili.com/x/space/myinfo'
+            url = f'{self.api_base}/x/space/myinfo'
             response = self.session.get(url)
             data = response.json()
             
@@ -183,12 +259,11 @@ class BilibiliAPI:
     
     def get_video_info(self, url):
         try:
-            bvid = self.extract_bvid(url)
-            if not bvid:
+            api_url = self._view_api_url(url)
+            if not api_url:
                 logger.error(f'无法提取BVID: {url}')
                 return None
             
-            api_url = f'https://api.bilibili.com/x/web-interface/view?bvid={bvid}'
             response = self._request_with_retry(api_url)
             
             if response is None:
@@ -197,25 +272,7 @@ class BilibiliAPI:
             data = response.json()
             
             if data.get('code') == 0:
-                video_data = data['data']
-                pages = video_data.get('pages', [])
-                
-                info = {
-                    'bvid': video_data.get('bvid'),
-                    'aid': video_data.get('aid'),
-                    'title': video_data.get('title'),
-                    'desc': video_data.get('desc'),
-                    'author': video_data['owner'].get('name'),
-                    'mid': video_data['owner'].get('mid'),
-                    'duration': self.format_duration(video_data.get('duration')),
-                    'pubdate': video_data.get('pubdate'),
-                    'pic': video_data.get('pic'),
-                    'cid': video_data.get('cid'),
-                    'pages': pages,
-                    'is_collection': False,
-                    'is_multi_page': len(pages) > 1
-                }
-                return info
+                return self._parse_view_data(data['data'])
             else:
                 logger.error(f'获取视频信息失败: {data}')
                 return None
@@ -223,31 +280,36 @@ class BilibiliAPI:
             logger.error(f'获取视频信息异常: {e}')
             return None
     
+    def _parse_view_data(self, video_data):
+        pages = video_data.get('pages', [])
+        
+        return {
+            'bvid': video_data.get('bvid'),
+            'aid': video_data.get('aid'),
+            'title': video_data.get('title'),
+            'desc': video_data.get('desc'),
+            'author': video_data['owner'].get('name'),
+            'mid': video_data['owner'].get('mid'),
+            'duration': self.format_duration(video_data.get('duration')),
+            'pubdate': video_data.get('pubdate'),
+            'pic': video_data.get('pic'),
+            'cid': video_data.get('cid'),
+            'pages': pages,
+            'is_collection': False,
+            'is_multi_page': len(pages) > 1
+        }
+    
     def get_collection_info(self, url):
         try:
-            if '/video/av' in url or '/video/BV' in url:
+            route = route_url(url)
+            if route is None or route.kind == 'video':
                 return None
             
-            import re
-            match = re.search(r'bilibili\.com/opus/(\d+)', url)
-            if match:
-                return self.get_opus_info(match.group(1))
+            if route.kind == 'opus':
+                return self.get_opus_info(route.id)
             
-            match = re.search(r'bilibili\.com/collection/(\d+)', url)
-            if match:
-                return self.get_series_info(match.group(1), 'collection')
-            
-            match = re.search(r'bilibili\.com/medialist/detail/ml(\d+)', url)
-            if match:
-                return self.get_series_info(match.group(1), 'medialist')
-            
-            match = re.search(r'bilibili\.com/series/(\d+)', url)
-            if match:
-                return self.get_series_info(match.group(1), 'series')
-            
-            match = re.search(r'bilibili\.com/list/(\d+)', url)
-            if match:
-                return self.get_series_info(match.group(1), 'list')
+            if route.kind in ('collection', 'medialist', 'series', 'list'):
+                return self.get_series_info(route.id, route.kind)
             
             return None
         except Exception as e:
@@ -256,8 +318,11 @@ class BilibiliAPI:
     
     def get_opus_info(self, oid):
         try:
-            api_url = f'https://api.bilibili.com/x/space/opus/detail?opus_id={oid}'
-            response = self.session.get(api_url)
+            api_url = f'{self.api_base}/x/space/opus/detail?opus_id={oid}'
+            response = self._request_with_retry(api_url)
+            if response is None:
+                return None
+            
             data = response.json()
             
             if data.get('code') == 0:
@@ -273,7 +338,9 @@ class BilibiliAPI:
                                             video = module['major']['archive']
                                             videos.append({
                                                 'bvid': video.get('bvid'),
+                                                'aid': video.get('aid'),
                                                 'title': video.get('title'),
+                                                'pic': video.get('cover'),
                                                 'duration': self.format_duration(video.get('duration_text', ''))
                                             })
                 
@@ -287,60 +354,110 @@ class BilibiliAPI:
             logger.error(f'获取动态合集信息异常: {e}')
             return None
     
+    def _series_api_url(self, sid, series_type):
+        if series_type == 'collection':
+            return f'{self.api_base}/x/polymer/space/seasons_archives_list?mid={sid}&sort_reverse=false&page_num=1&page_size=30'
+        elif series_type == 'medialist':
+            return f'{self.api_base}/x/polymer/web-space/medialist?mid={sid}&ps=30&pn=1'
+        else:
+            return f'{self.api_base}/x/series/series?series_id={sid}'
+    
+    def _parse_series_data(self, data, series_type):
+        if series_type == 'collection':
+            archives = data['data'].get('archives', [])
+            title = data['data'].get('meta', {}).get('name', '合集')
+        elif series_type == 'medialist':
+            archives = data['data'].get('list', {}).get('ves', [])
+            title = data['data'].get('list', {}).get('info', {}).get('title', '合集')
+        else:
+            archives = data['data'].get('archives', [])
+            title = data['data'].get('meta', {}).get('name', '合集')
+        
+        return {
+            'title': title,
+            'videos': [self._parse_listing_video(video) for video in archives],
+            'is_collection': True
+        }
+    
     def get_series_info(self, sid, series_type):
         try:
-            if series_type == 'collection':
-                api_url = f'https://api.bilibili.com/x/polymer/space/seasons_archives_list?mid={sid}&sort_reverse=false&page_num=1&page_size=30'
-            elif series_type == 'medialist':
-                api_url = f'https://api.bilibili.com/x/polymer/web-space/medialist?mid={sid}&ps=30&pn=1'
-            elif series_type == 'list':
-                api_url = f'https://api.bilibili.com/x/series/series?series_id={sid}'
-            else:
-                api_url = f'https://api.bilibili.com/x/series/series?series_id={sid}'
+            response = self._request_with_retry(self._series_api_url(sid, series_type))
+            if response is None:
+                return None
             
-            response = self.session.get(api_url)
             data = response.json()
             
             if data.get('code') == 0:
-                videos = []
-                if series_type == 'collection':
-                    archives = data['data'].get('archives', [])
-                    title = data['data'].get('meta', {}).get('name', '合集')
-                elif series_type == 'medialist':
-                    archives = data['data'].get('list', {}).get('ves', [])
-                    title = data['data'].get('list', {}).get('info', {}).get('title', '合集')
-                else:
-                    archives = data['data'].get('archives', [])
-                    title = data['data'].get('meta', {}).get('name', '合集')
-                
-                for video in archives:
-                    videos.append({
-                        'bvid': video.get('bvid'),
-                        'title': video.get('title'),
-                        'duration': self.format_duration(video.get('duration', ''))
-                    })
-                
-                return {
-                    'title': title,
-                    'videos': videos,
-                    'is_collection': True
-                }
+                return self._parse_series_data(data, series_type)
             return None
         except Exception as e:
             logger.error(f'获取系列信息异常: {e}')
             return None
     
+    def _parse_listing_video(self, video):
+        upper = video.get('upper') or video.get('owner') or {}
+        pages = [
+            {'cid': page.get('id') or page.get('cid'), 'page': page.get('page'), 'part': page.get('title') or page.get('part')}
+            for page in video.get('pages') or []
+        ]
+        page_count = video.get('page') if isinstance(video.get('page'), int) else len(pages) or None
+        cid = video.get('cid') or (pages[0]['cid'] if len(pages) == 1 else None)
+        
+        return {
+            'bvid': video.get('bvid'),
+            'aid': video.get('aid') or video.get('id'),
+            'cid': cid,
+            'title': video.get('title'),
+            'author': upper.get('name'),
+            'mid': upper.get('mid'),
+            'pic': video.get('pic') or video.get('cover'),
+            'pubdate': video.get('pubdate') or video.get('pubtime'),
+            'pages': pages,
+            'page_count': page_count,
+            'duration': self.format_duration(video.get('duration', ''))
+        }
+    
+    def build_listing_info(self, video):
+        return {
+            'bvid': video.get('bvid'),
+            'aid': video.get('aid'),
+            'title': video.get('title'),
+            'desc': '',
+            'author': video.get('author'),
+            'mid': video.get('mid'),
+            'duration': video.get('duration'),
+            'pubdate': video.get('pubdate'),
+            'pic': video.get('pic'),
+            'cid': video.get('cid'),
+            'pages': video.get('pages', []),
+            'page_count': video.get('page_count'),
+            'is_collection': False,
+            'is_multi_page': (video.get('page_count') or 0) > 1
+        }
+    
+    def ensure_video_details(self, info):
+        if info.get('cid'):
+            return info
+        
+        logger.info('补全视频信息: %s', info.get("bvid"))
+        details = self.get_video_info(f'https://www.bilibili.com/video/{info.get("bvid")}')
+        if not details:
+            return None
+        
+        for key, value in details.items():
+            if key in ('is_multi_page', 'title'):
+                continue
+            if not info.get(key):
+                info[key] = value
+        return info
+    
+    def _playurl_api_url(self, bvid, cid, quality):
+        qn = QUALITY_IDS.get(quality, QUALITY_IDS['1080P'])
+        return f'{self.api_base}/x/player/playurl?bvid={bvid}&cid={cid}&qn={qn}&fnval={PLAYURL_FNVAL}&fourk=1'
+    
     def get_video_streams(self, bvid, cid, quality='1080P'):
         try:
-            quality_map = {
-                '1080P': 80,
-                '720P': 64,
-                '480P': 32,
-                '360P': 16
-            }
-            
-            qn = quality_map.get(quality, 80)
-            api_url = f'https://api.bilibili.com/x/player/playurl?bvid={bvid}&cid={cid}&qn={qn}&fnval=16&fourk=1'
+            api_url = self._playurl_api_url(bvid, cid, quality)
             response = self._request_with_retry(api_url)
             
             if response is None:
@@ -358,12 +475,33 @@ class BilibiliAPI:
             return None
     
     def extract_bvid(self, url):
-        import re
-        match = re.search(r'BV[a-zA-Z0-9]+', url)
+        match = BVID_PATTERN.search(url)
         if match:
             return match.group(0)
         return None
     
+    def resolve_short_url(self, url):
+        try:
+            if not url.startswith('http'):
+                url = f'https://{url}'
+            response = self.session.head(url, allow_redirects=True, timeout=10)
+            return response.url
+        except Exception as e:
+            logger.error('解析短链接失败: %s, %s', url, e)
+            return None
+    
+    def _view_api_url(self, url):
+        route = route_url(url)
+        if route is not None and route.kind == 'short':
+            route = route_url(self.resolve_short_url(url) or '')
+        
+        if route is None or route.kind != 'video':
+            return None
+        
+        if route.id.startswith('av'):
+            return f'{self.api_base}/x/web-interface/view?aid={route.id[2:]}'
+        return f'{self.api_base}/x/web-interface/view?bvid={route.id}'
+    
     def format_duration(self, seconds):
         if isinstance(seconds, str):
             return seconds
@@ -377,84 +515,148 @@ class BilibiliAPI:
         else:
             return f'{minutes:02d}:{seconds:02d}'
     
+    def extract_mid(self, url):
+        match = SPACE_PATTERN.search(url)
+        if match:
+            return match.group(1)
+        return None
+    
+    def _parse_archive(self, video):
+        return {
+            'bvid': video.get('bvid'),
+            'aid': video.get('aid'),
+            'title': video.get('title'),
+            'desc': video.get('description'),
+            'author': video.get('author'),
+            'mid': video.get('mid'),
+            'duration': self.format_duration(video.get('length', 0)),
+            'pubdate': video.get('created'),
+            'pic': video.get('pic'),
+            'cid': None,
+            'pages': [],
+            'page_count': None,
+            'is_collection': False
+        }
+    
+    def _user_videos_api_url(self, mid, page, page_size=30):
+        return f'{self.api_base}/x/space/arc/search?mid={mid}&ps={page_size}&pn={page}&order=pubdate&order_avoided=true'
+    
+    def _parse_user_videos_data(self, data):
+        archives = data['data'].get('list', {}).get('vlist', [])
+        total = data['data'].get('page', {}).get('count', 0)
+        return [self._parse_archive(video) for video in archives], total
+    
+    def get_user_videos_page(self, mid, page, page_size=30):
+        response = self._request_with_retry(self._user_videos_api_url(mid, page, page_size))
+        
+        if response is None:
+            return None
+        
+        data = response.json()
+        
+        if data.get('code') != 0:
+            logger.error('获取用户视频列表失败: %s', data)
+            return None
+        
+        return self._parse_user_videos_data(data)
+    
+    def _load_space_checkpoints(self):
+        try:
+            if os.path.exists(SPACE_CHECKPOINT_FILE):
+                with open(SPACE_CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            logger.error('加载分页断点失败: %s', e)
+        return {}
+    
+    def _save_space_checkpoint(self, mid, checkpoint):
+        with self._checkpoint_lock:
+            checkpoints = self._load_space_checkpoints()
+            if checkpoint is None:
+                checkpoints.pop(str(mid), None)
+            else:
+                checkpoints[str(mid)] = checkpoint
+            try:
+                with open(SPACE_CHECKPOINT_FILE, 'w', encoding='utf-8') as f:
+                    json.dump(checkpoints, f, ensure_ascii=False, indent=2)
+            except Exception as e:
+                logger.error('保存分页断点失败: %s', e)
+    
+    def iter_user_videos(self, url, page_size=30, workers=4, resume=True, max_pages=None):
+        mid = self.extract_mid(url)
+        if not mid:
+            logger.error('无法提取用户ID: %s', url)
+            return
+        
+        start_page = 1
+        if resume:
+            checkpoint = self._load_space_checkpoints().get(str(mid))
+            if checkpoint:
+                start_page = checkpoint.get('next_page', 1)
+                logger.info('从断点继续获取用户视频列表: mid=%s, 第 %s 页', mid, start_page)
+        
+        result = self.get_user_videos_page(mid, start_page, page_size)
+        if result is None:
+            return
+        
+        videos, total = result
+        total_pages = (total + page_size - 1) // page_size
+        logger.info('用户 %s 共有 %s 个视频, %s 页', mid, total, total_pages)
+        last_page = total_pages if max_pages is None else min(total_pages, start_page + max_pages - 1)
+        
+        yield from videos
+        if resume:
+            self._save_space_checkpoint(mid, {'next_page': start_page + 1, 'total': total})
+        
+        if not videos or start_page >= last_page:
+            if resume and start_page >= total_pages:
+                self._save_space_checkpoint(mid, None)
+            return
+        
+        pages = range(start_page + 1, last_page + 1)
+        max_window = max(1, workers) * 2
+        window = 1
+        executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        try:
+            futures = {}
+            next_submit = iter(pages)
+            
+            for page in pages:
+                while len(futures) < window:
+                    submit_page = next(next_submit, None)
+                    if submit_page is None:
+                        break
+                    futures[submit_page] = executor.submit(self.get_user_videos_page, mid, submit_page, page_size)
+                
+                result = futures.pop(page).result()
+                if result is None:
+                    logger.error('获取用户视频列表中断: mid=%s, 第 %s 页', mid, page)
+                    return
+                
+                yield from result[0]
+                window = min(window * 2, max_window)
+                if resume:
+                    self._save_space_checkpoint(mid, {'next_page': page + 1, 'total': total})
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        if resume and last_page >= total_pages:
+            self._save_space_checkpoint(mid, None)
+    
     def get_user_videos(self, url, page_num=None):
         try:
-            import re
-            match = re.search(r'space\.bilibili\.com/(\d+)', url)
-            if not match:
+            mid = self.extract_mid(url)
+            if not mid:
                 logger.error(f'无法提取用户ID: {url}')
                 return None
             
-            mid = match.group(1)
-            videos = []
-            page_size = 30
-            
             if page_num is None:
-                page = 1
-                while True:
-                    api_url = f'https://api.bilibili.com/x/space/arc/search?mid={mid}&ps={page_size}&pn={page}&order=pubdate&order_avoided=true'
-                    response = self._request_with_retry(api_url)
-                    
-                    if response is None:
-                        break
-                    
-                    data = response.json()
-                    
-                    if data.get('code') == 0:
-                        archives = data['data'].get('list', {}).get('vlist', [])
-                        if not archives:
-                            break
-                        
-                        for video in archives:
-                            videos.append({
-                                'bvid': video.get('bvid'),
-                                'aid': video.get('aid'),
-                                'title': video.get('title'),
-                                'desc': video.get('description'),
-                                'author': video.get('author'),
-                                'mid': video.get('mid'),
-                                'duration': self.format_duration(video.get('length', 0)),
-                                'pubdate': video.get('created'),
-                                'pic': video.get('pic'),
-                                'cid': video.get('aid'),
-                                'pages': [{'cid': video.get('aid'), 'page': 1}],
-                                'is_collection': False
-                            })
-                        
-                        page += 1
-                    else:
-                        logger.error(f'获取用户视频列表失败: {data}')
-                        break
+                videos = list(self.iter_user_videos(url, resume=False))
             else:
-                api_url = f'https://api.bilibili.com/x/space/arc/search?mid={mid}&ps={page_size}&pn={page_num}&order=pubdate&order_avoided=true'
-                response = self._request_with_retry(api_url)
-                
-                if response is None:
-                    return None
-                
-                data = response.json()
-                
-                if data.get('code') == 0:
-                    archives = data['data'].get('list', {}).get('vlist', [])
-                    
-                    for video in archives:
-                        videos.append({
-                            'bvid': video.get('bvid'),
-                            'aid': video.get('aid'),
-                            'title': video.get('title'),
-                            'desc': video.get('description'),
-                            'author': video.get('author'),
-                            'mid': video.get('mid'),
-                            'duration': self.format_duration(video.get('length', 0)),
-                            'pubdate': video.get('created'),
-                            'pic': video.get('pic'),
-                            'cid': video.get('aid'),
-                            'pages': [{'cid': video.get('aid'), 'page': 1}],
-                            'is_collection': False
-                        })
-                else:
-                    logger.error(f'获取用户视频列表失败: {data}')
+                result = self.get_user_videos_page(mid, page_num)
+                if result is None:
                     return None
+                videos = result[0]
             
             logger.info(f'获取到 {len(videos)} 个视频')
             return videos
@@ -466,6 +668,8 @@ class BilibiliAPI:
         self.cookies = {}
         self.session = requests.Session()
         self.is_logged_in = False
+        self.user_name = None
+        self.save_login_state()
         logger.info('已退出登录')
 
 api = BilibiliAPI()
@@ -0,0 +1,197 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from config import VIDEO_FORMATS, AUDIO_FORMATS, QUALITY_OPTIONS
+from settings_manager import settings
+from logger import logger
+from bilibili_api import api
+from link_ingest import LinkIngester, iter_link_file
+from download_manager import DownloadTask, download_manager, check_ffmpeg
+from metrics import start_metrics_server
+from tracing import tracer
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_NO_FFMPEG = 3
+EXIT_INTERRUPTED = 130
+
+FINISHED_STATUSES = ('completed', 'skipped', 'error')
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='B站视频批量下载 (命令行模式)')
+    parser.add_argument('urls', nargs='*', help='视频、合集或UP主空间链接')
+    parser.add_argument('-i', '--input', action='append', default=[], help='链接文件, 每行一个链接, 可重复指定')
+    parser.add_argument('-o', '--output', default=settings.get('default_download_path'), help='保存路径')
+    parser.add_argument('-q', '--quality', default=settings.get('default_quality', '1080P'), choices=QUALITY_OPTIONS, help='清晰度')
+    parser.add_argument('-f', '--format', default=settings.get('default_video_format', 'mp4'), choices=VIDEO_FORMATS + AUDIO_FORMATS, help='输出格式')
+    parser.add_argument('--no-cover', action='store_true', help='不下载封面')
+    parser.add_argument('-r', '--retries', type=int, default=3, help='重试次数')
+    parser.add_argument('-j', '--jobs', type=int, default=settings.get('max_concurrent_downloads', 5), help='最大同时下载数')
+    parser.add_argument('--force', action='store_true', help='忽略已存在的文件, 重新下载')
+    parser.add_argument('--json', action='store_true', help='以JSON行输出进度事件')
+    parser.add_argument('--metrics-port', type=int, default=settings.get('metrics_port'), help='在该端口提供Prometheus监控指标')
+    parser.add_argument('--trace', default=settings.get('trace_file'), help='将性能追踪 (Chrome trace格式) 保存到该文件')
+    parser.add_argument('-v', '--verbose', action='store_true', help='在终端显示详细日志')
+    return parser.parse_args(argv)
+
+class ProgressPrinter:
+    def __init__(self, as_json=False, stream=sys.stdout, interval=1.0):
+        self.as_json = as_json
+        self.stream = stream
+        self.interval = interval
+        self.interactive = stream.isatty() and not as_json
+        self._reported = {}
+        self._last_line = 0
+    
+    def _emit(self, event):
+        self.stream.write(json.dumps(event, ensure_ascii=False) + '\n')
+        self.stream.flush()
+    
+    def _clear_line(self):
+        if self.interactive:
+            self.stream.write('\r\033[K')
+    
+    def task_event(self, task):
+        if self.as_json:
+            self._emit({
+                'event': 'task',
+                'task_id': task.task_id,
+                'bvid': task.bvid,
+                'title': task.title,
+                'status': task.status,
+                'progress': round(task.progress, 1),
+                'downloaded': task.downloaded_size,
+                'total': task.total_size,
+                'speed': int(task.speed),
+                'output_file': task.output_file,
+                'error': task.error
+            })
+            return
+        
+        if task.status not in FINISHED_STATUSES:
+            return
+        mark = {'completed': 'OK', 'skipped': 'SKIP', 'error': 'FAIL'}[task.status]
+        line = f'[{mark}] {task.title}'
+        if task.error:
+            line += f' ({task.error})'
+        self._clear_line()
+        self.stream.write(line + '\n')
+        self.stream.flush()
+    
+    def update(self, tasks, force=False):
+        for task in tasks:
+            state = (task.status, int(task.progress)) if self.as_json else task.status
+            if self._reported.get(task.task_id) != state:
+                self._reported[task.task_id] = state
+                self.task_event(task)
+        
+        now = time.time()
+        if not force and now - self._last_line < self.interval:
+            return
+        self._last_line = now
+        
+        counts = count_statuses(tasks)
+        speed = sum(task.speed for task in tasks if task.status == 'downloading')
+        if self.as_json:
+            self._emit({'event': 'progress', 'tasks': len(tasks), 'speed': int(speed), **counts})
+        elif self.interactive:
+            self.stream.write(
+                f'\r\033[K{counts["completed"] + counts["skipped"]}/{len(tasks)} 完成, '
+                f'{counts["error"]} 失败, {counts["downloading"]} 下载中, {speed / 1048576:.2f} MB/s'
+            )
+            self.stream.flush()
+    
+    def summary(self, tasks, exit_code):
+        counts = count_statuses(tasks)
+        if self.as_json:
+            self._emit({'event': 'summary', 'tasks': len(tasks), 'exit_code': exit_code, **counts})
+            return
+        self._clear_line()
+        self.stream.write(
+            f'共 {len(tasks)} 个任务: 完成 {counts["completed"]}, 跳过 {counts["skipped"]}, 失败 {counts["error"]}\n'
+        )
+        self.stream.flush()
+
+def count_statuses(tasks):
+    counts = {'completed': 0, 'skipped': 0, 'error': 0, 'downloading': 0, 'pending': 0}
+    for task in tasks:
+        counts[task.status] = counts.get(task.status, 0) + 1
+    return counts
+
+def iter_lines(args):
+    yield from args.urls
+    for file_path in args.input:
+        yield from iter_link_file(file_path)
+
+def run(args):
+    if not args.verbose:
+        logger.set_console_level(logging.WARNING)
+    
+    if not args.urls and not args.input:
+        sys.stderr.write('请提供视频链接或链接文件\n')
+        return EXIT_USAGE
+    
+    if not check_ffmpeg():
+        sys.stderr.write('FFmpeg未安装，无法进行视频合并和音频提取。请先安装FFmpeg。\n')
+        return EXIT_NO_FFMPEG
+    
+    os.makedirs(args.output, exist_ok=True)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port, settings.get('metrics_host', '127.0.0.1'))
+    api.max_retries = args.retries
+    download_manager.set_max_concurrent(args.jobs)
+    audio_only = args.format in AUDIO_FORMATS
+    download_cover = not args.no_cover and not audio_only and settings.get('download_cover', True)
+    
+    printer = ProgressPrinter(args.json)
+    tasks = []
+    ingester = LinkIngester()
+    for batch in ingester.iter_batches(iter_lines(args)):
+        for video_info in batch:
+            task = DownloadTask(
+                video_info,
+                args.output,
+                args.quality,
+                args.format,
+                download_cover,
+                max_retries=args.retries,
+                skip_exists_check=args.force
+            )
+            tasks.append(task)
+            download_manager.add_task(task)
+        printer.update(tasks)
+    
+    if not tasks:
+        sys.stderr.write('没有可下载的视频\n')
+        return EXIT_USAGE
+    
+    while any(task.status not in FINISHED_STATUSES for task in tasks):
+        printer.update(tasks)
+        time.sleep(0.2)
+    
+    printer.update(tasks, force=True)
+    exit_code = EXIT_FAILED if any(task.status == 'error' for task in tasks) else EXIT_OK
+    printer.summary(tasks, exit_code)
+    return exit_code
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace:
+        tracer.enable()
+    try:
+        return run(args)
+    except KeyboardInterrupt:
+        for task in list(download_manager.active_tasks):
+            task.stop()
+        sys.stderr.write('\n已中断\n')
+        return EXIT_INTERRUPTED
+    finally:
+        if args.trace:
+            tracer.export(args.trace)
+
+if __name__ == '__main__':
+    sys.exit(main())
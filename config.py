@@ -2,9 +2,9 @@ import os
 import sys
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, 'data')
-LOGS_DIR = os.path.join(BASE_DIR, 'logs')
-CONFIG_DIR = os.path.join(BASE_DIR, 'config')
+DATA_DIR = os.environ.get('BILI_DATA_DIR') or os.path.join(BASE_DIR, 'data')
+LOGS_DIR = os.environ.get('BILI_LOGS_DIR') or os.path.join(BASE_DIR, 'logs')
+CONFIG_DIR = os.environ.get('BILI_CONFIG_DIR') or os.path.join(BASE_DIR, 'config')
 
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(LOGS_DIR, exist_ok=True)
@@ -12,5 +12,11 @@ os.makedirs(CONFIG_DIR, exist_ok=True)
 
 VIDEO_FORMATS = ['mp4', 'avi', 'flv']
 AUDIO_FORMATS = ['mp3', 'aac', 'flac']
-QUALITY_OPTIONS = ['1080P', '720P', '480P', '360P']
+QUALITY_OPTIONS = ['4K', '1080P60', '1080P+', '1080P', '720P', '480P', '360P']
+QUALITY_IDS = {'4K': 120, '1080P60': 116, '1080P+': 112, '1080P': 80, '720P': 64, '480P': 32, '360P': 16}
+QUALITY_BITRATES = {'4K': 12000000, '1080P60': 5000000, '1080P+': 4500000, '1080P': 3200000, '720P': 1600000, '480P': 900000, '360P': 600000}
+VIDEO_CODECS = {'avc': 7, 'hevc': 12, 'av1': 13}
+AUDIO_OUTPUT_BITRATE = 192000
 MAX_CONCURRENT_DOWNLOADS = 5
+API_BASE = os.environ.get('BILI_API_BASE') or 'https://api.bilibili.com'
+PASSPORT_BASE = os.environ.get('BILI_PASSPORT_BASE') or 'https://passport.bilibili.com'
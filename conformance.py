@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+
+WORK_DIR = tempfile.mkdtemp(prefix='bili-conformance-')
+os.environ.setdefault('BILI_DATA_DIR', os.path.join(WORK_DIR, 'data'))
+os.environ.setdefault('BILI_CONFIG_DIR', os.path.join(WORK_DIR, 'config'))
+os.environ.setdefault('BILI_LOGS_DIR', os.path.join(WORK_DIR, 'logs'))
+
+from config import BASE_DIR, QUALITY_BITRATES
+from logger import logger
+from bilibili_api import api
+from download_manager import DownloadTask, download_manager, check_ffmpeg
+from standin_server import StandInServer, AUDIO_BITRATE
+from distributed import Coordinator, Worker
+
+FINISHED_STATUSES = ('completed', 'skipped', 'error')
+SCENARIOS = {
+    'reset': {'description': '随机位置连接重置', 'reset_ratio': 0.3},
+    'ignore_range': {'description': '服务器忽略Range请求头', 'reset_ratio': 0.3, 'ignore_range_ratio': 0.5},
+    'truncate': {'description': '响应体被截断', 'truncate_ratio': 0.5},
+    'expiry': {'description': '下载地址过期', 'reset_ratio': 0.5, 'url_ttl': 1},
+    'kill_download': {'description': '下载过程中强制结束进程', 'kill': 'download'},
+    'kill_merge': {'description': '合并过程中强制结束进程', 'kill': 'merge'},
+    'distributed': {'description': '分布式下载时强制结束一个下载节点', 'reset_ratio': 0.1, 'kill': 'worker'}
+}
+CHAOS_OPTIONS = ('reset_ratio', 'truncate_ratio', 'ignore_range_ratio', 'url_ttl')
+DISTRIBUTED_LEASE_SECONDS = 3
+DISTRIBUTED_HEARTBEAT_SECONDS = 1
+SLOW_FFMPEG = '''#!/bin/sh
+for last in "$@"; do :; done
+case "$*" in *-version*) exec "{ffmpeg}" "$@";; esac
+head -c 65536 /dev/urandom > "$last"
+sleep {delay}
+exec "{ffmpeg}" "$@"
+'''
+
+def sources_of(server, video, quality):
+    bitrate = QUALITY_BITRATES[quality]
+    return server.media_file('video', bitrate, video['duration']), server.media_file('audio', AUDIO_BITRATE, video['duration'])
+
+def reference_output(server, video, quality):
+    path = os.path.join(WORK_DIR, 'reference', f'{video["bvid"]}.mp4')
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        video_file, audio_file = sources_of(server, video, quality)
+        task = DownloadTask({'bvid': video['bvid'], 'title': video['title']}, WORK_DIR, quality, 'mp4', False)
+        task._merge_video_audio(video_file, audio_file, path)
+    return path
+
+def same_file(first, second):
+    if not os.path.exists(first) or os.path.getsize(first) != os.path.getsize(second):
+        return False
+    with open(first, 'rb') as a, open(second, 'rb') as b:
+        while True:
+            chunk = a.read(1048576)
+            if chunk != b.read(1048576):
+                return False
+            if not chunk:
+                return True
+
+def run_in_process(videos, output_path, args):
+    tasks = []
+    for video in videos:
+        info = {'bvid': video['bvid'], 'cid': video['cid'], 'aid': video['aid'], 'title': video['title'], 'duration': video['duration']}
+        task = DownloadTask(info, output_path, args.quality, 'mp4', False, max_retries=args.retries, skip_exists_check=True)
+        tasks.append(task)
+        download_manager.add_task(task)
+    
+    deadline = time.time() + args.timeout
+    while any(task.status not in FINISHED_STATUSES for task in tasks):
+        if time.time() > deadline:
+            for task in tasks:
+                if task.status not in FINISHED_STATUSES:
+                    task.stop()
+            break
+        time.sleep(0.1)
+    return [task.error for task in tasks if task.status != 'completed']
+
+def install_slow_ffmpeg(delay):
+    bin_dir = os.path.join(WORK_DIR, 'bin')
+    os.makedirs(bin_dir, exist_ok=True)
+    path = os.path.join(bin_dir, 'ffmpeg')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(SLOW_FFMPEG.format(ffmpeg=shutil.which('ffmpeg'), delay=delay))
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return bin_dir
+
+def is_temporary(name):
+    return '.part.' in name or name.endswith('.tmp')
+
+def merging(output_path):
+    return any(name.endswith('.part.mp4') for name in os.listdir(output_path))
+
+def run_cli(server, links, output_path, args, kill, generator):
+    env = dict(os.environ, BILI_API_BASE=server.url, BILI_PASSPORT_BASE=server.url, BILI_DATA_DIR=os.path.join(WORK_DIR, 'cli-data'))
+    if kill == 'merge':
+        env['PATH'] = install_slow_ffmpeg(args.merge_delay) + os.pathsep + env.get('PATH', '')
+    cmd = [sys.executable, os.path.join(BASE_DIR, 'cli.py'), '-o', output_path, '-q', args.quality, '--no-cover', '-r', str(args.retries)] + links
+    
+    kills = 0
+    errors = []
+    deadline = time.time() + args.timeout
+    while time.time() < deadline:
+        process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, start_new_session=True)
+        if kills < args.kills:
+            kill_at = time.time() + generator.uniform(0.2, args.kill_window)
+            while process.poll() is None and time.time() < deadline:
+                if kill == 'download' and time.time() >= kill_at or kill == 'merge' and merging(output_path):
+                    os.killpg(process.pid, signal.SIGKILL)
+                    kills += 1
+                    break
+                time.sleep(0.02)
+        try:
+            _, stderr = process.communicate(timeout=max(deadline - time.time(), 1))
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+            errors.append('超时')
+            break
+        if process.returncode == 0:
+            return kills, errors
+        if process.returncode != -signal.SIGKILL:
+            errors.append(stderr.decode('utf-8', 'ignore').strip() or f'退出码 {process.returncode}')
+            return kills, errors
+    return kills, errors or ['超时']
+
+def run_distributed(server, videos, output_path, args, generator):
+    coordinator = Coordinator(port=0, output_path=output_path, lease_seconds=DISTRIBUTED_LEASE_SECONDS)
+    threading.Thread(target=coordinator.serve_forever, daemon=True).start()
+    url = f'http://{coordinator.address[0]}:{coordinator.address[1]}'
+    jobs = []
+    for video in videos:
+        info = {'bvid': video['bvid'], 'cid': video['cid'], 'aid': video['aid'], 'title': video['title'], 'duration': video['duration']}
+        jobs.append(coordinator.add_spec({
+            'video_info': info,
+            'quality': args.quality,
+            'format_type': 'mp4',
+            'download_cover': False,
+            'max_retries': args.retries,
+            'skip_exists_check': True
+        }))
+    
+    env = dict(os.environ, BILI_API_BASE=server.url, BILI_PASSPORT_BASE=server.url, BILI_DATA_DIR=os.path.join(WORK_DIR, 'worker-data'))
+    cmd = [sys.executable, os.path.join(BASE_DIR, 'distributed.py'), 'worker', url, '--slots', '2', '--id', 'killed', '--heartbeat', str(DISTRIBUTED_HEARTBEAT_SECONDS)]
+    process = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    workers = []
+    kills = 0
+    errors = []
+    deadline = time.time() + args.timeout
+    try:
+        kill_at = time.time() + generator.uniform(0.2, args.kill_window)
+        while process.poll() is None and time.time() < deadline:
+            if time.time() >= kill_at and any(job.worker == 'killed' for job in jobs):
+                os.killpg(process.pid, signal.SIGKILL)
+                kills += 1
+                break
+            time.sleep(0.02)
+        process.wait()
+        
+        for index in range(args.workers):
+            worker = Worker(url, slots=1, worker_id=f'worker-{index + 1}', heartbeat_interval=DISTRIBUTED_HEARTBEAT_SECONDS)
+            threading.Thread(target=worker.run, daemon=True).start()
+            workers.append(worker)
+        
+        while any(job.status not in FINISHED_STATUSES for job in jobs):
+            if time.time() > deadline:
+                errors.append('超时')
+                break
+            time.sleep(0.1)
+    finally:
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+        for worker in workers:
+            worker.stop()
+            worker.manager.shutdown()
+        coordinator.shutdown()
+    errors.extend(f'{job.to_dict()["title"]}: {job.error}' for job in jobs if job.status == 'error')
+    return kills, errors
+
+def run_scenario(name, server, args, generator):
+    scenario = SCENARIOS[name]
+    for option in CHAOS_OPTIONS:
+        setattr(server, option, scenario.get(option, 0))
+    videos = [server.add_video(f'{name} {index + 1}', duration=args.duration) for index in range(args.videos)]
+    output_path = os.path.join(WORK_DIR, 'output', name)
+    os.makedirs(output_path, exist_ok=True)
+    ideal = 0
+    for video in videos:
+        ideal += sum(os.path.getsize(path) for path in sources_of(server, video, args.quality))
+        reference_output(server, video, args.quality)
+    
+    server.reset_stats()
+    started = time.time()
+    kills = 0
+    if scenario.get('kill') == 'worker':
+        kills, errors = run_distributed(server, videos, output_path, args, generator)
+    elif scenario.get('kill'):
+        kills, errors = run_cli(server, [server.video_url(video) for video in videos], output_path, args, scenario['kill'], generator)
+    else:
+        errors = run_in_process(videos, output_path, args)
+    elapsed = time.time() - started
+    
+    stats = server.get_stats()
+    mismatched = []
+    for video in videos:
+        output = os.path.join(output_path, f'{video["title"]}.mp4')
+        if not same_file(output, reference_output(server, video, args.quality)):
+            mismatched.append(video['bvid'])
+    leftovers = [name for name in os.listdir(output_path) if is_temporary(name)]
+    return {
+        'videos': len(videos),
+        'seconds': round(elapsed, 2),
+        'errors': errors,
+        'mismatched': mismatched,
+        'leftovers': leftovers,
+        'kills': kills,
+        'faults': {key: stats.get(key, 0) for key in ('resets', 'truncations', 'ignored_ranges', 'cdn_expired') if stats.get(key)},
+        'ideal_bytes': ideal,
+        'cdn_bytes': stats.get('cdn_bytes', 0),
+        'wasted_bytes': stats.get('cdn_bytes', 0) - ideal
+    }
+
+def report(name, result):
+    passed = not result['errors'] and not result['mismatched'] and not result['leftovers']
+    print(f'\n[{"PASS" if passed else "FAIL"}] {name}: {SCENARIOS[name]["description"]}, {result["videos"]} 个视频, 耗时 {result["seconds"]}s')
+    faults = ', '.join(f'{key} {value}' for key, value in result['faults'].items())
+    if result['kills']:
+        faults = ', '.join(filter(None, [faults, f'kills {result["kills"]}']))
+    print(f'  注入故障: {faults or "无"}')
+    wasted_ratio = result['wasted_bytes'] / result['ideal_bytes'] if result['ideal_bytes'] else 0
+    print(f'  传输 {result["cdn_bytes"] / 1048576:.2f} MB, 其中重复下载 {result["wasted_bytes"] / 1048576:.2f} MB ({wasted_ratio:.1%})')
+    for error in result['errors']:
+        print(f'  错误: {error}')
+    if result['mismatched']:
+        print(f'  输出文件与源数据不一致: {", ".join(result["mismatched"])}')
+    if result['leftovers']:
+        print(f'  残留的临时文件: {", ".join(result["leftovers"])}')
+    return passed
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='断点续传和文件完整性测试 (使用本地模拟服务)')
+    parser.add_argument('scenarios', nargs='*', help=f'要运行的场景: {", ".join(SCENARIOS)}, 默认全部')
+    parser.add_argument('-n', '--videos', type=int, default=3, help='每个场景的视频数量')
+    parser.add_argument('-q', '--quality', default='720P', help='清晰度')
+    parser.add_argument('--duration', type=int, default=20, help='每个视频的时长 (秒)')
+    parser.add_argument('--throttle', type=float, default=4.0, help='每个CDN连接的限速 (MB/s), 0 表示不限速')
+    parser.add_argument('-r', '--retries', type=int, default=8, help='重试次数')
+    parser.add_argument('--kills', type=int, default=3, help='强制结束进程的次数')
+    parser.add_argument('--workers', type=int, default=2, help='分布式场景中存活的下载节点数量')
+    parser.add_argument('--kill-window', type=float, default=3.0, help='启动后在该时间内随机结束进程 (秒)')
+    parser.add_argument('--merge-delay', type=float, default=2.0, help='合并前的等待时间, 用于在合并过程中结束进程 (秒)')
+    parser.add_argument('--seed', type=int, default=1, help='随机种子')
+    parser.add_argument('--timeout', type=float, default=600, help='每个场景的超时时间 (秒)')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f'未知的场景: {", ".join(unknown)}')
+    args.scenarios = args.scenarios or list(SCENARIOS)
+    if os.name == 'nt':
+        skipped = [name for name in args.scenarios if SCENARIOS[name].get('kill')]
+        if skipped:
+            sys.stderr.write(f'Windows下不支持的场景, 已跳过: {", ".join(skipped)}\n')
+        args.scenarios = [name for name in args.scenarios if not SCENARIOS[name].get('kill')]
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not check_ffmpeg():
+        sys.stderr.write('FFmpeg未安装，无法进行完整性测试。请先安装FFmpeg。\n')
+        return 3
+    
+    server = StandInServer(
+        throttle=int(args.throttle * 1048576),
+        backup_hosts=1,
+        media_dir=os.path.join(WORK_DIR, 'media'),
+        seed=args.seed
+    ).start()
+    api.api_base = server.url
+    api.passport_base = server.url
+    api.request_delay = 0
+    
+    generator = random.Random(args.seed)
+    results = {}
+    try:
+        for name in args.scenarios:
+            logger.info('开始完整性测试场景: %s', name)
+            results[name] = run_scenario(name, server, args, generator)
+    finally:
+        server.stop()
+    
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        failed = [name for name, result in results.items() if not report(name, result)]
+        if failed:
+            print(f'\n未通过的场景: {", ".join(failed)}')
+            return 1
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
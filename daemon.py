@@ -0,0 +1,384 @@
+import argparse
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from settings_manager import settings
+from logger import get_logger
+from bilibili_api import api
+from link_ingest import LinkIngester
+from download_manager import DownloadTask, download_manager
+from space_sync import space_sync
+from single_instance import InstanceServer, forward_urls, INSTANCE_PORT
+from metrics import metrics, start_metrics_server, CONTENT_TYPE
+from tracing import tracer
+
+logger = get_logger('service')
+
+DAEMON_HOST = '127.0.0.1'
+DAEMON_PORT = 8765
+LOOPBACK_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+def confine_output_path(output, root):
+    root = os.path.realpath(root)
+    if not output:
+        return root
+    path = os.path.realpath(os.path.join(root, output))
+    if os.path.commonpath([path, root]) != root:
+        raise ValueError(f'保存路径必须位于下载目录内: {root}')
+    return path
+
+class EventBroadcaster:
+    def __init__(self, manager, interval=1.0, queue_size=1000):
+        self.manager = manager
+        self.interval = interval
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._last_progress = {}
+        self._running = False
+        self._thread = None
+    
+    def start(self):
+        self.manager.add_listener(self._on_task_event)
+        self._running = True
+        self._thread = threading.Thread(target=self._progress_loop, daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._running = False
+        self.manager.remove_listener(self._on_task_event)
+    
+    def subscribe(self):
+        subscriber = queue.Queue(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+    
+    def is_subscribed(self, subscriber):
+        with self._lock:
+            return subscriber in self._subscribers
+    
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait((event, data))
+            except queue.Full:
+                logger.warning('事件订阅者处理过慢, 已断开')
+                self.unsubscribe(subscriber)
+    
+    def _on_task_event(self, event, task):
+        self.publish(event, self.manager.get_task_status(task))
+    
+    def _progress_loop(self):
+        while self._running:
+            time.sleep(self.interval)
+            active_tasks = self.manager.get_active_tasks()
+            
+            progress = {}
+            for task in active_tasks:
+                state = (task.status, task.downloaded_size)
+                progress[task.task_id] = state
+                if self._last_progress.get(task.task_id) != state:
+                    self.publish('progress', self.manager.get_task_status(task))
+            self._last_progress = progress
+            self.publish('metrics', self.manager.get_metrics())
+
+class DownloadDaemon:
+    def __init__(self, manager=download_manager, host=DAEMON_HOST, port=DAEMON_PORT, token=None):
+        self.manager = manager
+        self.token = token
+        self.events = EventBroadcaster(manager)
+        self.server = ThreadingHTTPServer((host, port), DaemonRequestHandler)
+        self.server.daemon_threads = True
+        self.server.app = self
+    
+    @property
+    def address(self):
+        return self.server.server_address
+    
+    def serve_forever(self):
+        self.events.start()
+        self.manager.start()
+        logger.info('下载服务已启动: http://%s:%s', self.address[0], self.address[1])
+        try:
+            self.server.serve_forever()
+        finally:
+            self.events.stop()
+    
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def restore_tasks(self):
+        tasks = self.manager.restore_tasks()
+        for task in tasks:
+            self.manager.add_task(task)
+        return tasks
+    
+    def enqueue(self, payload):
+        urls = payload.get('urls') or []
+        if isinstance(urls, str):
+            urls = [urls]
+        if not urls:
+            raise ValueError('缺少 urls')
+        
+        options = {
+            'output_path': confine_output_path(payload.get('output'), settings.get('default_download_path')),
+            'quality': payload.get('quality') or settings.get('default_quality', '1080P'),
+            'format_type': payload.get('format') or settings.get('default_video_format', 'mp4'),
+            'download_cover': payload.get('cover', settings.get('download_cover', True)),
+            'max_retries': int(payload.get('retries', 3)),
+            'skip_exists_check': bool(payload.get('force', False))
+        }
+        priority = payload.get('priority')
+        thread = threading.Thread(target=self._ingest, args=(urls, options, priority), daemon=True)
+        thread.start()
+        return {'accepted': len(urls)}
+    
+    def _ingest(self, urls, options, priority):
+        ingester = LinkIngester()
+        try:
+            for batch in ingester.iter_batches(urls):
+                for video_info in batch:
+                    task = DownloadTask(
+                        video_info,
+                        options['output_path'],
+                        options['quality'],
+                        options['format_type'],
+                        options['download_cover'],
+                        max_retries=options['max_retries'],
+                        skip_exists_check=options['skip_exists_check']
+                    )
+                    self.manager.add_task(task, priority)
+        except Exception as e:
+            logger.error('导入链接失败: %s', e)
+        self.events.publish('ingested', ingester.stats)
+    
+    def task_action(self, task_id, action, payload):
+        task = self.manager.get_task(task_id)
+        if task is None:
+            return None
+        
+        if action == 'pause':
+            self.manager.pause_task(task)
+        elif action == 'resume':
+            self.manager.resume_task(task)
+        elif action == 'stop':
+            self.manager.stop_task(task)
+        elif action == 'retry':
+            if task.status != 'error':
+                raise ValueError('只能重新下载失败的任务')
+            task.progress = 0
+            task.downloaded_size = 0
+            task.speed = 0
+            task.eta = 0
+            task.error = None
+            self.manager.add_task(task)
+        elif action == 'priority':
+            if 'priority' not in payload:
+                raise ValueError('缺少 priority')
+            self.manager.reprioritize(task, int(payload['priority']))
+        else:
+            raise KeyError(action)
+        return self.manager.get_task_status(task)
+
+class JsonRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    @property
+    def app(self):
+        return self.server.app
+    
+    def log_message(self, format, *args):
+        logger.debug('%s ' + format, self.address_string(), *args)
+    
+    def _authorized(self, query):
+        token = self.app.token
+        if not token:
+            return True
+        header = self.headers.get('Authorization', '')
+        return header == f'Bearer {token}' or query.get('token', [None])[0] == token
+    
+    def _trusted_post(self):
+        content_type = self.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type != 'application/json':
+            return False
+        origin = self.headers.get('Origin')
+        return origin is None or origin == 'null' or urlparse(origin).hostname in LOOPBACK_HOSTS
+    
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _send_text(self, status, text, content_type):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if not length:
+            return {}
+        payload = json.loads(self.rfile.read(length).decode('utf-8'))
+        if not isinstance(payload, dict):
+            raise ValueError('请求体必须是JSON对象')
+        return payload
+    
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split('/') if part]
+        
+        if not self._authorized(query):
+            self._send_json(401, {'error': 'unauthorized'})
+            return
+        if method == 'POST' and not self._trusted_post():
+            self.close_connection = True
+            self._send_json(403, {'error': 'forbidden'})
+            return
+        
+        try:
+            self.route(method, parts, query)
+        except KeyError:
+            self._send_json(404, {'error': 'not found'})
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            logger.error('处理请求失败: %s, %s', self.path, e)
+            self._send_json(500, {'error': str(e)})
+    
+    def route(self, method, parts, query):
+        raise KeyError(self.path)
+    
+    def do_GET(self):
+        self._dispatch('GET')
+    
+    def do_POST(self):
+        self._dispatch('POST')
+
+class DaemonRequestHandler(JsonRequestHandler):
+    def route(self, method, parts, query):
+        if method == 'GET' and parts == ['events']:
+            self._stream_events()
+        elif method == 'GET' and parts == ['tasks']:
+            self._send_json(200, self.app.manager.get_all_tasks())
+        elif method == 'GET' and len(parts) == 2 and parts[0] == 'tasks':
+            task = self.app.manager.get_task(parts[1])
+            if task is None:
+                self._send_json(404, {'error': 'task not found'})
+            else:
+                self._send_json(200, self.app.manager.get_task_status(task))
+        elif method == 'GET' and parts == ['metrics']:
+            self._send_json(200, self.app.manager.get_metrics())
+        elif method == 'GET' and parts == ['metrics', 'prometheus']:
+            self._send_text(200, metrics.render(), CONTENT_TYPE)
+        elif method == 'GET' and parts == ['trace']:
+            if not tracer.enabled:
+                raise ValueError('性能追踪未开启')
+            self._send_json(200, tracer.to_chrome_trace())
+        elif method == 'GET' and parts == ['history']:
+            limit = int(query.get('limit', [100])[0])
+            offset = int(query.get('offset', [0])[0])
+            self._send_json(200, self.app.manager.get_history(limit, offset))
+        elif method == 'POST' and parts == ['tasks']:
+            self._send_json(202, self.app.enqueue(self._read_json()))
+        elif method == 'POST' and len(parts) == 3 and parts[0] == 'tasks':
+            status = self.app.task_action(parts[1], parts[2], self._read_json())
+            if status is None:
+                self._send_json(404, {'error': 'task not found'})
+            else:
+                self._send_json(200, status)
+        else:
+            self._send_json(404, {'error': 'not found'})
+    
+    def _write_event(self, event, data):
+        payload = json.dumps(data, ensure_ascii=False)
+        self.wfile.write(f'event: {event}\ndata: {payload}\n\n'.encode('utf-8'))
+        self.wfile.flush()
+    
+    def _stream_events(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        
+        events = self.app.events
+        subscriber = events.subscribe()
+        try:
+            self._write_event('snapshot', self.app.manager.get_all_tasks())
+            while events.is_subscribed(subscriber):
+                try:
+                    event, data = subscriber.get(timeout=15)
+                except queue.Empty:
+                    self.wfile.write(b': keepalive\n\n')
+                    self.wfile.flush()
+                    continue
+                self._write_event(event, data)
+        finally:
+            events.unsubscribe(subscriber)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='B站视频下载服务')
+    parser.add_argument('--host', default=settings.get('daemon_host', DAEMON_HOST))
+    parser.add_argument('--port', type=int, default=settings.get('daemon_port', DAEMON_PORT))
+    parser.add_argument('--token', default=settings.get('daemon_token'))
+    parser.add_argument('--trace', default=settings.get('trace_file'))
+    parser.add_argument('--sync-space', action='append', default=[], metavar='URL', help='订阅UP主空间, 定时下载新投稿')
+    args = parser.parse_args(argv)
+    
+    daemon = DownloadDaemon(download_manager, args.host, args.port, args.token)
+    instance_port = settings.get('instance_port', INSTANCE_PORT)
+    instance = InstanceServer(lambda urls: urls and daemon.enqueue({'urls': urls}), instance_port, settings.get('daemon_token'))
+    if not instance.acquire():
+        if forward_urls([], instance_port, settings.get('daemon_token')) is not None:
+            logger.error('已有下载程序正在运行, 请通过该实例添加任务')
+            daemon.server.server_close()
+            return 1
+        logger.warning('端口 %s 已被其他程序占用, 不接收其他进程转发的链接', instance_port)
+    
+    if settings.get('metrics_port'):
+        start_metrics_server(settings.get('metrics_port'), settings.get('metrics_host', '127.0.0.1'))
+    if args.trace:
+        tracer.enable()
+    if settings.get('auto_resume', True):
+        daemon.restore_tasks()
+    for url in args.sync_space:
+        space_sync.add_space(url)
+    if space_sync.state['spaces']:
+        space_sync.start()
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        logger.info('下载服务已停止')
+    finally:
+        space_sync.stop()
+        instance.close()
+        api.session.close()
+        if args.trace:
+            tracer.export(args.trace)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
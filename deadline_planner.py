@@ -0,0 +1,105 @@
+import threading
+import time
+from logger import get_logger
+from config import QUALITY_OPTIONS
+
+logger = get_logger('download')
+
+class DeadlinePlanner:
+    def __init__(self, deadline, max_quality='1080P', initial_throughput=2 * 1024 * 1024, smoothing=0.3, replan_threshold=0.15):
+        self.deadline = deadline
+        self.max_quality = max_quality
+        self.levels = list(reversed(QUALITY_OPTIONS))
+        if max_quality in self.levels:
+            self.levels = self.levels[:self.levels.index(max_quality) + 1]
+        self.smoothing = smoothing
+        self.replan_threshold = replan_threshold
+        
+        self._lock = threading.Lock()
+        self.throughput = initial_throughput
+        self._measured = False
+        self._last_bytes = None
+        self._last_time = None
+        self._planned_throughput = None
+        self.last_plan = None
+        self._late = False
+        self.tasks = {}
+    
+    def add(self, task):
+        self.tasks.setdefault(task, task.quality)
+    
+    def discard_finished(self):
+        for task in [task for task in self.tasks if task.status in ('completed', 'skipped', 'error')]:
+            del self.tasks[task]
+    
+    def observe(self, total_bytes, now=None):
+        now = now or time.time()
+        with self._lock:
+            if self._last_time is not None and now > self._last_time:
+                rate = max(0, total_bytes - self._last_bytes) / (now - self._last_time)
+                if self._measured:
+                    self.throughput += self.smoothing * (rate - self.throughput)
+                elif rate > 0:
+                    self.throughput = rate
+                    self._measured = True
+            self._last_bytes = total_bytes
+            self._last_time = now
+            return self.throughput
+    
+    def needs_replan(self):
+        with self._lock:
+            if self._planned_throughput is None:
+                return True
+            change = abs(self.throughput - self._planned_throughput) / max(self._planned_throughput, 1)
+            return change > self.replan_threshold
+    
+    def _remaining(self, task):
+        return max(0, (task.total_size or task.expected_size) - task.downloaded_size)
+    
+    def plan(self, queued, active, now=None):
+        now = now or time.time()
+        with self._lock:
+            throughput = self.throughput
+            self._planned_throughput = throughput
+        
+        budget = throughput * max(0, self.deadline - now) - sum(self._remaining(task) for task in active)
+        assignments = [0] * len(queued)
+        sizes = [[task.estimate_size(quality) for quality in self.levels] for task in queued]
+        total = sum(task_sizes[0] for task_sizes in sizes)
+        
+        for level in range(1, len(self.levels)):
+            upgraded = False
+            for i, task_sizes in enumerate(sizes):
+                if assignments[i] != level - 1:
+                    continue
+                extra = task_sizes[level] - task_sizes[level - 1]
+                if total + extra <= budget:
+                    assignments[i] = level
+                    total += extra
+                    upgraded = True
+            if not upgraded:
+                break
+        
+        plan = {}
+        for task, level in zip(queued, assignments):
+            plan[task] = self.levels[level]
+        
+        self.last_plan = self.project(total, active, now)
+        late = total > budget
+        if late and not self._late:
+            logger.warning('按截止时间无法完成全部下载: 预计 %.0f MB, 完成于 %s', self.last_plan["total_bytes"] / 1048576, time.strftime("%H:%M:%S", time.localtime(self.last_plan["finish_time"])))
+        self._late = late
+        return plan
+    
+    def project(self, queued_bytes, active, now=None):
+        now = now or time.time()
+        total_bytes = queued_bytes + sum(self._remaining(task) for task in active)
+        throughput = max(self.throughput, 1)
+        finish_time = now + total_bytes / throughput
+        return {
+            'total_bytes': total_bytes,
+            'throughput': self.throughput,
+            'finish_time': finish_time,
+            'deadline': self.deadline,
+            'on_schedule': finish_time <= self.deadline
+        }
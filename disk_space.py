@@ -0,0 +1,124 @@
+import ctypes
+import ctypes.util
+import os
+import shutil
+import threading
+from logger import get_logger
+from settings_manager import settings
+
+logger = get_logger('download')
+
+FALLOC_FL_KEEP_SIZE = 0x01
+
+def _load_fallocate():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        fallocate = libc.fallocate
+    except (OSError, AttributeError, TypeError):
+        return None
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_longlong, ctypes.c_longlong]
+    fallocate.restype = ctypes.c_int
+    return fallocate
+
+_fallocate = _load_fallocate() if os.name == 'posix' else None
+
+def preallocate(f, size):
+    if _fallocate is None or size <= 0:
+        return False
+    
+    f.flush()
+    offset = os.fstat(f.fileno()).st_size
+    if _fallocate(f.fileno(), FALLOC_FL_KEEP_SIZE, offset, size) != 0:
+        logger.debug('预分配磁盘空间失败: %s', os.strerror(ctypes.get_errno()))
+        return False
+    return True
+
+def _existing_path(path):
+    path = os.path.abspath(path)
+    while not os.path.exists(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+def volume_key(path):
+    path = _existing_path(path)
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return path
+
+def free_bytes(path):
+    try:
+        return shutil.disk_usage(_existing_path(path)).free
+    except OSError:
+        return None
+
+class DiskSpaceGuard:
+    def __init__(self, min_free_bytes=1024 * 1024 * 1024):
+        self.min_free_bytes = min_free_bytes
+        self._lock = threading.Lock()
+        self._reservations = {}
+        self._blocked = set()
+    
+    def _outstanding(self, volume, exclude=None):
+        total = 0
+        for task, (task_volume, size) in self._reservations.items():
+            if task_volume == volume and task is not exclude:
+                total += max(0, size - task.downloaded_size)
+        return total
+    
+    def available(self, path, exclude=None):
+        free = free_bytes(path)
+        if free is None:
+            return None
+        with self._lock:
+            return free - self._outstanding(volume_key(path), exclude) - self.min_free_bytes
+    
+    def exceeds_capacity(self, path, size):
+        try:
+            total = shutil.disk_usage(_existing_path(path)).total
+        except OSError:
+            return False
+        return size > total - self.min_free_bytes
+    
+    def reserve(self, task, size):
+        path = task.output_path
+        volume = volume_key(path)
+        free = free_bytes(path)
+        
+        with self._lock:
+            if free is not None:
+                available = free - self._outstanding(volume, task) - self.min_free_bytes
+                if size > available:
+                    if volume not in self._blocked:
+                        self._blocked.add(volume)
+                        logger.warning('磁盘空间不足, 暂停调度: %s (需要 %.0f MB, 可用 %.0f MB)', path, size / 1048576, max(0, available) / 1048576)
+                    return False
+            
+            if volume in self._blocked:
+                self._blocked.discard(volume)
+                logger.info('磁盘空间已恢复, 继续调度: %s', path)
+            self._reservations[task] = (volume, size)
+            return True
+    
+    def update(self, task, size):
+        with self._lock:
+            reservation = self._reservations.get(task)
+            if reservation is not None:
+                self._reservations[task] = (reservation[0], size)
+    
+    def release(self, task):
+        with self._lock:
+            self._reservations.pop(task, None)
+    
+    def get_metrics(self):
+        with self._lock:
+            return {
+                'reserved': sum(max(0, size - task.downloaded_size) for task, (_, size) in self._reservations.items()),
+                'reservations': len(self._reservations),
+                'blocked_volumes': len(self._blocked)
+            }
+
+disk_guard = DiskSpaceGuard(settings.get('min_free_space_mb', 1024) * 1024 * 1024)
@@ -0,0 +1,446 @@
+import argparse
+import os
+import socket
+import threading
+import time
+import uuid
+import requests
+from http.server import ThreadingHTTPServer
+from settings_manager import settings
+from logger import get_logger
+from scheduling import create_policy, PRIORITY_NORMAL
+from stream_selector import estimate_size
+from daemon import JsonRequestHandler, confine_output_path, LOOPBACK_HOSTS
+from link_ingest import LinkIngester
+
+logger = get_logger('service')
+
+COORDINATOR_PORT = 8766
+LEASE_SECONDS = 30
+HEARTBEAT_INTERVAL = 5
+
+class Job:
+    __slots__ = ('job_id', 'spec', 'priority', 'group', 'expected_size', 'status', 'worker',
+                 'lease_expires', 'attempts', 'downloaded_size', 'total_size', 'output_file', 'error')
+    
+    def __init__(self, spec, job_id=None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.spec = spec
+        self.priority = spec.get('priority', PRIORITY_NORMAL)
+        video_info = spec.get('video_info', {})
+        self.group = video_info.get('group') or video_info.get('bvid')
+        self.expected_size = estimate_size(video_info.get('duration'), spec.get('quality'))
+        self.status = 'pending'
+        self.worker = None
+        self.lease_expires = 0
+        self.attempts = 0
+        self.downloaded_size = 0
+        self.total_size = 0
+        self.output_file = None
+        self.error = None
+    
+    def to_dict(self, with_spec=False):
+        data = {
+            'job_id': self.job_id,
+            'title': self.spec.get('video_info', {}).get('title'),
+            'status': self.status,
+            'worker': self.worker,
+            'attempts': self.attempts,
+            'downloaded_size': self.downloaded_size,
+            'total_size': self.total_size,
+            'output_file': self.output_file,
+            'error': self.error
+        }
+        if with_spec:
+            data['spec'] = self.spec
+        return data
+
+class Coordinator:
+    def __init__(self, host='127.0.0.1', port=COORDINATOR_PORT, token=None, output_path=None,
+                 lease_seconds=LEASE_SECONDS, max_attempts=3, policy='priority'):
+        if host not in LOOPBACK_HOSTS and not token:
+            raise ValueError('协调服务监听非本机地址时必须设置 token')
+        self.token = token
+        self.output_path = output_path or settings.get('default_download_path')
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.queue = create_policy(policy)
+        self.jobs = {}
+        self.leased = set()
+        self.workers = {}
+        self.ingests = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self.server = ThreadingHTTPServer((host, port), CoordinatorRequestHandler)
+        self.server.daemon_threads = True
+        self.server.app = self
+    
+    @property
+    def address(self):
+        return self.server.server_address
+    
+    def serve_forever(self):
+        self._running = True
+        threading.Thread(target=self._reaper_loop, daemon=True).start()
+        logger.info('任务协调服务已启动: http://%s:%s', self.address[0], self.address[1])
+        try:
+            self.server.serve_forever()
+        finally:
+            self._running = False
+    
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def add_spec(self, spec):
+        spec = dict(spec)
+        spec.setdefault('output_path', self.output_path)
+        job = Job(spec)
+        with self._lock:
+            self.jobs[job.job_id] = job
+            self.queue.push(job)
+        return job
+    
+    def enqueue(self, payload):
+        options = {
+            'output_path': confine_output_path(payload.get('output'), self.output_path),
+            'quality': payload.get('quality') or settings.get('default_quality', '1080P'),
+            'format_type': payload.get('format') or settings.get('default_video_format', 'mp4'),
+            'download_cover': payload.get('cover', settings.get('download_cover', True)),
+            'custom_filename': None,
+            'max_retries': int(payload.get('retries', 3)),
+            'skip_exists_check': bool(payload.get('force', False)),
+            'priority': payload.get('priority', PRIORITY_NORMAL)
+        }
+        
+        specs = payload.get('specs') or []
+        for spec in specs:
+            spec['output_path'] = confine_output_path(spec.get('output_path'), self.output_path)
+        jobs = [self.add_spec(spec) for spec in specs]
+        if jobs:
+            logger.info('协调服务添加了 %s 个任务', len(jobs))
+        result = {'jobs': [job.job_id for job in jobs]}
+        
+        urls = payload.get('urls') or []
+        if urls:
+            ingest_id = uuid.uuid4().hex
+            with self._lock:
+                self.ingests[ingest_id] = {'status': 'running', 'jobs': [], 'stats': None}
+            threading.Thread(target=self._ingest, args=(ingest_id, urls, options), daemon=True).start()
+            result['ingest'] = ingest_id
+        return result
+    
+    def _ingest(self, ingest_id, urls, options):
+        ingest = self.ingests[ingest_id]
+        ingester = LinkIngester()
+        try:
+            for batch in ingester.iter_batches(urls):
+                for video_info in batch:
+                    job = self.add_spec({**options, 'video_info': video_info})
+                    with self._lock:
+                        ingest['jobs'].append(job.job_id)
+            status = 'completed'
+        except Exception as e:
+            logger.error('导入链接失败: %s', e)
+            status = 'error'
+        with self._lock:
+            ingest['status'] = status
+            ingest['stats'] = ingester.stats
+        logger.info('协调服务添加了 %s 个任务', len(ingest["jobs"]))
+    
+    def get_ingest(self, ingest_id):
+        with self._lock:
+            ingest = self.ingests.get(ingest_id)
+            return None if ingest is None else {**ingest, 'jobs': list(ingest['jobs'])}
+    
+    def lease(self, worker, slots):
+        now = time.time()
+        leased = []
+        with self._lock:
+            self.workers[worker] = now
+            while self.queue and len(leased) < slots:
+                job = self.queue.pop()
+                job.status = 'leased'
+                job.worker = worker
+                job.lease_expires = now + self.lease_seconds
+                job.attempts += 1
+                self.leased.add(job)
+                leased.append(job.to_dict(with_spec=True))
+        if leased:
+            logger.info('分配 %s 个任务给 %s', len(leased), worker)
+        return {'jobs': leased, 'lease_seconds': self.lease_seconds}
+    
+    def heartbeat(self, worker, reports):
+        now = time.time()
+        lost = []
+        with self._lock:
+            self.workers[worker] = now
+            for report in reports:
+                job = self.jobs.get(report.get('job_id'))
+                if job is None or job.worker != worker or job.status != 'leased':
+                    lost.append(report.get('job_id'))
+                    continue
+                job.lease_expires = now + self.lease_seconds
+                job.downloaded_size = report.get('downloaded_size', job.downloaded_size)
+                job.total_size = report.get('total_size', job.total_size)
+        return {'lost': lost}
+    
+    def complete(self, worker, job_id, payload):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                raise KeyError(job_id)
+            if job.worker != worker or job.status != 'leased':
+                return None
+            
+            job.downloaded_size = payload.get('downloaded_size', job.downloaded_size)
+            job.total_size = payload.get('total_size', job.total_size)
+            job.output_file = payload.get('output_file')
+            job.error = payload.get('error')
+            job.worker = None
+            self.leased.discard(job)
+            if payload.get('status') in ('completed', 'skipped'):
+                job.status = payload['status']
+            elif job.attempts < self.max_attempts:
+                job.status = 'pending'
+                self.queue.push(job)
+            else:
+                job.status = 'error'
+        
+        logger.info('任务结果: %s -> %s (%s)', job.to_dict()["title"], job.status, worker)
+        return job.to_dict()
+    
+    def _reaper_loop(self):
+        while self._running:
+            time.sleep(1)
+            self.expire_leases()
+    
+    def expire_leases(self, now=None):
+        now = now or time.time()
+        expired = []
+        with self._lock:
+            for job in list(self.leased):
+                if job.lease_expires < now:
+                    expired.append(job)
+                    self.leased.discard(job)
+                    job.worker = None
+                    job.error = '租约过期'
+                    if job.attempts < self.max_attempts:
+                        job.status = 'pending'
+                        self.queue.push(job)
+                    else:
+                        job.status = 'error'
+        for job in expired:
+            logger.warning('任务租约过期, 重新分配: %s', job.to_dict()["title"])
+        return expired
+    
+    def get_status(self):
+        with self._lock:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return {
+                'jobs': counts,
+                'queued': len(self.queue),
+                'workers': {worker: round(time.time() - seen, 1) for worker, seen in self.workers.items()}
+            }
+    
+    def list_jobs(self):
+        with self._lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+class CoordinatorRequestHandler(JsonRequestHandler):
+    def route(self, method, parts, query):
+        app = self.app
+        if method == 'GET' and parts == ['status']:
+            self._send_json(200, app.get_status())
+        elif method == 'GET' and parts == ['jobs']:
+            self._send_json(200, app.list_jobs())
+        elif method == 'POST' and parts == ['jobs']:
+            self._send_json(202, app.enqueue(self._read_json()))
+        elif method == 'GET' and len(parts) == 2 and parts[0] == 'ingests':
+            ingest = app.get_ingest(parts[1])
+            if ingest is None:
+                self._send_json(404, {'error': 'ingest not found'})
+            else:
+                self._send_json(200, ingest)
+        elif method == 'POST' and parts == ['lease']:
+            payload = self._read_json()
+            self._send_json(200, app.lease(payload['worker'], int(payload.get('slots', 1))))
+        elif method == 'POST' and parts == ['heartbeat']:
+            payload = self._read_json()
+            self._send_json(200, app.heartbeat(payload['worker'], payload.get('jobs', [])))
+        elif method == 'POST' and len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'complete':
+            payload = self._read_json()
+            result = app.complete(payload['worker'], parts[1], payload)
+            if result is None:
+                self._send_json(409, {'error': 'lease lost'})
+            else:
+                self._send_json(200, result)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+class Worker:
+    def __init__(self, coordinator_url, slots=2, output_path=None, token=None, worker_id=None,
+                 poll_interval=1.0, heartbeat_interval=HEARTBEAT_INTERVAL, manager=None):
+        from download_manager import DownloadManager
+        from disk_space import disk_guard
+        
+        self.coordinator_url = coordinator_url.rstrip('/')
+        self.output_path = output_path
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.session = requests.Session()
+        if token:
+            self.session.headers['Authorization'] = f'Bearer {token}'
+        
+        if manager is None:
+            manager = DownloadManager(slots)
+            manager.attach_disk_guard(disk_guard)
+        self.manager = manager
+        self.slots = slots
+        self.leases = {}
+        self._lock = threading.Lock()
+        self._running = False
+        self.manager.add_listener(self._on_task_event)
+    
+    def _post(self, path, payload):
+        response = self.session.post(f'{self.coordinator_url}{path}', json=payload, timeout=10)
+        if response.status_code == 409:
+            return None
+        response.raise_for_status()
+        return response.json()
+    
+    def _on_task_event(self, event, task):
+        if event != 'finished':
+            return
+        with self._lock:
+            if self.leases.pop(task.task_id, None) is None:
+                return
+        threading.Thread(target=self._report, args=(task,), daemon=True).start()
+    
+    def _report(self, task):
+        payload = {
+            'worker': self.worker_id,
+            'status': task.status,
+            'downloaded_size': task.downloaded_size,
+            'total_size': task.total_size,
+            'output_file': task.output_file,
+            'error': task.error
+        }
+        try:
+            if self._post(f'/jobs/{task.task_id}/complete', payload) is None:
+                logger.warning('任务租约已失效, 结果被丢弃: %s', task.title)
+        except Exception as e:
+            logger.error('上报任务结果失败: %s, %s', task.title, e)
+    
+    def _lease(self):
+        from download_manager import DownloadTask
+        
+        with self._lock:
+            free = self.slots - len(self.leases)
+        if free <= 0:
+            return 0
+        
+        result = self._post('/lease', {'worker': self.worker_id, 'slots': free})
+        jobs = result.get('jobs', []) if result else []
+        for job in jobs:
+            spec = dict(job['spec'])
+            if self.output_path:
+                spec['output_path'] = self.output_path
+            task = DownloadTask.from_spec(spec, job['job_id'])
+            os.makedirs(task.output_path, exist_ok=True)
+            with self._lock:
+                self.leases[task.task_id] = task
+            self.manager.add_task(task)
+        return len(jobs)
+    
+    def _heartbeat(self):
+        with self._lock:
+            tasks = list(self.leases.values())
+        if not tasks:
+            return
+        
+        reports = [{
+            'job_id': task.task_id,
+            'status': task.status,
+            'downloaded_size': task.downloaded_size,
+            'total_size': task.total_size
+        } for task in tasks]
+        result = self._post('/heartbeat', {'worker': self.worker_id, 'jobs': reports}) or {}
+        for job_id in result.get('lost', []):
+            with self._lock:
+                task = self.leases.pop(job_id, None)
+            if task is not None:
+                logger.warning('任务租约丢失, 停止下载: %s', task.title)
+                self.manager.cancel_task(task)
+    
+    def _heartbeat_loop(self):
+        while self._running:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self._heartbeat()
+            except Exception as e:
+                logger.error('发送心跳失败: %s', e)
+    
+    def run(self):
+        self._running = True
+        self.manager.start()
+        threading.Thread(target=self._heartbeat_loop, daemon=True).start()
+        logger.info('下载节点已启动: %s, 协调服务 %s, 并发 %s', self.worker_id, self.coordinator_url, self.slots)
+        while self._running:
+            try:
+                leased = self._lease()
+            except Exception as e:
+                logger.error('领取任务失败: %s', e)
+                leased = 0
+            if not leased:
+                time.sleep(self.poll_interval)
+    
+    def stop(self):
+        self._running = False
+        with self._lock:
+            tasks = list(self.leases.values())
+        for task in tasks:
+            self.manager.cancel_task(task)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='B站视频分布式下载')
+    subparsers = parser.add_subparsers(dest='role', required=True)
+    
+    coordinator_parser = subparsers.add_parser('coordinator', help='运行任务协调服务')
+    coordinator_parser.add_argument('--host', default='127.0.0.1')
+    coordinator_parser.add_argument('--port', type=int, default=COORDINATOR_PORT)
+    coordinator_parser.add_argument('--output', help='共享保存路径')
+    coordinator_parser.add_argument('--lease', type=int, default=LEASE_SECONDS, help='租约时长(秒)')
+    coordinator_parser.add_argument('--token')
+    
+    worker_parser = subparsers.add_parser('worker', help='运行下载节点')
+    worker_parser.add_argument('coordinator', help='协调服务地址, 如 http://127.0.0.1:8766')
+    worker_parser.add_argument('--slots', type=int, default=2, help='最大同时下载数')
+    worker_parser.add_argument('--output', help='覆盖任务的保存路径')
+    worker_parser.add_argument('--token')
+    worker_parser.add_argument('--id', help='节点名称')
+    worker_parser.add_argument('--heartbeat', type=float, default=HEARTBEAT_INTERVAL, help='心跳间隔(秒), 需小于协调服务的租约时长')
+    
+    args = parser.parse_args(argv)
+    if args.role == 'coordinator':
+        try:
+            coordinator = Coordinator(args.host, args.port, args.token, args.output, args.lease)
+        except ValueError as e:
+            parser.error(str(e))
+        try:
+            coordinator.serve_forever()
+        except KeyboardInterrupt:
+            logger.info('任务协调服务已停止')
+    else:
+        worker = Worker(args.coordinator, args.slots, args.output, args.token, args.id, heartbeat_interval=args.heartbeat)
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            worker.stop()
+            logger.info('下载节点已停止')
+
+if __name__ == '__main__':
+    main()
@@ -3,23 +3,110 @@ import threading
 import time
 import requests
 import subprocess
-from queue import Queue
-from logger import logger
+import uuid
+import errno
+import re
+from collections import deque
+from urllib.parse import urlparse
+from logger import get_logger
 from bilibili_api import api
+from settings_manager import settings
+from config import AUDIO_OUTPUT_BITRATE
+from stream_selector import select_video, select_audio, stream_urls, stream_size, estimate_size, describe_video, describe_audio
+from scheduling import create_policy, PRIORITY_NORMAL
+from adaptive_concurrency import AIMDController
+from deadline_planner import DeadlinePlanner
+from task_store import task_store
+from disk_space import disk_guard, preallocate, volume_key
+from media_store import media_store, media_key
+from library import library
+from tracing import tracer
+from metrics import (download_bytes, task_phase_seconds, task_duration_seconds, retries, ffmpeg_cpu_seconds,
+                     queue_depth, active_workers, max_workers)
 
+logger = get_logger('download')
+
+ADMISSION_SCAN_LIMIT = 50
 FFMPEG_PATH = os.environ.get('FFMPEG_PATH', os.path.join('C:', 'ffmpeg', 'ffmpeg-8.0.1-essentials_build', 'bin'))
 
+_ffmpeg_available = False
+
 def check_ffmpeg():
+    global _ffmpeg_available
+    if _ffmpeg_available:
+        return True
     try:
         ffmpeg_exe = os.path.join(FFMPEG_PATH, 'ffmpeg.exe') if os.name == 'nt' else 'ffmpeg'
         result = subprocess.run([ffmpeg_exe, '-version'], capture_output=True, text=True)
-        return result.returncode == 0
+        _ffmpeg_available = result.returncode == 0
+        return _ffmpeg_available
     except:
         return False
 
+def run_ffmpeg(cmd):
+    if not hasattr(os, 'wait4'):
+        subprocess.run(cmd, capture_output=True, check=True)
+        return None
+    
+    process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    with process.stderr:
+        stderr = process.stderr.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, stderr=stderr)
+    return usage.ru_utime + usage.ru_stime
+
+DOWNLOAD_TIMEOUT = (10, 60)
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)')
+
+class IncompleteDownloadError(requests.RequestException):
+    pass
+
+def partial_path(path):
+    root, ext = os.path.splitext(path)
+    return f'{root}.part{ext}'
+
+def parse_content_range(value):
+    match = CONTENT_RANGE_PATTERN.match(value or '')
+    if not match:
+        return None, None, None
+    start, end, total = match.groups()
+    return (int(start) if start else None), (int(end) if end else None), (int(total) if total != '*' else None)
+
+TASK_INFO_FIELDS = ('bvid', 'aid', 'cid', 'page_count', 'title', 'pic', 'mid', 'author', 'duration', 'group')
+
+class TaskRecord:
+    __slots__ = ('task_id', 'title', 'bvid', 'cid', 'quality', 'format_type', 'priority', 'status', 'progress', 'downloaded_size', 'total_size', 'speed', 'eta', 'error', 'output_file')
+    
+    def __init__(self, task):
+        self.task_id = task.task_id
+        self.title = task.title
+        self.bvid = task.bvid
+        self.cid = task.cid
+        self.quality = task.quality
+        self.format_type = task.format_type
+        self.priority = task.priority
+        self.status = task.status
+        self.progress = task.progress
+        self.downloaded_size = task.downloaded_size
+        self.total_size = task.total_size
+        self.speed = 0
+        self.eta = 0
+        self.error = task.error
+        self.output_file = task.output_file
+
 class DownloadTask:
+    __slots__ = (
+        'output_path', 'quality', 'format_type', 'download_cover', 'custom_filename', 'max_retries',
+        'skip_exists_check', 'task_id', 'output_file',
+        'bvid', 'aid', 'cid', 'page_count', 'title', 'pic', 'mid', 'author', 'duration', 'group', 'priority', 'expected_size',
+        'status', 'progress', 'downloaded_size', 'received_size', 'total_size', 'speed', 'eta', 'error',
+        '_paused', '_stopped', 'transferring', '_thread', 'slot',
+        'progress_callback', 'complete_callback', 'error_callback', 'done_callback'
+    )
+    
     def __init__(self, video_info, output_path, quality, format_type, download_cover=True, custom_filename=None, max_retries=3, skip_exists_check=False):
-        self.video_info = video_info
         self.output_path = output_path
         self.quality = quality
         self.format_type = format_type
@@ -27,39 +114,95 @@ class DownloadTask:
         self.custom_filename = custom_filename
         self.max_retries = max_retries
         self.skip_exists_check = skip_exists_check
+        self.task_id = uuid.uuid4().hex
+        self.output_file = None
         
         self.bvid = video_info['bvid']
-        self.cid = video_info['cid']
+        self.aid = video_info.get('aid')
+        self.cid = video_info.get('cid')
+        self.page_count = video_info.get('page_count')
         self.title = video_info['title']
+        self.pic = video_info.get('pic')
+        self.mid = video_info.get('mid')
+        self.author = video_info.get('author')
+        self.duration = video_info.get('duration')
+        self.group = video_info.get('group') or (f'up:{self.mid}' if self.mid else self.bvid)
+        self.priority = PRIORITY_NORMAL
+        self.expected_size = self.estimate_size()
         
         self.status = 'pending'
         self.progress = 0
         self.downloaded_size = 0
+        self.received_size = 0
         self.total_size = 0
         self.speed = 0
         self.eta = 0
         self.error = None
+        self.slot = None
         
         self._paused = False
         self._stopped = False
+        self.transferring = False
         self._thread = None
-        self._temp_file = None
-        self._resume_data = None
         
         self.progress_callback = None
         self.complete_callback = None
         self.error_callback = None
+        self.done_callback = None
+    
+    @property
+    def video_info(self):
+        return {field: getattr(self, field) for field in TASK_INFO_FIELDS}
+    
+    def release(self):
+        self.progress_callback = None
+        self.complete_callback = None
+        self.error_callback = None
+        self.done_callback = None
+        self._thread = None
+    
+    def to_spec(self):
+        return {
+            'video_info': self.video_info,
+            'output_path': self.output_path,
+            'quality': self.quality,
+            'format_type': self.format_type,
+            'download_cover': self.download_cover,
+            'custom_filename': self.custom_filename,
+            'max_retries': self.max_retries,
+            'skip_exists_check': self.skip_exists_check,
+            'priority': self.priority
+        }
+    
+    @classmethod
+    def from_spec(cls, spec, task_id=None):
+        task = cls(
+            spec['video_info'],
+            spec['output_path'],
+            spec['quality'],
+            spec['format_type'],
+            spec.get('download_cover', True),
+            spec.get('custom_filename'),
+            spec.get('max_retries', 3),
+            spec.get('skip_exists_check', False)
+        )
+        task.priority = spec.get('priority', PRIORITY_NORMAL)
+        if task_id:
+            task.task_id = task_id
+        return task
     
     def start(self):
         if self._thread and self._thread.is_alive():
             logger.warning(f'任务已在运行: {self.title}')
-            return
+            return False
         
         self._paused = False
         self._stopped = False
         self.status = 'downloading'
-        self._thread = threading.Thread(target=self._download)
+        name = f'下载槽 {self.slot + 1}' if self.slot is not None else None
+        self._thread = threading.Thread(target=self._run, name=name)
         self._thread.start()
+        return True
     
     def pause(self):
         if self.status == 'downloading':
@@ -75,41 +218,80 @@ class DownloadTask:
     
     def stop(self):
         self._stopped = True
-        if self._thread and self._thread.is_alive():
-            self._thread.join(timeout=5)
         self.status = 'error'
         self.error = '用户停止'
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=5)
         logger.info(f'停止下载: {self.title}')
     
+    def _run(self):
+        start_time = time.time()
+        try:
+            with logger.context(task_id=self.task_id, bvid=self.bvid), tracer.span('task', title=self.title, bvid=self.bvid, format=self.format_type) as span:
+                self._download()
+                span.set(status=self.status)
+        finally:
+            task_duration_seconds.observe(time.time() - start_time, status=self.status)
+            if self.done_callback:
+                self.done_callback(self)
+    
     def _download(self):
         try:
+            phase_start = time.time()
             if not check_ffmpeg():
                 raise Exception('FFmpeg未安装，无法进行视频合并和音频提取。请先安装FFmpeg。')
             
-            streams = api.get_video_streams(self.bvid, self.cid, self.quality)
-            if not streams:
-                raise Exception('无法获取视频流')
-            
-            video_url = streams['dash']['video'][0]['baseUrl']
-            audio_url = streams['dash']['audio'][0]['baseUrl']
+            if not self.cid:
+                with tracer.span('view'):
+                    video_info = api.ensure_video_details(self.video_info)
+                if not video_info:
+                    raise Exception('无法获取视频信息')
+                self.cid = video_info.get('cid')
+                self.aid = self.aid or video_info.get('aid')
+                self.pic = self.pic or video_info.get('pic')
             
             filename = self.custom_filename if self.custom_filename else self._sanitize_filename(self.title)
+            audio_only = self.format_type in ['mp3', 'aac', 'flac']
+            final_file = os.path.join(self.output_path, f'{filename}.{self.format_type}')
+            self.output_file = final_file
             
-            if self.format_type in ['mp3', 'aac', 'flac']:
-                temp_audio_file = os.path.join(self.output_path, f'{filename}_audio.tmp')
-                final_file = os.path.join(self.output_path, f'{filename}.{self.format_type}')
+            existing = None if self.skip_exists_check else library.find_task(self)
+            if existing:
+                logger.info('媒体库中已存在，跳过下载: %s', existing)
+                self.output_file = existing
+                self.status = 'skipped'
+                if self.complete_callback:
+                    self.complete_callback(self)
+                return
+            
+            with logger.context(phase='resolve'), tracer.span('playurl', quality=self.quality):
+                streams = api.get_video_streams(self.bvid, self.cid, self.quality)
+                if not streams:
+                    raise Exception('无法获取视频流')
                 
-                if not self.skip_exists_check and os.path.exists(final_file):
-                    logger.info(f'文件已存在，跳过下载: {final_file}')
-                    self.status = 'skipped'
-                    if self.complete_callback:
-                        self.complete_callback(self)
-                    return
+                video_urls, audio_urls, store_key = self._select_streams(streams.get('dash') or {})
+            task_phase_seconds.observe(time.time() - phase_start, phase='resolve')
+            phase_start = time.time()
+            
+            with tracer.span('materialize'):
+                materialized = media_store.materialize(store_key, self.format_type, final_file)
+            if materialized:
+                library.record(self, store_key=store_key)
+                self.status = 'completed'
+                self.progress = 100
+                if self.complete_callback:
+                    self.complete_callback(self)
+                return
+            
+            if audio_only:
+                temp_audio_file = os.path.join(self.output_path, f'{filename}_audio.tmp')
                 
-                self._download_file(audio_url, temp_audio_file)
+                with logger.context(phase='audio'), tracer.span('audio'):
+                    self._download_stream(audio_urls, temp_audio_file, 'audio')
                 
                 if self._stopped:
                     return
+                task_phase_seconds.observe(time.time() - phase_start, phase='download')
                 
                 self._extract_audio(temp_audio_file, final_file)
                 
@@ -118,24 +300,19 @@ class DownloadTask:
             else:
                 temp_video_file = os.path.join(self.output_path, f'{filename}_video.tmp')
                 temp_audio_file = os.path.join(self.output_path, f'{filename}_audio.tmp')
-                final_file = os.path.join(self.output_path, f'{filename}.{self.format_type}')
                 
-                if not self.skip_exists_check and os.path.exists(final_file):
-                    logger.info(f'文件已存在，跳过下载: {final_file}')
-                    self.status = 'skipped'
-                    if self.complete_callback:
-                        self.complete_callback(self)
-                    return
-                
-                self._download_file(video_url, temp_video_file)
+                with logger.context(phase='video'), tracer.span('video'):
+                    self._download_stream(video_urls, temp_video_file, 'video')
                 
                 if self._stopped:
                     return
                 
-                self._download_file(audio_url, temp_audio_file)
+                with logger.context(phase='audio'), tracer.span('audio'):
+                    self._download_stream(audio_urls, temp_audio_file, 'audio')
                 
                 if self._stopped:
                     return
+                task_phase_seconds.observe(time.time() - phase_start, phase='download')
                 
                 self._merge_video_audio(temp_video_file, temp_audio_file, final_file)
                 
@@ -144,8 +321,13 @@ class DownloadTask:
                 if os.path.exists(temp_audio_file):
                     os.remove(temp_audio_file)
             
+            with tracer.span('store'):
+                stored = media_store.add(store_key, self.format_type, final_file)
+                library.record(self, store_key=store_key if stored else None)
+            
             if self.download_cover and self.format_type not in ['mp3', 'aac', 'flac']:
-                self._download_cover(filename)
+                with tracer.span('cover'):
+                    self._download_cover(filename)
             
             self.status = 'completed'
             self.progress = 100
@@ -154,7 +336,7 @@ class DownloadTask:
                 self.complete_callback(self)
             
             logger.info(f'下载完成: {self.title}')
-            
+        
         except Exception as e:
             self.status = 'error'
             self.error = str(e)
@@ -163,86 +345,157 @@ class DownloadTask:
             if self.error_callback:
                 self.error_callback(self)
     
-    def _download_file(self, url, output_file):
+    def _download_stream(self, urls, output_file, kind):
+        base_size = self.downloaded_size
+        error = None
+        for attempt in range(max(1, self.max_retries)):
+            if attempt:
+                time.sleep(min(attempt, 5))
+                if isinstance(error, requests.HTTPError) and error.response is not None and error.response.status_code in (403, 404, 410):
+                    logger.info('下载地址可能已过期, 重新获取播放地址: %s', self.title)
+                    urls = self._refresh_stream_urls(kind) or urls
+            
+            for url in urls:
+                if self._stopped:
+                    return
+                try:
+                    self._download_file(url, output_file, base_size)
+                    return
+                except requests.RequestException as e:
+                    error = e
+                    logger.warning('下载中断, 稍后续传: %s, %s', urlparse(url).netloc, e, host=urlparse(url).netloc)
+        raise error
+    
+    def _refresh_stream_urls(self, kind):
+        streams = api.get_video_streams(self.bvid, self.cid, self.quality)
+        if not streams:
+            return None
+        video_urls, audio_urls, _ = self._select_streams(streams.get('dash') or {})
+        return video_urls if kind == 'video' else audio_urls
+    
+    def _download_file(self, url, output_file, base_size=None):
+        if base_size is None:
+            base_size = self.downloaded_size
         headers = api.session.headers.copy()
         
-        resume_header = {}
-        if os.path.exists(output_file):
-            resume_header['Range'] = f'bytes={os.path.getsize(output_file)}-'
+        existing_size = os.path.getsize(output_file) if os.path.exists(output_file) else 0
+        if existing_size:
+            headers['Range'] = f'bytes={existing_size}-'
         
-        response = requests.get(url, headers={**headers, **resume_header}, stream=True)
-        response.raise_for_status()
-        
-        total_size = int(response.headers.get('content-length', 0))
-        if resume_header:
-            total_size += os.path.getsize(output_file)
-        
-        self.total_size = total_size
-        
-        mode = 'ab' if resume_header else 'wb'
-        
-        start_time = time.time()
-        last_update_time = start_time
-        last_downloaded = self.downloaded_size
-        
-        with open(output_file, mode) as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if self._stopped:
-                    break
+        self.transferring = True
+        try:
+            self._transfer(url, output_file, base_size, headers, existing_size)
+        finally:
+            self.transferring = False
+    
+    def _transfer(self, url, output_file, base_size, headers, existing_size):
+        with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+            if response.status_code == 416 and existing_size:
+                if parse_content_range(response.headers.get('Content-Range'))[2] == existing_size:
+                    self.downloaded_size = base_size + existing_size
+                    return
+                os.remove(output_file)
+                raise IncompleteDownloadError(f'临时文件与服务器文件不一致, 已删除: {output_file}')
+            response.raise_for_status()
+            
+            remaining_size = int(response.headers.get('content-length', 0))
+            if existing_size and (response.status_code != 206 or parse_content_range(response.headers.get('Content-Range'))[0] != existing_size):
+                logger.warning('服务器未按断点续传返回, 从头下载: %s', output_file)
+                existing_size = 0
+            
+            self.total_size = base_size + existing_size + remaining_size
+            self.downloaded_size = base_size + existing_size
+            host = urlparse(url).netloc
+            
+            mode = 'ab' if existing_size else 'wb'
+            
+            start_time = time.time()
+            last_update_time = start_time
+            last_downloaded = self.downloaded_size
+            
+            with open(output_file, mode) as f:
+                if settings.get('preallocate_files', True):
+                    preallocate(f, remaining_size)
                 
-                while self._paused:
-                    time.sleep(0.1)
+                for chunk in response.iter_content(chunk_size=8192):
                     if self._stopped:
                         break
-                
-                if self._stopped:
-                    break
-                
-                f.write(chunk)
-                self.downloaded_size += len(chunk)
-                
-                current_time = time.time()
-                if current_time - last_update_time >= 0.5:
-                    elapsed = current_time - last_update_time
-                    downloaded_delta = self.downloaded_size - last_downloaded
-                    
-                    self.speed = downloaded_delta / elapsed if elapsed > 0 else 0
                     
-                    if self.speed > 0:
-                        remaining = self.total_size - self.downloaded_size
-                        self.eta = remaining / self.speed
+                    while self._paused:
+                        time.sleep(0.1)
+                        if self._stopped:
+                            break
                     
-                    self.progress = (self.downloaded_size / self.total_size * 100) if self.total_size > 0 else 0
+                    if self._stopped:
+                        break
                     
-                    if self.progress_callback:
-                        self.progress_callback(self)
+                    try:
+                        f.write(chunk)
+                    except OSError as e:
+                        if e.errno == errno.ENOSPC:
+                            raise Exception('磁盘空间不足')
+                        raise
+                    self.downloaded_size += len(chunk)
+                    self.received_size += len(chunk)
                     
-                    last_update_time = current_time
-                    last_downloaded = self.downloaded_size
+                    current_time = time.time()
+                    if current_time - last_update_time >= 0.5:
+                        elapsed = current_time - last_update_time
+                        downloaded_delta = self.downloaded_size - last_downloaded
+                        
+                        self.speed = downloaded_delta / elapsed if elapsed > 0 else 0
+                        
+                        if self.speed > 0:
+                            remaining = self.total_size - self.downloaded_size
+                            self.eta = remaining / self.speed
+                        
+                        self.progress = (self.downloaded_size / self.total_size * 100) if self.total_size > 0 else 0
+                        
+                        if self.progress_callback:
+                            self.progress_callback(self)
+                        
+                        download_bytes.inc(downloaded_delta, host=host)
+                        last_update_time = current_time
+                        last_downloaded = self.downloaded_size
+            
+            download_bytes.inc(self.downloaded_size - last_downloaded, host=host)
+            
+            received = self.downloaded_size - base_size - existing_size
+            if not self._stopped and remaining_size and received != remaining_size:
+                raise IncompleteDownloadError(f'下载不完整: {received}/{remaining_size} 字节')
     
     def _extract_audio(self, video_file, audio_file):
         try:
             logger.info(f'开始提取音频: {video_file} -> {audio_file}')
             
             ffmpeg_exe = os.path.join(FFMPEG_PATH, 'ffmpeg.exe') if os.name == 'nt' else 'ffmpeg'
-            codec = 'libmp3lame' if audio_file.endswith('.mp3') else 'aac'
+            codec = {'.mp3': 'libmp3lame', '.flac': 'flac'}.get(os.path.splitext(audio_file)[1], 'aac')
+            temp_file = partial_path(audio_file)
             
             cmd = [
                 ffmpeg_exe,
                 '-i', video_file,
                 '-vn',
                 '-acodec', codec,
-                '-ab', '192k',
+                '-ab', f'{AUDIO_OUTPUT_BITRATE // 1000}k',
                 '-y',
-                audio_file
+                temp_file
             ]
             
-            subprocess.run(cmd, capture_output=True, check=True)
+            start_time = time.time()
+            with logger.context(phase='extract'), tracer.span('extract'):
+                cpu_time = run_ffmpeg(cmd)
+                os.replace(temp_file, audio_file)
+            task_phase_seconds.observe(time.time() - start_time, phase='extract')
+            if cpu_time is not None:
+                ffmpeg_cpu_seconds.inc(cpu_time, operation='extract')
             
             logger.info(f'音频提取完成: {audio_file}')
-            
+        
         except Exception as e:
             logger.error(f'音频提取失败: {e}')
+            if os.path.exists(partial_path(audio_file)):
+                os.remove(partial_path(audio_file))
             raise
     
     def _merge_video_audio(self, video_file, audio_file, output_file):
@@ -250,6 +503,7 @@ class DownloadTask:
             logger.info(f'开始合并视频和音频: {video_file} + {audio_file} -> {output_file}')
             
             ffmpeg_exe = os.path.join(FFMPEG_PATH, 'ffmpeg.exe') if os.name == 'nt' else 'ffmpeg'
+            temp_file = partial_path(output_file)
             
             cmd = [
                 ffmpeg_exe,
@@ -259,20 +513,28 @@ class DownloadTask:
                 '-c:a', 'aac',
                 '-strict', 'experimental',
                 '-y',
-                output_file
+                temp_file
             ]
             
-            subprocess.run(cmd, capture_output=True, check=True)
+            start_time = time.time()
+            with logger.context(phase='merge'), tracer.span('merge'):
+                cpu_time = run_ffmpeg(cmd)
+                os.replace(temp_file, output_file)
+            task_phase_seconds.observe(time.time() - start_time, phase='merge')
+            if cpu_time is not None:
+                ffmpeg_cpu_seconds.inc(cpu_time, operation='merge')
             
             logger.info(f'视频和音频合并完成: {output_file}')
-            
+        
         except Exception as e:
             logger.error(f'视频和音频合并失败: {e}')
+            if os.path.exists(partial_path(output_file)):
+                os.remove(partial_path(output_file))
             raise
     
     def _download_cover(self, filename):
         try:
-            pic_url = self.video_info.get('pic')
+            pic_url = self.pic
             if not pic_url:
                 return
             
@@ -285,10 +547,47 @@ class DownloadTask:
                 f.write(response.content)
             
             logger.info(f'封面下载完成: {cover_file}')
-            
+        
         except Exception as e:
             logger.error(f'封面下载失败: {e}')
     
+    def _select_streams(self, dash):
+        audio_only = self.format_type in ['mp3', 'aac', 'flac']
+        audio = select_audio(dash, self.format_type)
+        if audio is None:
+            raise Exception('没有可用的音频流')
+        
+        video = None
+        if not audio_only:
+            video = select_video(dash, self.quality, self.format_type, settings.get('video_codec', 'smallest'))
+            if video is None:
+                raise Exception('没有可用的视频流')
+        
+        duration = dash.get('duration')
+        size = stream_size(video, duration) + stream_size(audio, duration)
+        if size:
+            self.expected_size = size
+            disk_guard.update(self, self.required_space())
+        
+        video_desc = describe_video(video) if video else '无'
+        logger.info('流选择: %s, 视频 %s, 音频 %s, 预计 %.1f MB', self.title, video_desc, describe_audio(audio), size / 1048576)
+        return (stream_urls(video) if video else None), stream_urls(audio), self.media_key(video, audio)
+    
+    def media_key(self, video, audio):
+        if video is None:
+            return media_key(self.cid, 'audio', audio.get('id'), self.format_type)
+        return media_key(self.cid, video.get('id'), f'{video.get("codecid")}:{audio.get("id")}', self.format_type)
+    
+    def required_space(self):
+        return self.expected_size * 2
+    
+    def estimate_size(self, quality=None):
+        return estimate_size(self.duration, quality or self.quality)
+    
+    def set_quality(self, quality):
+        self.quality = quality
+        self.expected_size = self.estimate_size()
+    
     def _sanitize_filename(self, filename):
         invalid_chars = '<>:"/\\|?*'
         for char in invalid_chars:
@@ -296,59 +595,500 @@ class DownloadTask:
         return filename
 
 class DownloadManager:
-    def __init__(self, max_concurrent=5):
-        self.max_concurrent = max_concurrent
-        self.queue = Queue()
+    def __init__(self, max_concurrent=5, history_limit=200):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.configured_max_concurrent = self.max_concurrent
+        self.queue = create_policy(settings.get('scheduling_policy', 'priority'))
         self.active_tasks = []
-        self.completed_tasks = []
-        self.failed_tasks = []
+        self.completed_tasks = deque(maxlen=history_limit)
+        self.failed_tasks = deque(maxlen=history_limit)
+        self.completed_count = 0
+        self.failed_count = 0
+        self._tasks_by_id = {}
+        self._listeners = []
+        self._lock = threading.RLock()
+        self._condition = threading.Condition(self._lock)
         self._running = False
-        self._worker_thread = None
+        self._dispatcher_thread = None
+        self.adaptive = None
+        self.adaptive_interval = 5
+        self._adaptive_thread = None
+        self.store = None
+        self.disk_guard = None
+        self.disk_poll_interval = 5
+        self.deadline_planner = None
+        self.deadline_interval = 5
+        self._deadline_thread = None
+        self._plan_dirty = False
+        self._store_pruned = False
+        self.finished_bytes = 0
+    
+    def attach_disk_guard(self, guard):
+        self.disk_guard = guard
+    
+    def attach_store(self, store):
+        self.store = store
+        store.set_active_provider(lambda: list(self.active_tasks))
+    
+    def restore_tasks(self):
+        if self.store is None:
+            return []
+        
+        tasks = []
+        for record in self.store.load_unfinished():
+            try:
+                task = DownloadTask.from_spec(record['spec'], record['task_id'])
+            except Exception as e:
+                logger.error('恢复任务失败: %s, %s', record["task_id"], e)
+                continue
+            task.total_size = record['total_size'] or 0
+            task.output_file = record['output_file']
+            tasks.append(task)
+        
+        logger.info('恢复了 %s 个未完成的任务', len(tasks))
+        return tasks
+    
+    def start(self):
+        with self._lock:
+            if self._dispatcher_thread and self._dispatcher_thread.is_alive():
+                return
+            self._running = True
+            self._dispatcher_thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+            self._dispatcher_thread.start()
+    
+    def shutdown(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
     
-    def add_task(self, task):
-        self.queue.put(task)
-        logger.info(f'添加下载任务: {task.title}')
-        self._process_queue()
+    def set_max_concurrent(self, max_concurrent):
+        with self._condition:
+            self.configured_max_concurrent = max(1, int(max_concurrent))
+            self._set_limit(self.configured_max_concurrent)
+        logger.info('最大同时下载数设置为: %s', self.max_concurrent)
+    
+    def _set_limit(self, limit):
+        with self._condition:
+            self.max_concurrent = max(1, int(limit))
+            self._condition.notify_all()
+    
+    def set_adaptive(self, enabled, max_limit=None):
+        with self._condition:
+            if not enabled:
+                if self.adaptive is not None:
+                    self.adaptive = None
+                    self._set_limit(self.configured_max_concurrent)
+                    logger.info('自适应并发已关闭, 最大同时下载数恢复为: %s', self.max_concurrent)
+                return
+            
+            if self.adaptive is None:
+                self.adaptive = AIMDController(max_limit=max_limit or settings.get('adaptive_max_concurrent', 16))
+            elif max_limit:
+                self.adaptive.max_limit = max_limit
+        
+        logger.info('自适应并发已开启')
+        if not (self._adaptive_thread and self._adaptive_thread.is_alive()):
+            self._adaptive_thread = threading.Thread(target=self._adaptive_loop, daemon=True)
+            self._adaptive_thread.start()
+    
+    def _adaptive_loop(self):
+        while True:
+            time.sleep(self.adaptive_interval)
+            controller = self.adaptive
+            if controller is None:
+                break
+            
+            with self._lock:
+                active_tasks = list(self.active_tasks)
+                queued = len(self.queue)
+                limit = self.max_concurrent
+            
+            new_limit = controller.sample(limit, active_tasks, queued, api.rate_limit_hits)
+            with self._lock:
+                if self.adaptive is controller and new_limit != limit:
+                    self._set_limit(new_limit)
+    
+    def set_deadline(self, deadline, max_quality='1080P'):
+        with self._condition:
+            planner = self.deadline_planner
+            if deadline is None:
+                self.deadline_planner = None
+                restored = self._restore_qualities(planner) if planner is not None else 0
+                logger.info('截止时间模式已关闭, 恢复了 %s 个任务的清晰度', restored)
+                return
+            
+            if planner is not None and planner.deadline == deadline and planner.max_quality == max_quality:
+                return
+            
+            initial_throughput = settings.get('deadline_initial_throughput_mb', 2) * 1024 * 1024
+            if self.adaptive is not None and self.adaptive.metrics['throughput']:
+                initial_throughput = self.adaptive.metrics['throughput']
+            elif planner is not None:
+                initial_throughput = planner.throughput
+            self.deadline_planner = DeadlinePlanner(deadline, max_quality, initial_throughput)
+            if planner is not None:
+                self.deadline_planner.tasks = planner.tasks
+            self._plan_dirty = True
+        
+        logger.info('截止时间模式已开启: %s, 最高清晰度 %s', time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(deadline)), max_quality)
+        if not (self._deadline_thread and self._deadline_thread.is_alive()):
+            self._deadline_thread = threading.Thread(target=self._deadline_loop, daemon=True)
+            self._deadline_thread.start()
+    
+    def _restore_qualities(self, planner):
+        restored = 0
+        for task, quality in planner.tasks.items():
+            if task.status in ('pending', 'paused') and task.quality != quality:
+                task.set_quality(quality)
+                if task in self.queue:
+                    self.queue.reprioritize(task, task.priority)
+                restored += 1
+        return restored
+    
+    def _replan(self):
+        planner = self.deadline_planner
+        self._plan_dirty = False
+        if planner is None:
+            return
+        
+        planner.discard_finished()
+        plan = planner.plan([task for task in planner.tasks if task.status == 'pending'], list(self.active_tasks))
+        changed = 0
+        for task, quality in plan.items():
+            if task.quality != quality:
+                task.set_quality(quality)
+                if task in self.queue:
+                    self.queue.reprioritize(task, task.priority)
+                changed += 1
+        
+        if changed:
+            projection = planner.last_plan
+            logger.info('截止时间调度: 调整了 %s 个任务的清晰度, 预计 %.0f MB, 完成于 %s', changed, projection["total_bytes"] / 1048576, time.strftime("%H:%M:%S", time.localtime(projection["finish_time"])))
+    
+    def _deadline_loop(self):
+        while True:
+            time.sleep(self.deadline_interval)
+            planner = self.deadline_planner
+            if planner is None:
+                break
+            
+            with self._lock:
+                total_bytes = self.finished_bytes + sum(task.received_size for task in self.active_tasks)
+            planner.observe(total_bytes)
+            
+            if planner.needs_replan():
+                with self._lock:
+                    self._replan()
+    
+    def project_deadline(self):
+        with self._lock:
+            if self.deadline_planner is None:
+                return None
+            if self._plan_dirty or self.deadline_planner.last_plan is None:
+                self._replan()
+            return self.deadline_planner.last_plan
+    
+    def get_metrics(self):
+        with self._lock:
+            metrics = {
+                'max_concurrent': self.max_concurrent,
+                'active': len(self.active_tasks),
+                'queued': len(self.queue),
+                'completed': self.completed_count,
+                'failed': self.failed_count
+            }
+        if self.disk_guard is not None:
+            metrics['disk'] = self.disk_guard.get_metrics()
+        if self.deadline_planner is not None:
+            metrics['deadline'] = self.deadline_planner.last_plan
+        if self.adaptive is not None:
+            metrics['adaptive'] = self.adaptive.get_metrics()
+        return metrics
+    
+    def set_policy(self, name):
+        with self._condition:
+            queued = list(self.queue)
+            self.queue = create_policy(name)
+            for task in queued:
+                self.queue.push(task)
+        logger.info('调度策略设置为: %s', self.queue.name)
+    
+    def reprioritize(self, task, priority):
+        with self._condition:
+            found = self.queue.reprioritize(task, priority)
+        if found:
+            logger.info('调整任务优先级: %s -> %s', task.title, priority)
+            self._notify('reprioritized', task)
+        return found
+    
+    def add_task(self, task, priority=None, deadline=False):
+        self.add_tasks([task], priority, deadline)
+    
+    def add_tasks(self, tasks, priority=None, deadline=False):
+        added = []
+        with self._condition:
+            for task in tasks:
+                if task in self.queue or task in self.active_tasks:
+                    logger.warning('任务已在队列中: %s', task.title)
+                    continue
+                
+                if task in self.failed_tasks:
+                    self.failed_tasks.remove(task)
+                    retries.inc(kind='task')
+                
+                if priority is not None:
+                    task.priority = priority
+                
+                existing = None if task.skip_exists_check else library.find_task(task)
+                if existing:
+                    self._skip_existing(task, existing)
+                    continue
+                
+                task.status = 'pending'
+                added.append(task)
+            
+            planner = self.deadline_planner if deadline else None
+            if planner is not None and added:
+                for task in added:
+                    planner.add(task)
+                self._replan()
+            
+            for task in added:
+                self.queue.push(task)
+                self._tasks_by_id[task.task_id] = task
+                if self.store is not None:
+                    self.store.save(task)
+                self._notify('queued', task)
+            self._condition.notify_all()
+        
+        for task in added:
+            logger.info('添加下载任务: %s', task.title)
+        if added:
+            self.start()
+    
+    def _skip_existing(self, task, path):
+        logger.info('媒体库中已存在，跳过下载: %s', path)
+        task.output_file = path
+        task.status = 'skipped'
+        task.progress = 100
+        self.completed_tasks.append(TaskRecord(task))
+        self.completed_count += 1
+        self._tasks_by_id.pop(task.task_id, None)
+        if self.store is not None:
+            self.store.save(task)
+        self._notify('finished', task)
+        if task.complete_callback:
+            task.complete_callback(task)
+        task.release()
+    
+    def add_listener(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+    
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+    
+    def _notify(self, event, task):
+        for listener in list(self._listeners):
+            try:
+                listener(event, task)
+            except Exception as e:
+                logger.error('任务事件回调失败: %s', e)
+    
+    def get_active_tasks(self):
+        with self._lock:
+            return list(self.active_tasks)
+    
+    def get_task(self, task_id):
+        with self._lock:
+            return self._tasks_by_id.get(task_id)
     
     def _process_queue(self):
-        while len(self.active_tasks) < self.max_concurrent and not self.queue.empty():
-            task = self.queue.get()
+        with self._condition:
+            self._condition.notify_all()
+    
+    def _admit(self, task):
+        if self.disk_guard is None:
+            return True
+        return self.disk_guard.reserve(task, task.required_space())
+    
+    def _reject_oversized(self, task):
+        if not self.disk_guard.exceeds_capacity(task.output_path, task.required_space()):
+            return False
+        self._dequeue(task, 'error', f'所需空间 {task.required_space() / 1048576:.0f} MB 超过磁盘容量')
+        self._record_failed(task)
+        logger.error('磁盘容量不足, 无法下载: %s', task.title)
+        self._notify('finished', task)
+        if task.error_callback:
+            task.error_callback(task)
+        return True
+    
+    def _select_task(self):
+        while self.queue:
+            head = self.queue.peek()
+            if self._admit(head):
+                return self.queue.pop()
+            if not self._reject_oversized(head):
+                break
+        else:
+            return None
+        
+        busy = {volume_key(task.output_path) for task in self.active_tasks}
+        waiting = set()
+        for task in self.queue.peek_n(ADMISSION_SCAN_LIMIT):
+            volume = volume_key(task.output_path)
+            if volume in waiting:
+                continue
+            if task is not head:
+                if self._reject_oversized(task):
+                    continue
+                if self._admit(task):
+                    self.queue.remove(task)
+                    return task
+            if volume in busy:
+                waiting.add(volume)
+        return None
+    
+    def _next_task(self):
+        with self._condition:
+            while True:
+                while self._running and (len(self.active_tasks) >= self.max_concurrent or not self.queue):
+                    self._condition.wait()
+                
+                if not self._running:
+                    return None
+                
+                if self._plan_dirty:
+                    self._replan()
+                task = self._select_task()
+                if task is not None:
+                    break
+                if self.queue:
+                    self._condition.wait(self.disk_poll_interval)
+            
+            slots = {active.slot for active in self.active_tasks}
+            task.slot = next(slot for slot in range(len(slots) + 1) if slot not in slots)
             self.active_tasks.append(task)
             
             if not task.progress_callback:
                 task.progress_callback = self._on_progress
-            if not task.complete_callback:
-                task.complete_callback = self._on_complete
-            if not task.error_callback:
-                task.error_callback = self._on_error
+            task.done_callback = self._on_finished
+            if self.store is not None:
+                self.store.update(task)
+            self._notify('started', task)
+            return task
+    
+    def _dispatch_loop(self):
+        if not self._store_pruned:
+            self._store_pruned = True
+            media_store.prune()
+        
+        while True:
+            task = self._next_task()
+            if task is None:
+                break
             
-            task.start()
+            try:
+                if not task.start():
+                    self._on_finished(task)
+            except Exception as e:
+                logger.error('启动任务失败: %s, 错误: %s', task.title, e)
+                task.status = 'error'
+                task.error = str(e)
+                self._on_finished(task)
     
     def _on_progress(self, task):
         pass
     
-    def _on_complete(self, task):
-        self.active_tasks.remove(task)
-        self.completed_tasks.append(task)
-        self._process_queue()
+    def _on_finished(self, task):
+        with self._condition:
+            if task not in self.active_tasks:
+                return
+            
+            self.active_tasks.remove(task)
+            self.finished_bytes += task.received_size
+            if self.disk_guard is not None:
+                self.disk_guard.release(task)
+            if self.adaptive is not None:
+                self.adaptive.task_finished(task)
+            if self.store is not None:
+                self.store.update(task)
+            self._notify('finished', task)
+            if task.status in ('completed', 'skipped'):
+                self.completed_tasks.append(TaskRecord(task))
+                self.completed_count += 1
+                self._tasks_by_id.pop(task.task_id, None)
+                task.release()
+            else:
+                self._record_failed(task)
+            self._condition.notify_all()
     
-    def _on_error(self, task):
-        self.active_tasks.remove(task)
+    def _record_failed(self, task):
+        if len(self.failed_tasks) == self.failed_tasks.maxlen:
+            self._tasks_by_id.pop(self.failed_tasks[0].task_id, None)
         self.failed_tasks.append(task)
-        self._process_queue()
+        self.failed_count += 1
+    
+    def _dequeue(self, task, status, error=None):
+        if not self.queue.remove(task):
+            return False
+        task.status = status
+        task.error = error
+        self._plan_dirty = self._plan_dirty or self.deadline_planner is not None and task in self.deadline_planner.tasks
+        if self.store is not None:
+            self.store.update(task)
+        return True
     
     def pause_task(self, task):
-        task.pause()
+        with self._condition:
+            queued = self._dequeue(task, 'paused')
+        if not queued:
+            task.pause()
+        self._notify('paused', task)
     
     def resume_task(self, task):
-        task.resume()
+        with self._condition:
+            requeue = task.status == 'paused' and task not in self.active_tasks
+        if requeue:
+            self.add_task(task)
+        else:
+            task.resume()
+        self._notify('resumed', task)
     
     def stop_task(self, task):
-        task.stop()
+        with self._condition:
+            queued = self._dequeue(task, 'error', '用户停止')
+            if queued:
+                self._record_failed(task)
+        if queued:
+            logger.info('停止排队任务: %s', task.title)
+        else:
+            task.stop()
+        self._notify('stopped', task)
+    
+    def cancel_task(self, task):
+        with self._condition:
+            queued = self._dequeue(task, 'error', '已取消')
+            if queued:
+                self._tasks_by_id.pop(task.task_id, None)
+        if queued:
+            logger.info('取消排队任务: %s', task.title)
+            self._notify('cancelled', task)
+        else:
+            self.stop_task(task)
     
     def get_task_status(self, task):
         return {
+            'task_id': task.task_id,
+            'bvid': task.bvid,
             'title': task.title,
+            'quality': task.quality,
+            'format': task.format_type,
+            'priority': task.priority,
+            'output_file': task.output_file,
+            'error': task.error,
             'status': task.status,
             'progress': task.progress,
             'downloaded_size': task.downloaded_size,
@@ -357,12 +1097,27 @@ class DownloadManager:
             'eta': task.eta
         }
     
+    def get_history(self, limit=100, offset=0):
+        if self.store is not None:
+            return self.store.load_history(limit, offset)
+        with self._lock:
+            records = list(self.completed_tasks) + list(self.failed_tasks)
+        return [{'task_id': r.task_id, 'title': r.title, 'status': r.status, 'output_file': r.output_file, 'error': r.error} for r in records[offset:offset + limit]]
+    
     def get_all_tasks(self):
-        return {
-            'active': [self.get_task_status(t) for t in self.active_tasks],
-            'queued': list(self.queue.queue),
-            'completed': [t.title for t in self.completed_tasks],
-            'failed': [t.title for t in self.failed_tasks]
-        }
+        with self._lock:
+            return {
+                'active': [self.get_task_status(t) for t in self.active_tasks],
+                'queued': [self.get_task_status(t) for t in self.queue],
+                'completed': [self.get_task_status(t) for t in self.completed_tasks],
+                'failed': [self.get_task_status(t) for t in self.failed_tasks]
+            }
 
-download_manager = DownloadManager()
+download_manager = DownloadManager(settings.get('max_concurrent_downloads', 5), settings.get('task_history_limit', 200))
+download_manager.attach_store(task_store)
+download_manager.attach_disk_guard(disk_guard)
+queue_depth.set_function(lambda: len(download_manager.queue))
+active_workers.set_function(lambda: len(download_manager.active_tasks))
+max_workers.set_function(lambda: download_manager.max_concurrent)
+if settings.get('adaptive_concurrency', False):
+    download_manager.set_adaptive(True)
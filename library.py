@@ -0,0 +1,146 @@
+import os
+import sqlite3
+import threading
+import time
+from logger import get_logger
+from config import DATA_DIR
+
+logger = get_logger('library')
+
+LIBRARY_DB_FILE = os.path.join(DATA_DIR, 'library.db')
+
+class LibraryIndex:
+    def __init__(self, db_file=LIBRARY_DB_FILE):
+        self.db_file = db_file
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                bvid TEXT NOT NULL,
+                cid INTEGER,
+                quality TEXT,
+                format TEXT,
+                size INTEGER,
+                added REAL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_files_media ON files (bvid, cid, format)')
+        if 'store_key' not in [row[1] for row in self._conn.execute('PRAGMA table_info(files)')]:
+            self._conn.execute('ALTER TABLE files ADD COLUMN store_key TEXT')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS store (
+                key TEXT NOT NULL,
+                format TEXT NOT NULL,
+                method TEXT,
+                size INTEGER,
+                added REAL,
+                PRIMARY KEY (key, format)
+            )
+        ''')
+        self._conn.commit()
+    
+    def _normalize(self, path):
+        return os.path.normcase(os.path.abspath(path))
+    
+    def record(self, task, path=None, store_key=None):
+        path = path or task.output_file
+        if not path or not os.path.exists(path):
+            return
+        
+        try:
+            with self._lock:
+                with self._conn:
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO files (path, bvid, cid, quality, format, size, added, store_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                        (self._normalize(path), task.bvid, task.cid, task.quality, task.format_type, os.path.getsize(path), time.time(), store_key)
+                    )
+        except Exception as e:
+            logger.error('更新媒体库索引失败: %s, %s', path, e)
+    
+    def find(self, bvid, cid, format_type, quality=None, any_page=False):
+        query = 'SELECT path FROM files WHERE bvid = ? AND format = ?'
+        params = [bvid, format_type]
+        if not any_page:
+            query += ' AND cid IS ?'
+            params.append(cid)
+        if quality:
+            query += ' AND quality = ?'
+            params.append(quality)
+        
+        with self._lock:
+            paths = [row[0] for row in self._conn.execute(query, params).fetchall()]
+        
+        missing = []
+        found = None
+        for path in paths:
+            if os.path.exists(path):
+                found = path
+                break
+            missing.append(path)
+        
+        if missing:
+            with self._lock:
+                with self._conn:
+                    self._conn.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in missing])
+        return found
+    
+    def find_task(self, task):
+        if task.cid:
+            return self.find(task.bvid, task.cid, task.format_type, task.quality)
+        if task.page_count == 1:
+            return self.find(task.bvid, None, task.format_type, task.quality, any_page=True)
+        return None
+    
+    def rename(self, old_path, new_path):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('UPDATE OR REPLACE files SET path = ? WHERE path = ?', (self._normalize(new_path), self._normalize(old_path)))
+    
+    def remove(self, path):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM files WHERE path = ?', (self._normalize(path),))
+    
+    def record_store_entry(self, key, format_type, method, size):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO store (key, format, method, size, added) VALUES (?, ?, ?, ?, ?)',
+                    (key, format_type, method, size, time.time())
+                )
+    
+    def store_entries(self):
+        with self._lock:
+            return self._conn.execute('SELECT key, format, method FROM store').fetchall()
+    
+    def remove_store_entry(self, key, format_type):
+        with self._lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM store WHERE key = ? AND format = ?', (key, format_type))
+    
+    def referenced_store_keys(self):
+        with self._lock:
+            rows = self._conn.execute('SELECT path, store_key, format FROM files WHERE store_key IS NOT NULL').fetchall()
+        
+        referenced = set()
+        missing = []
+        for path, key, format_type in rows:
+            if os.path.exists(path):
+                referenced.add((key, format_type))
+            else:
+                missing.append(path)
+        
+        if missing:
+            with self._lock:
+                with self._conn:
+                    self._conn.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in missing])
+        return referenced
+    
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+library = LibraryIndex()
@@ -0,0 +1,139 @@
+from logger import get_logger
+from bilibili_api import api
+from url_router import route_url, COLLECTION_KINDS
+
+logger = get_logger('ingest')
+
+def iter_link_file(file_path):
+    with open(file_path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+
+def split_pages(video_info):
+    if not video_info.get('is_multi_page', False):
+        return [video_info]
+    
+    pages = video_info.get('pages', [])
+    logger.info('视频 "%s" 包含 %s 个分集', video_info.get("title"), len(pages))
+    
+    page_infos = []
+    for page in pages:
+        page_info = video_info.copy()
+        page_info['cid'] = page.get('cid')
+        page_info['title'] = f"{video_info.get('title')} - {page.get('part')}"
+        page_info['is_multi_page'] = False
+        page_infos.append(page_info)
+    return page_infos
+
+def listing_infos(video, group=None):
+    video_info = api.build_listing_info(video)
+    page_count = video_info['page_count']
+    if page_count is None or page_count > 1 and len(video_info['pages']) < page_count:
+        video_info = api.get_video_info(f'https://www.bilibili.com/video/{video_info["bvid"]}')
+        if not video_info:
+            logger.error('无法获取视频信息: %s', video.get("bvid"))
+            return []
+    
+    video_infos = split_pages(video_info)
+    if group is not None:
+        for info in video_infos:
+            info['group'] = group
+    return video_infos
+
+class LinkIngester:
+    def __init__(self, batch_size=100):
+        self.batch_size = batch_size
+        self.seen_routes = set()
+        self.seen_videos = set()
+        self.stats = {'lines': 0, 'invalid': 0, 'duplicate': 0, 'videos': 0}
+    
+    def iter_routes(self, lines):
+        for line in lines:
+            self.stats['lines'] += 1
+            route = route_url(line)
+            
+            if route is not None and route.kind == 'short':
+                route = route_url(api.resolve_short_url(line) or '')
+            
+            if route is None:
+                self.stats['invalid'] += 1
+                logger.warning('无法识别的链接: %s', line)
+                continue
+            
+            if route.key in self.seen_routes:
+                self.stats['duplicate'] += 1
+                continue
+            
+            self.seen_routes.add(route.key)
+            yield route
+    
+    def _accept(self, video_info):
+        key = (video_info.get('bvid'), video_info.get('cid'))
+        if key in self.seen_videos:
+            self.stats['duplicate'] += 1
+            return False
+        self.seen_videos.add(key)
+        self.stats['videos'] += 1
+        return True
+    
+    def _expand_routes(self, routes):
+        video_urls = [route.canonical_url for route in routes if route.kind == 'video']
+        if len(video_urls) > 1:
+            from async_api import async_api
+            infos = async_api.resolve_video_infos(video_urls)
+        else:
+            infos = {url: api.get_video_info(url) for url in video_urls}
+        
+        for route in routes:
+            if route.kind == 'video':
+                video_info = infos.get(route.canonical_url)
+                if not video_info:
+                    logger.error('无法获取视频信息: %s', route.url)
+                    continue
+                yield split_pages(video_info)
+            elif route.kind == 'space':
+                page = []
+                for video in api.iter_user_videos(route.canonical_url):
+                    page.extend(listing_infos(video, route.key))
+                    if len(page) >= self.batch_size:
+                        yield page
+                        page = []
+                yield page
+            elif route.kind in COLLECTION_KINDS:
+                collection_info = api.get_collection_info(route.url)
+                if not collection_info:
+                    logger.error('无法获取合集信息: %s', route.url)
+                    continue
+                videos = collection_info.get('videos', [])
+                logger.info('合集 "%s" 包含 %s 个视频', collection_info.get("title"), len(videos))
+                yield [info for video in videos if video.get('bvid') for info in listing_infos(video, route.key)]
+    
+    def iter_batches(self, lines):
+        routes = []
+        batch = []
+        
+        def expand():
+            for video_infos in self._expand_routes(routes):
+                for video_info in video_infos:
+                    if self._accept(video_info):
+                        batch.append(video_info)
+                if len(batch) >= self.batch_size:
+                    yield batch[:]
+                    batch.clear()
+            routes.clear()
+        
+        for route in self.iter_routes(lines):
+            routes.append(route)
+            if len(routes) >= self.batch_size:
+                yield from expand()
+        
+        yield from expand()
+        if batch:
+            yield batch[:]
+        
+        logger.info('链接导入完成: 共 %s 行, 无效 %s 个, 重复 %s 个, 视频 %s 个', self.stats["lines"], self.stats["invalid"], self.stats["duplicate"], self.stats["videos"])
+    
+    def ingest_file(self, file_path):
+        return self.iter_batches(iter_link_file(file_path))
@@ -1,38 +1,182 @@
+import atexit
+import json
 import logging
 import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from config import LOGS_DIR
 
+ROOT_NAME = 'BilibiliDownload'
+LOG_FILE = os.path.join(LOGS_DIR, 'bilibili_download.log')
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_ROTATE_SECONDS = 86400
+DEFAULT_BACKUP_COUNT = 7
+QUEUE_SIZE = 10000
+
+_context = threading.local()
+
+def current_context():
+    return getattr(_context, 'fields', {})
+
+class SizeAndTimeRotatingFileHandler(RotatingFileHandler):
+    def __init__(self, filename, max_bytes=DEFAULT_MAX_BYTES, rotate_seconds=DEFAULT_ROTATE_SECONDS, backup_count=DEFAULT_BACKUP_COUNT):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.rotate_seconds = rotate_seconds
+        started = os.path.getmtime(filename) if os.path.exists(filename) and os.path.getsize(filename) else time.time()
+        self.rollover_at = started + rotate_seconds if rotate_seconds else None
+    
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+    
+    def doRollover(self):
+        try:
+            super().doRollover()
+        except OSError:
+            if self.stream is not None:
+                self.stream.close()
+            root, ext = os.path.splitext(self.baseFilename)
+            suffix = f'_{os.getpid()}'
+            if not root.endswith(suffix):
+                self.baseFilename = f'{root}{suffix}{ext}'
+            self.stream = self._open()
+        if self.rotate_seconds:
+            self.rollover_at = time.time() + self.rotate_seconds
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+    
+    def enqueue(self, record):
+        if record.levelno >= logging.INFO:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
 class Logger:
+    def __init__(self, name=ROOT_NAME):
+        self.logger = logging.getLogger(name)
+    
+    def is_enabled(self, level):
+        return self.logger.isEnabledFor(level)
+    
+    def set_level(self, level):
+        self.logger.setLevel(str(level).upper())
+    
+    @contextmanager
+    def context(self, **fields):
+        previous = current_context()
+        _context.fields = {**previous, **fields}
+        try:
+            yield
+        finally:
+            _context.fields = previous
+    
+    def _log(self, level, message, args, fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        context = current_context()
+        if context:
+            fields = {**context, **fields}
+        self.logger.log(level, message, *args, extra={'fields': fields} if fields else None)
+    
+    def info(self, message, *args, **fields):
+        self._log(logging.INFO, message, args, fields)
+    
+    def error(self, message, *args, **fields):
+        self._log(logging.ERROR, message, args, fields)
+    
+    def warning(self, message, *args, **fields):
+        self._log(logging.WARNING, message, args, fields)
+    
+    def debug(self, message, *args, **fields):
+        self._log(logging.DEBUG, message, args, fields)
+
+class RootLogger(Logger):
     def __init__(self):
-        self.logger = logging.getLogger('BilibiliDownload')
+        super().__init__(ROOT_NAME)
         self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self._subsystems = {}
         
-        log_file = os.path.join(LOGS_DIR, f'bilibili_download_{datetime.now().strftime("%Y%m%d")}.log')
-        
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        file_handler.setLevel(logging.DEBUG)
+        self.file_handler = SizeAndTimeRotatingFileHandler(LOG_FILE)
+        self.file_handler.setLevel(logging.DEBUG)
         
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(logging.INFO)
+        self.console_handler = logging.StreamHandler()
+        self.console_handler.setLevel(logging.INFO)
         
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        console_handler.setFormatter(formatter)
+        formatter = logging.Formatter(TEXT_FORMAT)
+        self.file_handler.setFormatter(formatter)
+        self.console_handler.setFormatter(formatter)
         
-        self.logger.addHandler(file_handler)
-        self.logger.addHandler(console_handler)
+        self.queue_handler = DeferredQueueHandler(queue.Queue(QUEUE_SIZE))
+        self.queue_handler.dropped = 0
+        self.logger.addHandler(self.queue_handler)
+        self.listener = QueueListener(self.queue_handler.queue, self.file_handler, self.console_handler, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.flush)
     
-    def info(self, message):
-        self.logger.info(message)
+    def get(self, subsystem):
+        child = self._subsystems.get(subsystem)
+        if child is None:
+            child = self._subsystems[subsystem] = Logger(f'{ROOT_NAME}.{subsystem}')
+        return child
     
-    def error(self, message):
-        self.logger.error(message)
+    def set_console_level(self, level):
+        self.console_handler.setLevel(level)
     
-    def warning(self, message):
-        self.logger.warning(message)
+    def configure(self, settings):
+        if settings.get('log_format') == 'json':
+            self.file_handler.setFormatter(JsonFormatter())
+        self.file_handler.maxBytes = int(settings.get('log_max_mb', 10) * 1024 * 1024)
+        self.file_handler.backupCount = settings.get('log_backup_count', DEFAULT_BACKUP_COUNT)
+        rotate_seconds = int(settings.get('log_rotate_hours', 24) * 3600)
+        if rotate_seconds != self.file_handler.rotate_seconds:
+            self.file_handler.rotate_seconds = rotate_seconds
+            self.file_handler.rollover_at = time.time() + rotate_seconds if rotate_seconds else None
+        
+        self.set_level(settings.get('log_level', 'DEBUG'))
+        for subsystem, level in (settings.get('log_levels') or {}).items():
+            self.get(subsystem).set_level(level)
     
-    def debug(self, message):
-        self.logger.debug(message)
+    def flush(self):
+        if self.listener._thread is not None:
+            self.listener.stop()
+        if self.queue_handler.dropped:
+            self.file_handler.handle(logging.makeLogRecord({'name': ROOT_NAME, 'levelno': logging.WARNING, 'levelname': 'WARNING', 'msg': f'日志队列已满, 丢弃了 {self.queue_handler.dropped} 条日志'}))
+        self.file_handler.flush()
+
+logger = RootLogger()
 
-logger = Logger()
+def get_logger(subsystem):
+    return logger.get(subsystem)
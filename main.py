@@ -1,25 +1,92 @@
+import time
+
+STARTED = time.perf_counter()
+
 import sys
 import os
+import json
+from settings_manager import settings
+from single_instance import InstanceServer, forward_urls, INSTANCE_PORT
+from logger import logger
+
+def elapsed_ms():
+    return round((time.perf_counter() - STARTED) * 1000, 1)
 
-os.environ['QT_AUTO_SCREEN_SCALE_FACTOR'] = '1'
+def report_startup(timings):
+    timings['first_paint_ms'] = elapsed_ms()
+    logger.info('启动耗时: 导入 %sms, 创建窗口 %sms, 首次绘制 %sms', timings["import_ms"], timings["window_ms"], timings["first_paint_ms"])
+    
+    profile_file = os.environ.get('BILI_STARTUP_PROFILE')
+    if profile_file:
+        with open(profile_file, 'w', encoding='utf-8') as f:
+            json.dump(timings, f)
+        from PyQt5.QtWidgets import QApplication
+        QApplication.instance().quit()
 
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtCore import Qt
-from PyQt5.QtGui import QFont
-from main_window import MainWindow
+def hand_off(urls, port, token):
+    reply = forward_urls(urls, port, token)
+    if reply is None:
+        instance = InstanceServer(port=port, token=token)
+        if instance.acquire():
+            return instance, None
+        reply = forward_urls(urls, port, token)
+    if reply is None:
+        logger.warning('端口 %s 已被其他程序占用, 无法与已运行的实例通信, 以独立实例启动', port)
+    return None, reply
 
 def main():
+    urls = sys.argv[1:]
+    port = settings.get('instance_port', INSTANCE_PORT)
+    token = settings.get('daemon_token')
+    
+    instance, reply = hand_off(urls, port, token)
+    if reply is not None and reply.get('ok'):
+        sys.exit(0)
+    
+    trace_file = settings.get('trace_file')
+    if trace_file:
+        from tracing import tracer
+        tracer.enable()
+    
+    os.environ['QT_AUTO_SCREEN_SCALE_FACTOR'] = '1'
+    
+    from PyQt5.QtWidgets import QApplication, QMessageBox
+    from PyQt5.QtGui import QFont
+    from PyQt5.QtCore import QTimer
+    from main_window import MainWindow
+    timings = {'import_ms': elapsed_ms()}
+    
     app = QApplication(sys.argv)
     
+    if reply is not None:
+        QMessageBox.critical(None, '错误', f'程序已在运行, 但拒绝了本次请求: {reply.get("error")}\n请检查 daemon_token 设置。')
+        sys.exit(1)
+    
     app.setStyle('Fusion')
     
     font = QFont('Microsoft YaHei', 9)
     app.setFont(font)
     
     window = MainWindow()
+    timings['window_ms'] = elapsed_ms()
+    
+    if settings.get('metrics_port'):
+        from metrics import start_metrics_server
+        start_metrics_server(settings.get('metrics_port'), settings.get('metrics_host', '127.0.0.1'))
+    
     window.show()
+    QTimer.singleShot(0, lambda: report_startup(timings))
+    if urls:
+        window.external_urls.emit(urls)
+    if instance is not None:
+        instance.set_handler(window.external_urls.emit)
     
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    if instance is not None:
+        instance.close()
+    if trace_file:
+        tracer.export(trace_file)
+    sys.exit(exit_code)
 
 if __name__ == '__main__':
     main()
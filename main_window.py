@@ -1,19 +1,33 @@
 import sys
 import os
-import subprocess
+from collections import deque
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QPushButton, QLabel, QLineEdit, QTextEdit, QComboBox, 
                              QCheckBox, QFileDialog, QTableWidget, QTableWidgetItem, 
                              QHeaderView, QProgressBar, QMessageBox, QTabWidget,
-                             QGroupBox, QSplitter, QFrame, QButtonGroup, QRadioButton)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer
+                             QGroupBox, QSplitter, QFrame, QButtonGroup, QRadioButton,
+                             QDateTimeEdit)
+from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QDateTime
 from PyQt5.QtGui import QFont, QIcon, QPixmap
 from bilibili_api import api
-from download_manager import DownloadTask, download_manager
+from url_router import route_url
+from scheduling import PRIORITY_INTERACTIVE, PRIORITY_BULK
 from settings_manager import settings
 from logger import logger
 from config import VIDEO_FORMATS, AUDIO_FORMATS, QUALITY_OPTIONS
 
+PROGRESS_TABLE_LIMIT = 200
+FINISHED_HISTORY_LIMIT = 1000
+STATUS_LABELS = {
+    'pending': '等待中',
+    'downloading': '下载中',
+    'paused': '已暂停',
+    'completed': '已完成',
+    'error': '失败',
+    'stopped': '已停止',
+    'skipped': '已跳过'
+}
+
 class VideoInfoThread(QThread):
     info_received = pyqtSignal(dict)
     error_occurred = pyqtSignal(str)
@@ -32,28 +46,78 @@ class VideoInfoThread(QThread):
         except Exception as e:
             self.error_occurred.emit(str(e))
 
+class StartupCheckThread(QThread):
+    ffmpeg_checked = pyqtSignal(bool)
+    login_checked = pyqtSignal(bool)
+    
+    def __init__(self, check_ffmpeg=True):
+        super().__init__()
+        self.check_ffmpeg = check_ffmpeg
+    
+    def run(self):
+        if self.check_ffmpeg:
+            from download_manager import check_ffmpeg
+            self.ffmpeg_checked.emit(check_ffmpeg())
+        self.login_checked.emit(api.check_login())
+
+class LinkIngestThread(QThread):
+    batch_ready = pyqtSignal(list)
+    ingest_finished = pyqtSignal(dict)
+    
+    def __init__(self, file_path=None, urls=None):
+        super().__init__()
+        self.file_path = file_path
+        self.urls = urls or []
+    
+    def run(self):
+        from link_ingest import LinkIngester
+        ingester = LinkIngester()
+        try:
+            if self.file_path:
+                batches = ingester.ingest_file(self.file_path)
+            else:
+                batches = ingester.iter_batches(self.urls)
+            for batch in batches:
+                self.batch_ready.emit(batch)
+            self.ingest_finished.emit(ingester.stats)
+        except Exception as e:
+            logger.error('导入链接失败: %s', e)
+            self.ingest_finished.emit({'error': str(e)})
+
 class MainWindow(QMainWindow):
+    external_urls = pyqtSignal(list)
+    
     def __init__(self):
         super().__init__()
         self.current_video_info = None
         self.current_collection_info = None
         self.download_tasks = []
+        self.waiting_rows = deque()
+        self.finished_history = deque(maxlen=FINISHED_HISTORY_LIMIT)
+        self.added_count = 0
+        self.external_threads = []
+        self.check_threads = []
+        self.external_urls.connect(self.enqueue_external_urls)
         self.init_ui()
-        api.load_cookies()
         self.update_login_status()
-        self.check_ffmpeg()
+        self.start_startup_check()
+        QTimer.singleShot(0, self.restore_unfinished_tasks)
         
         self.timer = QTimer()
         self.timer.timeout.connect(self.update_download_progress)
         self.timer.start(500)
     
-    def check_ffmpeg(self):
-        try:
-            result = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True)
-            if result.returncode == 0:
-                return
-        except:
-            pass
+    def start_startup_check(self, check_ffmpeg=True):
+        thread = StartupCheckThread(check_ffmpeg)
+        thread.ffmpeg_checked.connect(self.on_ffmpeg_checked)
+        thread.login_checked.connect(lambda logged_in: self.update_login_status())
+        thread.finished.connect(lambda: self.check_threads.remove(thread))
+        self.check_threads.append(thread)
+        thread.start()
+    
+    def on_ffmpeg_checked(self, available):
+        if available:
+            return
         
         QMessageBox.warning(self, '警告', 
             'FFmpeg未安装或未添加到环境变量！\n\n'
@@ -76,22 +140,29 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(top_bar)
         
         tab_widget = QTabWidget()
+        self.tab_widget = tab_widget
         
         download_tab = self.create_download_tab()
-        trim_tab = self.create_trim_tab()
-        convert_tab = self.create_convert_tab()
-        rename_tab = self.create_rename_tab()
-        
         tab_widget.addTab(download_tab, '下载')
-        tab_widget.addTab(trim_tab, '裁剪工具')
-        tab_widget.addTab(convert_tab, '转换工具')
-        tab_widget.addTab(rename_tab, '批量重命名')
+        
+        self.lazy_tabs = {}
+        for title, builder in (('裁剪工具', self.create_trim_tab), ('转换工具', self.create_convert_tab), ('批量重命名', self.create_rename_tab)):
+            placeholder = QWidget()
+            placeholder_layout = QVBoxLayout(placeholder)
+            placeholder_layout.setContentsMargins(0, 0, 0, 0)
+            self.lazy_tabs[tab_widget.addTab(placeholder, title)] = builder
+        tab_widget.currentChanged.connect(self.build_lazy_tab)
         
         main_layout.addWidget(tab_widget)
         
         status_bar = self.create_status_bar()
         self.setStatusBar(status_bar)
     
+    def build_lazy_tab(self, index):
+        builder = self.lazy_tabs.pop(index, None)
+        if builder is not None:
+            self.tab_widget.widget(index).layout().addWidget(builder())
+    
     def create_top_bar(self):
         frame = QFrame()
         frame.setFrameShape(QFrame.StyledPanel)
@@ -212,6 +283,16 @@ class MainWindow(QMainWindow):
         self.download_retry_spinbox.setMaximumWidth(100)
         retry_layout.addWidget(retry_label)
         retry_layout.addWidget(self.download_retry_spinbox)
+        
+        self.deadline_checkbox = QCheckBox('按截止时间自动选择清晰度')
+        self.deadline_checkbox.toggled.connect(lambda checked: self.deadline_input.setEnabled(checked))
+        retry_layout.addWidget(self.deadline_checkbox)
+        
+        self.deadline_input = QDateTimeEdit(QDateTime.currentDateTime().addSecs(3600))
+        self.deadline_input.setDisplayFormat('yyyy-MM-dd HH:mm')
+        self.deadline_input.setCalendarPopup(True)
+        self.deadline_input.setEnabled(False)
+        retry_layout.addWidget(self.deadline_input)
         retry_layout.addStretch()
         
         button_layout = QHBoxLayout()
@@ -252,6 +333,9 @@ class MainWindow(QMainWindow):
         self.progress_table.verticalHeader().setVisible(False)
         progress_layout.addWidget(self.progress_table)
         
+        self.history_label = QLabel('')
+        progress_layout.addWidget(self.history_label)
+        
         progress_group.setLayout(progress_layout)
         
         bottom_widget = QWidget()
@@ -563,231 +647,314 @@ class MainWindow(QMainWindow):
             'Text Files (*.txt);;All Files (*)'
         )
         
-        if file_path:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    urls = f.read()
-                    self.url_input.setPlainText(urls)
-                    self.status_label.setText(f'已加载文件: {os.path.basename(file_path)}')
-            except Exception as e:
-                QMessageBox.critical(self, '错误', f'读取文件失败: {e}')
+        if not file_path:
+            return
+        
+        options = self.get_download_options()
+        if not self.ensure_output_path(options['output_path']):
+            return
+        
+        api.max_retries = options['retry_count']
+        self.ingest_options = options
+        self.apply_deadline(options)
+        
+        self.upload_button.setEnabled(False)
+        self.download_button.setEnabled(False)
+        self.status_label.setText(f'正在导入文件: {os.path.basename(file_path)}')
+        
+        self.ingest_thread = LinkIngestThread(file_path)
+        self.ingest_thread.batch_ready.connect(self.on_ingest_batch)
+        self.ingest_thread.ingest_finished.connect(self.on_ingest_finished)
+        self.ingest_thread.start()
+    
+    def on_ingest_batch(self, batch, options=None, priority=PRIORITY_BULK):
+        self.add_download_tasks(batch, options or self.ingest_options, priority)
+        self.status_label.setText(f'正在导入链接 (已添加 {self.added_count} 个任务)...')
+    
+    def enqueue_external_urls(self, urls):
+        self.setWindowState(self.windowState() & ~Qt.WindowMinimized)
+        self.raise_()
+        self.activateWindow()
+        if not urls:
+            return
+        
+        options = self.get_download_options()
+        if not self.ensure_output_path(options['output_path']):
+            return
+        
+        route = route_url(urls[0])
+        priority = PRIORITY_INTERACTIVE if len(urls) == 1 and route and route.kind == 'video' else PRIORITY_BULK
+        self.status_label.setText(f'收到 {len(urls)} 个外部链接, 正在获取视频信息...')
+        
+        thread = LinkIngestThread(urls=urls)
+        thread.batch_ready.connect(lambda batch: self.on_ingest_batch(batch, options, priority))
+        thread.ingest_finished.connect(lambda stats: self.on_external_finished(thread, stats))
+        self.external_threads.append(thread)
+        thread.start()
+    
+    def on_external_finished(self, thread, stats):
+        if thread in self.external_threads:
+            self.external_threads.remove(thread)
+        if 'error' in stats:
+            self.status_label.setText(f'导入外部链接失败: {stats["error"]}')
+            return
+        self.status_label.setText(
+            f'外部链接导入完成: 新增 {stats["videos"]} 个视频, 无效 {stats["invalid"]} 个'
+            + self.deadline_projection_text()
+        )
+    
+    def on_ingest_finished(self, stats):
+        self.upload_button.setEnabled(True)
+        self.download_button.setEnabled(True)
+        if 'error' in stats:
+            QMessageBox.critical(self, '错误', f'读取文件失败: {stats["error"]}')
+            return
+        self.status_label.setText(
+            f'导入完成: {stats["lines"]} 行, 新增 {stats["videos"]} 个视频, '
+            f'重复 {stats["duplicate"]} 个, 无效 {stats["invalid"]} 个'
+            + self.deadline_projection_text()
+        )
     
     def browse_path(self):
         directory = QFileDialog.getExistingDirectory(self, '选择保存目录', self.path_input.text())
         if directory:
             self.path_input.setText(directory)
     
-    def start_download(self):
-        urls = self.url_input.toPlainText().strip().split('\n')
-        urls = [url.strip() for url in urls if url.strip()]
-        
-        if not urls:
-            QMessageBox.warning(self, '警告', '请输入视频链接或上传txt文件')
-            return
+    def get_download_options(self):
+        try:
+            retry_count = int(self.download_retry_spinbox.text())
+        except:
+            retry_count = 3
         
-        output_path = self.path_input.text()
+        return {
+            'output_path': self.path_input.text(),
+            'quality': self.quality_combo.currentText(),
+            'format_type': self.format_combo.currentText(),
+            'download_cover': self.download_cover_checkbox.isChecked() and self.type_combo.currentText() == '视频',
+            'custom_filename': self.filename_input.text().strip() if self.filename_input.text().strip() else None,
+            'retry_count': retry_count
+        }
+    
+    def apply_deadline(self, options):
+        from download_manager import download_manager
+        options['deadline'] = self.deadline_checkbox.isChecked()
+        if options['deadline']:
+            deadline = self.deadline_input.dateTime().toSecsSinceEpoch()
+            download_manager.set_deadline(deadline, options['quality'])
+        elif download_manager.deadline_planner is not None:
+            download_manager.set_deadline(None)
+    
+    def deadline_projection_text(self):
+        from download_manager import download_manager
+        projection = download_manager.project_deadline()
+        if not projection:
+            return ''
+        finish = QDateTime.fromSecsSinceEpoch(int(projection['finish_time'])).toString('MM-dd HH:mm')
+        text = f', 预计总大小 {self.format_size(projection["total_bytes"])}, 预计完成 {finish}'
+        if not projection['on_schedule']:
+            text += ' (无法按时完成)'
+        return text
+    
+    def ensure_output_path(self, output_path):
         if not os.path.exists(output_path):
             try:
                 os.makedirs(output_path)
             except Exception as e:
                 QMessageBox.critical(self, '错误', f'无法创建目录: {e}')
-                return
+                return False
+        return True
+    
+    def add_download_tasks(self, batch, options, priority=None):
+        from download_manager import DownloadTask, download_manager
+        tasks = []
+        for video_info in batch:
+            task = DownloadTask(
+                video_info,
+                options['output_path'],
+                options['quality'],
+                options['format_type'],
+                options['download_cover'],
+                options['custom_filename'],
+                options['retry_count']
+            )
+            self.add_task_row(task)
+            tasks.append(task)
+        download_manager.add_tasks(tasks, priority, options.get('deadline', False))
+        return tasks
+    
+    def add_task_row(self, task):
+        self.added_count += 1
+        task.progress_callback = self.on_task_progress
+        task.complete_callback = self.on_task_complete
+        task.error_callback = self.on_task_error
+        
+        if len(self.download_tasks) >= PROGRESS_TABLE_LIMIT:
+            self.move_finished_rows()
+        if len(self.download_tasks) >= PROGRESS_TABLE_LIMIT:
+            self.waiting_rows.append(task)
+            self.update_history_label()
+            return
+        self.insert_task_row(task)
+    
+    def insert_task_row(self, task):
+        self.download_tasks.append(task)
+        
+        row = self.progress_table.rowCount()
+        self.progress_table.insertRow(row)
+        self.progress_table.setItem(row, 0, QTableWidgetItem(task.title))
+        self.progress_table.setItem(row, 1, QTableWidgetItem(STATUS_LABELS.get(task.status, task.status)))
+        self.progress_table.setItem(row, 2, QTableWidgetItem('0%'))
+        self.progress_table.setItem(row, 3, QTableWidgetItem('0 MB'))
+        self.progress_table.setItem(row, 4, QTableWidgetItem('0 MB'))
+        self.progress_table.setItem(row, 5, QTableWidgetItem('0'))
+        self.progress_table.setItem(row, 6, QTableWidgetItem(''))
+    
+    def move_finished_rows(self):
+        from download_manager import TaskRecord
+        for row in range(len(self.download_tasks) - 1, -1, -1):
+            task = self.download_tasks[row]
+            if isinstance(task, TaskRecord):
+                self.finished_history.append(task)
+                del self.download_tasks[row]
+                self.progress_table.removeRow(row)
+        
+        while self.waiting_rows and len(self.download_tasks) < PROGRESS_TABLE_LIMIT:
+            self.insert_task_row(self.waiting_rows.popleft())
+        self.update_history_label()
+    
+    def update_history_label(self):
+        parts = []
+        if self.waiting_rows:
+            parts.append(f'另有 {len(self.waiting_rows)} 个任务排队中, 列表有空位时显示')
+        if self.finished_history:
+            parts.append(f'最近完成的 {len(self.finished_history)} 个任务已移入历史记录')
+        self.history_label.setText(', '.join(parts))
+    
+    def task_row(self, task):
+        for row, row_task in enumerate(self.download_tasks):
+            if row_task is task:
+                return row
+        return None
+    
+    def set_cell(self, row, column, text):
+        item = self.progress_table.item(row, column)
+        if item is None:
+            self.progress_table.setItem(row, column, QTableWidgetItem(text))
+        elif item.text() != text:
+            item.setText(text)
+    
+    def update_task_cells(self, row, task):
+        self.set_cell(row, 1, STATUS_LABELS.get(task.status, task.status))
+        self.set_cell(row, 2, f'{task.progress:.1f}%')
+        self.set_cell(row, 3, self.format_size(task.downloaded_size))
+        self.set_cell(row, 4, self.format_size(task.total_size))
+        self.set_cell(row, 5, self.format_speed(task.speed))
+        self.set_cell(row, 6, self.format_time(task.eta))
+    
+    def restore_unfinished_tasks(self):
+        if not settings.get('auto_resume', True):
+            return
         
-        quality = self.quality_combo.currentText()
-        format_type = self.format_combo.currentText()
-        download_type = self.type_combo.currentText()
-        download_cover = self.download_cover_checkbox.isChecked()
-        custom_filename = self.filename_input.text().strip() if self.filename_input.text().strip() else None
+        from download_manager import download_manager
+        tasks = download_manager.restore_tasks()
+        for task in tasks:
+            self.add_task_row(task)
+            download_manager.add_task(task)
         
-        try:
-            retry_count = int(self.download_retry_spinbox.text())
-        except:
-            retry_count = 3
+        if tasks:
+            self.status_label.setText(f'已恢复 {len(tasks)} 个未完成的下载任务')
+    
+    def start_download(self):
+        urls = self.url_input.toPlainText().strip().split('\n')
+        urls = [url.strip() for url in urls if url.strip()]
         
-        api.max_retries = retry_count
+        if not urls:
+            QMessageBox.warning(self, '警告', '请输入视频链接或上传txt文件')
+            return
+        
+        options = self.get_download_options()
+        if not self.ensure_output_path(options['output_path']):
+            return
+        
+        api.max_retries = options['retry_count']
+        self.apply_deadline(options)
         
         self.download_tasks = []
+        self.waiting_rows.clear()
+        self.added_count = 0
         self.progress_table.setRowCount(0)
         
-        import time
+        route = route_url(urls[0])
+        priority = PRIORITY_INTERACTIVE if len(urls) == 1 and route and route.kind == 'video' else None
         
-        for i, url in enumerate(urls, 1):
-            self.status_label.setText(f'正在获取视频信息 ({i}/{len(urls)})...')
-            QApplication.processEvents()
-            
-            collection_info = api.get_collection_info(url)
-            if collection_info and collection_info.get('is_collection'):
-                videos = collection_info.get('videos', [])
-                self.status_label.setText(f'合集 "{collection_info.get("title")}" 包含 {len(videos)} 个视频')
-                logger.info(f'合集 "{collection_info.get("title")}" 包含 {len(videos)} 个视频')
-                QApplication.processEvents()
-                
-                for video in videos:
-                    video_url = f'https://www.bilibili.com/video/{video["bvid"]}'
-                    logger.info(f'处理合集视频: {video["title"]} ({video_url})')
-                    video_info = api.get_video_info(video_url)
-                    if video_info:
-                        task = DownloadTask(
-                            video_info,
-                            output_path,
-                            quality,
-                            format_type,
-                            download_cover and download_type == '视频',
-                            custom_filename,
-                            retry_count,
-                            skip_exists_check=True
-                        )
-                        self.download_tasks.append(task)
-                        
-                        row = self.progress_table.rowCount()
-                        self.progress_table.insertRow(row)
-                        self.progress_table.setItem(row, 0, QTableWidgetItem(task.title))
-                        self.progress_table.setItem(row, 1, QTableWidgetItem('等待中'))
-                        self.progress_table.setItem(row, 2, QTableWidgetItem('0%'))
-                        self.progress_table.setItem(row, 3, QTableWidgetItem('0 MB'))
-                        self.progress_table.setItem(row, 4, QTableWidgetItem('0 MB'))
-                        self.progress_table.setItem(row, 5, QTableWidgetItem('0'))
-                        self.progress_table.setItem(row, 6, QTableWidgetItem(''))
-                        
-                        task.progress_callback = lambda t, r=row: self.on_task_progress(t, r)
-                        task.complete_callback = lambda t, r=row: self.on_task_complete(t, r)
-                        task.error_callback = lambda t, r=row: self.on_task_error(t, r)
-                        
-                        download_manager.add_task(task)
-                    else:
-                        logger.error(f'无法获取合集视频信息: {video_url}')
-            else:
-                logger.info(f'获取视频信息: {url}')
-                video_info = api.get_video_info(url)
-                if video_info:
-                    if video_info.get('is_multi_page', False):
-                        pages = video_info.get('pages', [])
-                        self.status_label.setText(f'视频 "{video_info.get("title")}" 包含 {len(pages)} 个分集')
-                        logger.info(f'视频 "{video_info.get("title")}" 包含 {len(pages)} 个分集')
-                        QApplication.processEvents()
-                        
-                        for page in pages:
-                            page_info = video_info.copy()
-                            page_info['cid'] = page.get('cid')
-                            page_info['title'] = f"{video_info.get('title')} - {page.get('part')}"
-                            page_info['is_multi_page'] = False
-                            
-                            task = DownloadTask(
-                                page_info,
-                                output_path,
-                                quality,
-                                format_type,
-                                download_cover and download_type == '视频',
-                                custom_filename,
-                                retry_count,
-                                skip_exists_check=True
-                            )
-                            self.download_tasks.append(task)
-                            
-                            row = self.progress_table.rowCount()
-                            self.progress_table.insertRow(row)
-                            self.progress_table.setItem(row, 0, QTableWidgetItem(task.title))
-                            self.progress_table.setItem(row, 1, QTableWidgetItem('等待中'))
-                            self.progress_table.setItem(row, 2, QTableWidgetItem('0%'))
-                            self.progress_table.setItem(row, 3, QTableWidgetItem('0 MB'))
-                            self.progress_table.setItem(row, 4, QTableWidgetItem('0 MB'))
-                            self.progress_table.setItem(row, 5, QTableWidgetItem('0'))
-                            self.progress_table.setItem(row, 6, QTableWidgetItem(''))
-                            
-                            task.progress_callback = lambda t, r=row: self.on_task_progress(t, r)
-                            task.complete_callback = lambda t, r=row: self.on_task_complete(t, r)
-                            task.error_callback = lambda t, r=row: self.on_task_error(t, r)
-                            
-                            download_manager.add_task(task)
-                    else:
-                        task = DownloadTask(
-                            video_info,
-                            output_path,
-                            quality,
-                            format_type,
-                            download_cover and download_type == '视频',
-                            custom_filename,
-                            retry_count,
-                            skip_exists_check=True
-                        )
-                        self.download_tasks.append(task)
-                        
-                        row = self.progress_table.rowCount()
-                        self.progress_table.insertRow(row)
-                        self.progress_table.setItem(row, 0, QTableWidgetItem(task.title))
-                        self.progress_table.setItem(row, 1, QTableWidgetItem('等待中'))
-                        self.progress_table.setItem(row, 2, QTableWidgetItem('0%'))
-                        self.progress_table.setItem(row, 3, QTableWidgetItem('0 MB'))
-                        self.progress_table.setItem(row, 4, QTableWidgetItem('0 MB'))
-                        self.progress_table.setItem(row, 5, QTableWidgetItem('0'))
-                        
-                        task.progress_callback = lambda t, r=row: self.on_task_progress(t, r)
-                        task.complete_callback = lambda t, r=row: self.on_task_complete(t, r)
-                        task.error_callback = lambda t, r=row: self.on_task_error(t, r)
-                        
-                        download_manager.add_task(task)
-                else:
-                    logger.error(f'无法获取视频信息: {url}')
-            
-            if i < len(urls):
-                time.sleep(2)
+        self.upload_button.setEnabled(False)
+        self.download_button.setEnabled(False)
+        self.status_label.setText(f'正在获取视频信息 (共 {len(urls)} 个链接)...')
         
-        self.status_label.setText(f'已添加 {len(self.download_tasks)} 个下载任务')
+        self.ingest_thread = LinkIngestThread(urls=urls)
+        self.ingest_thread.batch_ready.connect(lambda batch: self.on_ingest_batch(batch, options, priority))
+        self.ingest_thread.ingest_finished.connect(self.on_download_ingest_finished)
+        self.ingest_thread.start()
+    
+    def on_download_ingest_finished(self, stats):
+        self.upload_button.setEnabled(True)
+        self.download_button.setEnabled(True)
+        if 'error' in stats:
+            self.status_label.setText(f'获取视频信息失败: {stats["error"]}')
+            return
+        self.status_label.setText(f'已添加 {self.added_count} 个下载任务' + self.deadline_projection_text())
     
     def update_download_progress(self):
-        for i, task in enumerate(self.download_tasks):
-            if i < self.progress_table.rowCount():
-                status_map = {
-                    'pending': '等待中',
-                    'downloading': '下载中',
-                    'paused': '已暂停',
-                    'completed': '已完成',
-                    'error': '失败',
-                    'stopped': '已停止',
-                    'skipped': '已跳过'
-                }
-                
-                self.progress_table.setItem(i, 1, QTableWidgetItem(status_map.get(task.status, task.status)))
-                self.progress_table.setItem(i, 2, QTableWidgetItem(f'{task.progress:.1f}%'))
-                self.progress_table.setItem(i, 3, QTableWidgetItem(self.format_size(task.downloaded_size)))
-                self.progress_table.setItem(i, 4, QTableWidgetItem(self.format_size(task.total_size)))
-                self.progress_table.setItem(i, 5, QTableWidgetItem(self.format_speed(task.speed)))
-                self.progress_table.setItem(i, 6, QTableWidgetItem(self.format_time(task.eta)))
-                
-                self.update_operation_button(i, task)
+        from download_manager import TaskRecord
+        finished = False
+        for row, task in enumerate(self.download_tasks):
+            if isinstance(task, TaskRecord):
+                continue
+            
+            self.update_task_cells(row, task)
+            self.update_operation_button(row, task)
+            
+            if task.status in ('completed', 'skipped'):
+                self.download_tasks[row] = TaskRecord(task)
+                finished = True
+        
+        if finished and self.waiting_rows:
+            self.move_finished_rows()
     
     def update_operation_button(self, row, task):
+        label = {'downloading': '停止', 'error': '重新下载'}.get(task.status)
+        button = self.progress_table.cellWidget(row, 7)
+        if (button.text() if button else None) == label:
+            return
+        
         if task.status == 'downloading':
             stop_button = QPushButton('停止')
-            stop_button.clicked.connect(lambda _, r=row: self.stop_download_task(r))
+            stop_button.clicked.connect(lambda _, t=task: self.stop_download_task(t))
             self.progress_table.setCellWidget(row, 7, stop_button)
         elif task.status == 'error':
             retry_button = QPushButton('重新下载')
-            retry_button.clicked.connect(lambda _, r=row: self.retry_download_task(r))
+            retry_button.clicked.connect(lambda _, t=task: self.retry_download_task(t))
             self.progress_table.setCellWidget(row, 7, retry_button)
         else:
             self.progress_table.setCellWidget(row, 7, None)
     
-    def stop_download_task(self, row):
-        if row < len(self.download_tasks):
-            task = self.download_tasks[row]
-            if task.status == 'downloading':
-                task.stop()
-                logger.info(f'停止下载: {task.title}')
+    def stop_download_task(self, task):
+        if task.status == 'downloading':
+            task.stop()
+            logger.info('停止下载: %s', task.title)
     
-    def retry_download_task(self, row):
-        if row < len(self.download_tasks):
-            task = self.download_tasks[row]
-            if task.status == 'error':
-                task.status = 'pending'
-                task.progress = 0
-                task.downloaded_size = 0
-                task.speed = 0
-                task.eta = 0
-                task.error = None
-                task.skip_exists_check = False
-                download_manager.add_task(task)
-                logger.info(f'重新下载: {task.title}')
+    def retry_download_task(self, task):
+        from download_manager import download_manager
+        if task.status == 'error':
+            task.status = 'pending'
+            task.progress = 0
+            task.downloaded_size = 0
+            task.speed = 0
+            task.eta = 0
+            task.error = None
+            task.skip_exists_check = False
+            download_manager.add_task(task)
+            logger.info('重新下载: %s', task.title)
     
     def format_size(self, size):
         for unit in ['B', 'KB', 'MB', 'GB']:
@@ -811,55 +978,33 @@ class MainWindow(QMainWindow):
         else:
             return f'{minutes:02d}:{seconds:02d}'
     
-    def on_task_progress(self, task, row):
-        if row < self.progress_table.rowCount():
-            status_map = {
-                'pending': '等待中',
-                'downloading': '下载中',
-                'paused': '已暂停',
-                'completed': '已完成',
-                'error': '失败',
-                'stopped': '已停止',
-                'skipped': '已跳过'
-            }
-            
-            self.progress_table.setItem(row, 1, QTableWidgetItem(status_map.get(task.status, task.status)))
-            self.progress_table.setItem(row, 2, QTableWidgetItem(f'{task.progress:.1f}%'))
-            self.progress_table.setItem(row, 3, QTableWidgetItem(self.format_size(task.downloaded_size)))
-            self.progress_table.setItem(row, 4, QTableWidgetItem(self.format_size(task.total_size)))
-            self.progress_table.setItem(row, 5, QTableWidgetItem(self.format_speed(task.speed)))
-            self.progress_table.setItem(row, 6, QTableWidgetItem(self.format_time(task.eta)))
+    def on_task_progress(self, task):
+        row = self.task_row(task)
+        if row is not None:
+            self.update_task_cells(row, task)
     
-    def on_task_complete(self, task, row):
-        if task in download_manager.active_tasks:
-            download_manager.active_tasks.remove(task)
-        
+    def on_task_complete(self, task):
+        row = self.task_row(task)
         if task.status == 'completed':
-            if row < self.progress_table.rowCount():
-                self.progress_table.setItem(row, 1, QTableWidgetItem('已完成'))
-                self.progress_table.setItem(row, 2, QTableWidgetItem('100%'))
+            if row is not None:
+                self.set_cell(row, 1, '已完成')
+                self.set_cell(row, 2, '100%')
             logger.info(f'下载完成: {task.title}')
         elif task.status == 'skipped':
-            if row < self.progress_table.rowCount():
-                self.progress_table.setItem(row, 1, QTableWidgetItem('已跳过'))
-                self.progress_table.setItem(row, 2, QTableWidgetItem('100%'))
+            if row is not None:
+                self.set_cell(row, 1, '已跳过')
+                self.set_cell(row, 2, '100%')
             logger.info(f'下载跳过: {task.title}')
         elif task.status == 'error':
-            if row < self.progress_table.rowCount():
-                self.progress_table.setItem(row, 1, QTableWidgetItem('失败'))
+            if row is not None:
+                self.set_cell(row, 1, '失败')
             logger.error(f'下载失败: {task.title}, 错误: {task.error}')
-        
-        download_manager._process_queue()
     
-    def on_task_error(self, task, row):
-        if task in download_manager.active_tasks:
-            download_manager.active_tasks.remove(task)
-        
-        if row < self.progress_table.rowCount():
-            self.progress_table.setItem(row, 1, QTableWidgetItem('失败'))
+    def on_task_error(self, task):
+        row = self.task_row(task)
+        if row is not None:
+            self.set_cell(row, 1, '失败')
         logger.error(f'下载失败: {task.title}, 错误: {task.error}')
-        
-        download_manager._process_queue()
     
     def clear_inputs(self):
         self.url_input.clear()
@@ -874,6 +1019,7 @@ class MainWindow(QMainWindow):
         dialog = LoginDialog(self)
         if dialog.exec_() == LoginDialog.Accepted:
             self.update_login_status()
+            self.start_startup_check(check_ffmpeg=False)
     
     def show_settings_dialog(self):
         from settings_dialog import SettingsDialog
@@ -1060,6 +1206,7 @@ class MainWindow(QMainWindow):
             self.rename_table.setCellWidget(row, 3, None)
     
     def execute_rename(self):
+        from library import library
         if not hasattr(self, 'rename_files') or not self.rename_files:
             QMessageBox.warning(self, '警告', '没有需要重命名的文件')
             return
@@ -1088,6 +1235,7 @@ class MainWindow(QMainWindow):
             
             try:
                 os.rename(old_path, new_path)
+                library.rename(old_path, new_path)
                 self.rename_table.setItem(i, 2, QTableWidgetItem('成功'))
                 self.rename_table.setCellWidget(i, 3, None)
                 success_count += 1
@@ -1116,12 +1264,11 @@ class MainWindow(QMainWindow):
     
     def update_login_status(self):
         if api.is_logged_in:
-            user_info = api.get_user_info()
-            if user_info:
-                self.login_button.setText(f'{user_info.get("name", "已登录")}')
+            if api.user_name:
+                self.login_button.setText(api.user_name)
                 self.login_button.setVisible(False)
                 self.logout_button.setVisible(True)
-                self.status_label.setText(f'已登录: {user_info.get("name", "")}')
+                self.status_label.setText(f'已登录: {api.user_name}')
             else:
                 self.login_button.setText('已登录')
                 self.login_button.setVisible(False)
@@ -0,0 +1,133 @@
+import hashlib
+import os
+import shutil
+from logger import get_logger
+from config import DATA_DIR
+from settings_manager import settings
+from library import library
+
+logger = get_logger('download')
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+FICLONE = 0x40049409
+MEDIA_STORE_DIR = os.path.join(DATA_DIR, 'media')
+
+def media_key(cid, quality, codec, format_type):
+    return hashlib.sha1(f'{cid}:{quality}:{codec}:{format_type}'.encode('utf-8')).hexdigest()
+
+def reflink(source, target):
+    if fcntl is None:
+        return False
+    with open(source, 'rb') as src, open(target, 'xb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            cloned = False
+        else:
+            cloned = True
+    if not cloned:
+        os.remove(target)
+        return False
+    shutil.copystat(source, target)
+    return True
+
+def clone_file(source, target):
+    if reflink(source, target):
+        return 'reflink'
+    shutil.copy2(source, target)
+    return 'copy'
+
+def clone_replace(source, target):
+    temp_target = f'{target}.{os.getpid()}.tmp'
+    if os.path.exists(temp_target):
+        os.remove(temp_target)
+    try:
+        method = clone_file(source, temp_target)
+        os.replace(temp_target, target)
+    except OSError:
+        if os.path.exists(temp_target):
+            os.remove(temp_target)
+        raise
+    return method
+
+class MediaStore:
+    def __init__(self, store_dir=MEDIA_STORE_DIR):
+        self.store_dir = store_dir
+        os.makedirs(store_dir, exist_ok=True)
+    
+    def _path(self, key, format_type):
+        return os.path.join(self.store_dir, key[:2], f'{key}.{format_type}')
+    
+    def lookup(self, key, format_type):
+        path = self._path(key, format_type)
+        try:
+            if os.path.getsize(path) > 0:
+                return path
+        except OSError:
+            pass
+        return None
+    
+    def add(self, key, format_type, source):
+        path = self._path(key, format_type)
+        if os.path.exists(path):
+            return True
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            method = clone_replace(source, path)
+        except OSError as e:
+            logger.error('加入本地媒体库失败: %s, %s', source, e)
+            return False
+        library.record_store_entry(key, format_type, method, os.path.getsize(path))
+        return True
+    
+    def materialize(self, key, format_type, target):
+        path = self.lookup(key, format_type)
+        if path is None:
+            return False
+        
+        try:
+            method = clone_replace(path, target)
+        except OSError as e:
+            logger.error('从本地媒体库复制失败: %s, %s', target, e)
+            return False
+        logger.info('从本地媒体库复用 (%s): %s', method, target)
+        return True
+    
+    def prune(self):
+        referenced = library.referenced_store_keys()
+        kept = set()
+        removed = 0
+        for key, format_type, _ in library.store_entries():
+            path = self._path(key, format_type)
+            if (key, format_type) in referenced:
+                kept.add(path)
+                continue
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.error('清理本地媒体库失败: %s, %s', path, e)
+                continue
+            library.remove_store_entry(key, format_type)
+            removed += 1
+        
+        for root, _, files in os.walk(self.store_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if path in kept:
+                    continue
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError as e:
+                    logger.error('清理本地媒体库失败: %s, %s', path, e)
+        if removed:
+            logger.info('清理本地媒体库: 删除了 %s 个未被引用的文件', removed)
+        return removed
+
+media_store = MediaStore(settings.get('media_store_dir') or MEDIA_STORE_DIR)
@@ -0,0 +1,186 @@
+import heapq
+import itertools
+from collections import OrderedDict
+
+PRIORITY_BULK = 0
+PRIORITY_NORMAL = 10
+PRIORITY_INTERACTIVE = 100
+
+class PriorityPolicy:
+    name = 'priority'
+    
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+    
+    def _sort_key(self, task):
+        return (-task.priority,)
+    
+    def push(self, task, seq=None):
+        uid = next(self._counter)
+        if seq is None:
+            seq = uid
+        entry = [*self._sort_key(task), seq, uid, task]
+        self._entries[task] = entry
+        heapq.heappush(self._heap, entry)
+    
+    def pop(self):
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            task = entry[-1]
+            if task is not None:
+                del self._entries[task]
+                return task
+        raise IndexError('pop from empty queue')
+    
+    def peek(self):
+        while self._heap and self._heap[0][-1] is None:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            raise IndexError('peek from empty queue')
+        return self._heap[0][-1]
+    
+    def peek_n(self, count):
+        entries = heapq.nsmallest(count, (entry for entry in self._heap if entry[-1] is not None))
+        return [entry[-1] for entry in entries]
+    
+    def remove(self, task):
+        entry = self._entries.pop(task, None)
+        if entry is None:
+            return False
+        entry[-1] = None
+        return True
+    
+    def reprioritize(self, task, priority):
+        entry = self._entries.get(task)
+        task.priority = priority
+        if entry is None:
+            return False
+        self.remove(task)
+        self.push(task, entry[-3])
+        return True
+    
+    def __len__(self):
+        return len(self._entries)
+    
+    def __bool__(self):
+        return bool(self._entries)
+    
+    def __contains__(self, task):
+        return task in self._entries
+    
+    def __iter__(self):
+        entries = sorted(entry for entry in self._heap if entry[-1] is not None)
+        return iter([entry[-1] for entry in entries])
+
+class FifoPolicy(PriorityPolicy):
+    name = 'fifo'
+    
+    def _sort_key(self, task):
+        return ()
+
+class ShortestJobFirstPolicy(PriorityPolicy):
+    name = 'sjf'
+    
+    def _sort_key(self, task):
+        return (-task.priority, task.expected_size or 0)
+
+class FairSharePolicy:
+    name = 'fair'
+    
+    def __init__(self):
+        self._groups = OrderedDict()
+        self._task_groups = {}
+        self._counter = itertools.count()
+    
+    def push(self, task, seq=None):
+        group = task.group or ''
+        queue = self._groups.get(group)
+        if queue is None:
+            queue = self._groups[group] = PriorityPolicy()
+        queue.push(task, next(self._counter) if seq is None else seq)
+        self._task_groups[task] = group
+    
+    def _best_group(self):
+        best_group = None
+        best_priority = None
+        for group, queue in self._groups.items():
+            priority = queue.peek().priority
+            if best_priority is None or priority > best_priority:
+                best_group = group
+                best_priority = priority
+        return best_group
+    
+    def peek(self):
+        if not self._task_groups:
+            raise IndexError('peek from empty queue')
+        return self._groups[self._best_group()].peek()
+    
+    def peek_n(self, count):
+        heads = OrderedDict((group, queue.peek_n(count)) for group, queue in self._groups.items())
+        tasks = []
+        while heads and len(tasks) < count:
+            best_group = None
+            best_priority = None
+            for group, queue in heads.items():
+                priority = queue[0].priority
+                if best_priority is None or priority > best_priority:
+                    best_group = group
+                    best_priority = priority
+            queue = heads.pop(best_group)
+            tasks.append(queue.pop(0))
+            if queue:
+                heads[best_group] = queue
+        return tasks
+    
+    def pop(self):
+        if not self._task_groups:
+            raise IndexError('pop from empty queue')
+        
+        best_group = self._best_group()
+        queue = self._groups.pop(best_group)
+        task = queue.pop()
+        del self._task_groups[task]
+        if queue:
+            self._groups[best_group] = queue
+        return task
+    
+    def remove(self, task):
+        group = self._task_groups.pop(task, None)
+        if group is None:
+            return False
+        queue = self._groups[group]
+        queue.remove(task)
+        if not queue:
+            del self._groups[group]
+        return True
+    
+    def reprioritize(self, task, priority):
+        group = self._task_groups.get(task)
+        task.priority = priority
+        if group is None:
+            return False
+        return self._groups[group].reprioritize(task, priority)
+    
+    def __len__(self):
+        return len(self._task_groups)
+    
+    def __bool__(self):
+        return bool(self._task_groups)
+    
+    def __contains__(self, task):
+        return task in self._task_groups
+    
+    def __iter__(self):
+        return iter([task for queue in self._groups.values() for task in queue])
+
+SCHEDULING_POLICIES = {
+    'fifo': FifoPolicy,
+    'priority': PriorityPolicy,
+    'sjf': ShortestJobFirstPolicy,
+    'fair': FairSharePolicy
+}
+
+def create_policy(name):
+    return SCHEDULING_POLICIES.get(name, PriorityPolicy)()
@@ -2,8 +2,16 @@ from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
                              QLineEdit, QComboBox, QSpinBox, QPushButton, 
                              QFormLayout, QGroupBox, QCheckBox, QMessageBox)
 from settings_manager import settings
+from download_manager import download_manager
 from config import VIDEO_FORMATS, AUDIO_FORMATS, QUALITY_OPTIONS
 
+SCHEDULING_POLICY_LABELS = {
+    'priority': '优先级',
+    'fifo': '先进先出',
+    'sjf': '短任务优先',
+    'fair': 'UP主/合集轮转'
+}
+
 class SettingsDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -12,7 +20,7 @@ class SettingsDialog(QDialog):
     
     def init_ui(self):
         self.setWindowTitle('设置')
-        self.setFixedSize(500, 400)
+        self.setFixedSize(500, 460)
         
         layout = QVBoxLayout(self)
         
@@ -45,6 +53,11 @@ class SettingsDialog(QDialog):
         self.max_downloads_spin.setValue(5)
         download_layout.addRow('最大同时下载数:', self.max_downloads_spin)
         
+        self.policy_combo = QComboBox()
+        for name, label in SCHEDULING_POLICY_LABELS.items():
+            self.policy_combo.addItem(label, name)
+        download_layout.addRow('调度策略:', self.policy_combo)
+        
         download_group.setLayout(download_layout)
         layout.addWidget(download_group)
         
@@ -57,6 +70,9 @@ class SettingsDialog(QDialog):
         self.auto_resume_checkbox = QCheckBox('自动断点续传')
         other_layout.addWidget(self.auto_resume_checkbox)
         
+        self.adaptive_checkbox = QCheckBox('自适应并发（根据吞吐量和限流自动调整同时下载数）')
+        other_layout.addWidget(self.adaptive_checkbox)
+        
         other_group.setLayout(other_layout)
         layout.addWidget(other_group)
         
@@ -82,8 +98,10 @@ class SettingsDialog(QDialog):
         self.video_format_combo.setCurrentText(settings.get('default_video_format'))
         self.audio_format_combo.setCurrentText(settings.get('default_audio_format'))
         self.max_downloads_spin.setValue(settings.get('max_concurrent_downloads'))
+        self.policy_combo.setCurrentIndex(max(0, self.policy_combo.findData(settings.get('scheduling_policy'))))
         self.download_cover_checkbox.setChecked(settings.get('download_cover'))
         self.auto_resume_checkbox.setChecked(settings.get('auto_resume'))
+        self.adaptive_checkbox.setChecked(settings.get('adaptive_concurrency'))
     
     def save_settings(self):
         settings.set('default_download_path', self.path_input.text())
@@ -93,6 +111,11 @@ class SettingsDialog(QDialog):
         settings.set('max_concurrent_downloads', self.max_downloads_spin.value())
         settings.set('download_cover', self.download_cover_checkbox.isChecked())
         settings.set('auto_resume', self.auto_resume_checkbox.isChecked())
+        settings.set('scheduling_policy', self.policy_combo.currentData())
+        settings.set('adaptive_concurrency', self.adaptive_checkbox.isChecked())
+        download_manager.set_max_concurrent(self.max_downloads_spin.value())
+        download_manager.set_policy(self.policy_combo.currentData())
+        download_manager.set_adaptive(self.adaptive_checkbox.isChecked())
         
         QMessageBox.information(self, '成功', '设置已保存')
         self.accept()
@@ -10,7 +10,30 @@ DEFAULT_CONFIG = {
     'default_audio_format': 'mp3',
     'max_concurrent_downloads': 5,
     'download_cover': True,
-    'auto_resume': True
+    'auto_resume': True,
+    'space_sync_interval': 3600,
+    'scheduling_policy': 'priority',
+    'adaptive_concurrency': False,
+    'adaptive_max_concurrent': 16,
+    'task_history_limit': 200,
+    'min_free_space_mb': 1024,
+    'preallocate_files': True,
+    'deadline_initial_throughput_mb': 2,
+    'video_codec': 'smallest',
+    'media_store_dir': None,
+    'daemon_host': '127.0.0.1',
+    'daemon_port': 8765,
+    'daemon_token': None,
+    'instance_port': 8764,
+    'metrics_host': '127.0.0.1',
+    'metrics_port': None,
+    'trace_file': None,
+    'log_level': 'DEBUG',
+    'log_levels': {},
+    'log_format': 'text',
+    'log_max_mb': 10,
+    'log_rotate_hours': 24,
+    'log_backup_count': 7
 }
 
 class SettingsManager:
@@ -55,3 +78,4 @@ class SettingsManager:
         self.save_config()
 
 settings = SettingsManager()
+logger.configure(settings)
@@ -0,0 +1,101 @@
+import json
+import os
+import socket
+import threading
+
+INSTANCE_HOST = '127.0.0.1'
+INSTANCE_PORT = 8764
+CONNECT_TIMEOUT = 0.5
+
+def forward_urls(urls, port=INSTANCE_PORT, token=None, timeout=CONNECT_TIMEOUT):
+    try:
+        with socket.create_connection((INSTANCE_HOST, port), timeout=timeout) as conn:
+            conn.sendall(json.dumps({'urls': list(urls), 'token': token}, ensure_ascii=False).encode('utf-8') + b'\n')
+            reply = conn.makefile('rb').readline()
+    except OSError:
+        return None
+    try:
+        return json.loads(reply.decode('utf-8'))
+    except ValueError:
+        return None
+
+class InstanceServer:
+    def __init__(self, handler=None, port=INSTANCE_PORT, token=None):
+        self.handler = handler
+        self.port = port
+        self.token = token
+        self._lock = threading.Lock()
+        self._pending = []
+        self._socket = None
+        self._thread = None
+    
+    def acquire(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if os.name == 'nt':
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((INSTANCE_HOST, self.port))
+        except OSError:
+            sock.close()
+            return False
+        sock.listen(16)
+        self._socket = sock
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+        return True
+    
+    def set_handler(self, handler):
+        with self._lock:
+            self.handler = handler
+            if self._pending:
+                handler(self._pending)
+                self._pending = []
+    
+    def _dispatch(self, urls):
+        with self._lock:
+            if self.handler is None:
+                self._pending.extend(urls)
+            else:
+                self.handler(urls)
+    
+    def _accept_loop(self):
+        while self._socket is not None:
+            try:
+                conn, _ = self._socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+    
+    def _serve(self, conn):
+        from logger import logger
+        
+        with conn:
+            conn.settimeout(5)
+            try:
+                request = json.loads(conn.makefile('rb').readline().decode('utf-8'))
+                if self.token and request.get('token') != self.token:
+                    raise Exception('认证失败')
+                urls = [url.strip() for url in request.get('urls', []) if url.strip()]
+                self._dispatch(urls)
+                if urls:
+                    logger.info('收到来自其他进程的 %s 个链接', len(urls))
+                reply = {'ok': True, 'accepted': len(urls)}
+            except Exception as e:
+                logger.error('处理进程间请求失败: %s', e)
+                reply = {'ok': False, 'error': str(e)}
+            try:
+                conn.sendall(json.dumps(reply, ensure_ascii=False).encode('utf-8') + b'\n')
+            except OSError:
+                pass
+    
+    def close(self):
+        sock = self._socket
+        self._socket = None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sock.close()
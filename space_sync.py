@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+from logger import get_logger
+from config import DATA_DIR
+from bilibili_api import api
+from download_manager import DownloadTask, download_manager
+from link_ingest import listing_infos
+from settings_manager import settings
+
+logger = get_logger('ingest')
+
+SPACE_SYNC_FILE = os.path.join(DATA_DIR, 'space_sync.json')
+KNOWN_BVID_LIMIT = 50
+
+class SpaceSync:
+    def __init__(self, state_file=SPACE_SYNC_FILE):
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.state = self.load_state()
+    
+    def load_state(self):
+        state = {'spaces': {}, 'watermarks': {}}
+        try:
+            if os.path.exists(self.state_file):
+                with open(self.state_file, 'r', encoding='utf-8') as f:
+                    state.update(json.load(f))
+        except Exception as e:
+            logger.error('加载UP主同步状态失败: %s', e)
+        return state
+    
+    def save_state(self):
+        try:
+            with open(self.state_file, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error('保存UP主同步状态失败: %s', e)
+    
+    def add_space(self, url, output_path=None, quality=None, format_type=None, download_cover=None):
+        mid = api.extract_mid(url) or (url if str(url).isdigit() else None)
+        if not mid:
+            logger.error('无法提取用户ID: %s', url)
+            return None
+        
+        with self._lock:
+            self.state['spaces'][str(mid)] = {
+                'output_path': output_path or settings.get('default_download_path'),
+                'quality': quality or settings.get('default_quality'),
+                'format_type': format_type or settings.get('default_video_format'),
+                'download_cover': settings.get('download_cover') if download_cover is None else download_cover
+            }
+            self.save_state()
+        logger.info('添加UP主同步: %s', mid)
+        return str(mid)
+    
+    def remove_space(self, mid):
+        with self._lock:
+            self.state['spaces'].pop(str(mid), None)
+            self.state['watermarks'].pop(str(mid), None)
+            self.save_state()
+    
+    def _is_known(self, video, watermark):
+        if video.get('bvid') in watermark.get('bvids', []):
+            return True
+        return (video.get('pubdate') or 0) < watermark.get('pubdate', 0)
+    
+    def fetch_new_videos(self, mid):
+        watermark = self.state['watermarks'].get(str(mid))
+        
+        if watermark is None:
+            logger.info('UP主 %s 没有同步记录，获取全部视频', mid)
+            watermark = {'pubdate': 0, 'bvids': []}
+        
+        new_videos = []
+        page = 1
+        while True:
+            result = api.get_user_videos_page(mid, page)
+            if result is None:
+                return None
+            
+            videos, total = result
+            for video in videos:
+                if self._is_known(video, watermark):
+                    return new_videos
+                new_videos.append(video)
+            
+            if not videos or page * 30 >= total:
+                return new_videos
+            page += 1
+    
+    def _update_watermark(self, mid, videos):
+        watermark = self.state['watermarks'].get(str(mid), {'pubdate': 0, 'bvids': []})
+        newest = max((video.get('pubdate') or 0 for video in videos), default=0)
+        
+        bvids = [video.get('bvid') for video in videos if video.get('bvid')]
+        watermark['bvids'] = (bvids + watermark.get('bvids', []))[:KNOWN_BVID_LIMIT]
+        watermark['pubdate'] = max(watermark.get('pubdate', 0), newest)
+        self.state['watermarks'][str(mid)] = watermark
+    
+    def _create_tasks(self, video, options):
+        infos = listing_infos(video)
+        if not infos:
+            return []
+        
+        if not os.path.exists(options['output_path']):
+            os.makedirs(options['output_path'], exist_ok=True)
+        
+        return [
+            DownloadTask(
+                info,
+                options['output_path'],
+                options['quality'],
+                options['format_type'],
+                options['download_cover'] and options['format_type'] not in ['mp3', 'aac', 'flac']
+            )
+            for info in infos
+        ]
+    
+    def sync_space(self, mid):
+        mid = str(mid)
+        options = self.state['spaces'].get(mid)
+        if options is None:
+            logger.error('未订阅的UP主: %s', mid)
+            return []
+        
+        new_videos = self.fetch_new_videos(mid)
+        if new_videos is None:
+            logger.error('同步UP主失败: %s', mid)
+            return []
+        
+        tasks = []
+        enqueued = []
+        for video in reversed(new_videos):
+            video_tasks = self._create_tasks(video, options)
+            if not video_tasks:
+                logger.warning('UP主 %s 的视频 %s 未能加入队列，下次同步时重试', mid, video.get("bvid"))
+                break
+            for task in video_tasks:
+                download_manager.add_task(task)
+                tasks.append(task)
+            enqueued.append(video)
+        
+        if enqueued:
+            with self._lock:
+                self._update_watermark(mid, enqueued[::-1])
+                self.save_state()
+        
+        logger.info('UP主 %s 同步完成，新增 %s/%s 个视频', mid, len(enqueued), len(new_videos))
+        return tasks
+    
+    def sync_all(self):
+        tasks = []
+        for mid in list(self.state['spaces'].keys()):
+            if self._stop_event.is_set():
+                break
+            tasks.extend(self.sync_space(mid))
+        return tasks
+    
+    def start(self, interval=None):
+        if self._thread and self._thread.is_alive():
+            return
+        
+        if interval is None:
+            interval = settings.get('space_sync_interval', 3600)
+        
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+        logger.info('UP主定时同步已启动，间隔 %s 秒', interval)
+    
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=5)
+    
+    def _run(self, interval):
+        while not self._stop_event.is_set():
+            try:
+                self.sync_all()
+            except Exception as e:
+                logger.error('UP主同步异常: %s', e)
+            self._stop_event.wait(interval)
+
+space_sync = SpaceSync()
@@ -0,0 +1,464 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from config import QUALITY_IDS, QUALITY_BITRATES, VIDEO_CODECS
+from logger import get_logger
+
+logger = get_logger('standin')
+
+RATE_LIMITED_RESPONSE = {'code': -799, 'message': '请求过于频繁，请稍后再试', 'ttl': 1}
+RATE_LIMITED_ENDPOINTS = (
+    '/x/web-interface/view',
+    '/x/player/playurl',
+    '/x/polymer/space/seasons_archives_list',
+    '/x/polymer/web-space/medialist',
+    '/x/series/series',
+    '/x/space/arc/search'
+)
+STREAM_QUALITIES = ('1080P', '720P', '480P')
+AUDIO_STREAM_ID = 30280
+AUDIO_BITRATE = 128000
+CHUNK_SIZE = 65536
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        logger.debug('[stand-in] %s ' + format, self.address_string(), *args)
+    
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        app = self.server.app
+        try:
+            if url.path.startswith('/cdn/'):
+                app.serve_media(self, url.path, query, self.server.is_backup)
+            else:
+                app.serve_api(self, url.path, query)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+    
+    def finish(self):
+        try:
+            super().finish()
+        except OSError:
+            pass
+    
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class StandInServer:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, throttle=0, rate_limit_ratio=0.0,
+                 backup_hosts=0, primary_failure_ratio=0.0, media_dir=None, seed=0,
+                 reset_ratio=0.0, truncate_ratio=0.0, ignore_range_ratio=0.0, url_ttl=0):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.throttle = throttle
+        self.rate_limit_ratio = rate_limit_ratio
+        self.backup_hosts = backup_hosts
+        self.primary_failure_ratio = primary_failure_ratio
+        self.reset_ratio = reset_ratio
+        self.truncate_ratio = truncate_ratio
+        self.ignore_range_ratio = ignore_range_ratio
+        self.url_ttl = url_ttl
+        self.media_dir = media_dir or tempfile.mkdtemp(prefix='bili-standin-')
+        os.makedirs(self.media_dir, exist_ok=True)
+        self.random = random.Random(seed)
+        
+        self.videos = {}
+        self.videos_by_aid = {}
+        self.collections = {}
+        self.spaces = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._media_lock = threading.Lock()
+        self._media_files = {}
+        self.stats = Counter()
+        self._servers = []
+    
+    @property
+    def url(self):
+        return self.cdn_hosts[0]
+    
+    @property
+    def cdn_hosts(self):
+        return [f'http://{self.host}:{server.server_address[1]}' for server in self._servers]
+    
+    def start(self):
+        for index in range(self.backup_hosts + 1):
+            server = ThreadingHTTPServer((self.host, self.port if index == 0 else 0), StandInRequestHandler)
+            server.daemon_threads = True
+            server.app = self
+            server.is_backup = index > 0
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self._servers.append(server)
+        logger.info('模拟服务已启动: %s, 备用CDN %s 个', self.url, len(self._servers) - 1)
+        return self
+    
+    def stop(self):
+        for server in self._servers:
+            server.shutdown()
+            server.server_close()
+        self._servers = []
+    
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+    
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+        stats['api_calls'] = sum(count for key, count in stats.items() if key.startswith('api:'))
+        return stats
+    
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+    
+    def _chance(self, ratio):
+        return ratio > 0 and self.random.random() < ratio
+    
+    def _allocate_id(self):
+        with self._lock:
+            value = self._next_id
+            self._next_id += 1
+        return value
+    
+    def add_video(self, title=None, mid=1, duration=30):
+        number = self._allocate_id()
+        video = {
+            'bvid': f'BV1SI{number:06d}',
+            'aid': 100000 + number,
+            'cid': 500000 + number,
+            'title': title or f'模拟视频 {number}',
+            'mid': mid,
+            'duration': duration,
+            'pubdate': 1700000000 + number
+        }
+        self.videos[video['bvid']] = video
+        self.videos_by_aid[video['aid']] = video
+        return video
+    
+    def video_url(self, video):
+        return f'https://www.bilibili.com/video/{video["bvid"]}'
+    
+    def add_collection(self, count, duration=30):
+        sid = self._allocate_id()
+        self.collections[sid] = {
+            'title': f'模拟合集 {sid}',
+            'videos': [self.add_video(duration=duration) for _ in range(count)]
+        }
+        return f'https://www.bilibili.com/collection/{sid}'
+    
+    def add_space(self, count, duration=30):
+        mid = 9000000 + self._allocate_id()
+        videos = [self.add_video(mid=mid, duration=duration) for _ in range(count)]
+        self.spaces[mid] = videos[::-1]
+        return f'https://space.bilibili.com/{mid}'
+    
+    def _archive(self, video):
+        return {
+            'bvid': video['bvid'],
+            'aid': video['aid'],
+            'title': video['title'],
+            'pic': '',
+            'duration': video['duration'],
+            'pubdate': video['pubdate'],
+            'upper': {'mid': video['mid'], 'name': f'UP主 {video["mid"]}'}
+        }
+    
+    def _view_data(self, video):
+        return {
+            'bvid': video['bvid'],
+            'aid': video['aid'],
+            'title': video['title'],
+            'desc': '',
+            'owner': {'mid': video['mid'], 'name': f'UP主 {video["mid"]}'},
+            'duration': video['duration'],
+            'pubdate': video['pubdate'],
+            'pic': '',
+            'cid': video['cid'],
+            'pages': [{'cid': video['cid'], 'page': 1, 'part': video['title'], 'duration': video['duration']}]
+        }
+    
+    def _stream(self, kind, stream_id, bitrate, duration, extra):
+        path = f'/cdn/{kind}/{bitrate}/{duration}.m4s'
+        if self.url_ttl:
+            path += f'?deadline={time.time() + self.url_ttl:.3f}'
+        hosts = self.cdn_hosts
+        return {
+            'id': stream_id,
+            'baseUrl': hosts[0] + path,
+            'backupUrl': [host + path for host in hosts[1:]],
+            'bandwidth': bitrate,
+            **extra
+        }
+    
+    def _playurl_data(self, video, qn):
+        duration = video['duration']
+        qualities = [quality for quality in STREAM_QUALITIES if QUALITY_IDS[quality] <= qn] or [STREAM_QUALITIES[-1]]
+        return {
+            'quality': QUALITY_IDS[qualities[0]],
+            'dash': {
+                'duration': duration,
+                'video': [
+                    self._stream('video', QUALITY_IDS[quality], QUALITY_BITRATES[quality], duration, {'codecid': VIDEO_CODECS['avc']})
+                    for quality in qualities
+                ],
+                'audio': [self._stream('audio', AUDIO_STREAM_ID, AUDIO_BITRATE, duration, {})]
+            }
+        }
+    
+    def _page(self, items, page, page_size):
+        start = (page - 1) * page_size
+        return items[start:start + page_size]
+    
+    def _api_response(self, path, query):
+        if path == '/x/web-interface/view':
+            video = self.videos.get(query.get('bvid')) or self.videos_by_aid.get(int(query.get('aid') or 0))
+            if video is None:
+                return {'code': -404, 'message': '啥都木有'}
+            return {'code': 0, 'data': self._view_data(video)}
+        
+        if path == '/x/player/playurl':
+            video = self.videos.get(query.get('bvid'))
+            if video is None or int(query.get('cid') or 0) != video['cid']:
+                return {'code': -404, 'message': '啥都木有'}
+            return {'code': 0, 'data': self._playurl_data(video, int(query.get('qn') or QUALITY_IDS['1080P']))}
+        
+        if path in ('/x/polymer/space/seasons_archives_list', '/x/polymer/web-space/medialist', '/x/series/series'):
+            sid = int(query.get('mid') or query.get('series_id') or 0)
+            collection = self.collections.get(sid)
+            if collection is None:
+                return {'code': -404, 'message': '啥都木有'}
+            page_size = int(query.get('page_size') or query.get('ps') or 30)
+            page = int(query.get('page_num') or query.get('pn') or 1)
+            archives = [self._archive(video) for video in self._page(collection['videos'], page, page_size)]
+            if path == '/x/polymer/web-space/medialist':
+                return {'code': 0, 'data': {'list': {'ves': archives, 'info': {'title': collection['title']}}}}
+            return {'code': 0, 'data': {'archives': archives, 'meta': {'name': collection['title']}}}
+        
+        if path == '/x/space/arc/search':
+            videos = self.spaces.get(int(query.get('mid') or 0))
+            if videos is None:
+                return {'code': -404, 'message': '啥都木有'}
+            page_size = int(query.get('ps') or 30)
+            page = int(query.get('pn') or 1)
+            vlist = [
+                {
+                    'bvid': video['bvid'],
+                    'aid': video['aid'],
+                    'title': video['title'],
+                    'description': '',
+                    'author': f'UP主 {video["mid"]}',
+                    'mid': video['mid'],
+                    'length': f'{video["duration"] // 60:02d}:{video["duration"] % 60:02d}',
+                    'created': video['pubdate'],
+                    'pic': ''
+                }
+                for video in self._page(videos, page, page_size)
+            ]
+            return {'code': 0, 'data': {'list': {'vlist': vlist}, 'page': {'count': len(videos), 'pn': page, 'ps': page_size}}}
+        
+        if path == '/x/passport-login/web/qrcode/generate':
+            key = f'{self.random.getrandbits(64):016x}'
+            return {'code': 0, 'data': {'url': f'{self.url}/qrcode/scan?qrcode_key={key}', 'qrcode_key': key}}
+        
+        if path == '/x/passport-login/web/qrcode/poll':
+            return {'code': 0, 'data': {'code': 86101, 'url': '', 'message': '未扫码'}}
+        
+        if path == '/x/space/myinfo':
+            return {'code': -101, 'message': '账号未登录'}
+        
+        return None
+    
+    def serve_api(self, handler, path, query):
+        if self.latency:
+            time.sleep(self.latency)
+        
+        if path in RATE_LIMITED_ENDPOINTS and self.rate_limit_ratio and self.random.random() < self.rate_limit_ratio:
+            self._count('rate_limited')
+            self._count(f'api:{path}')
+            handler.send_json(RATE_LIMITED_RESPONSE)
+            return
+        
+        response = self._api_response(path, query)
+        if response is None:
+            handler.send_json({'code': -404, 'message': '啥都木有'}, 404)
+            return
+        self._count(f'api:{path}')
+        handler.send_json(response)
+    
+    def _generate_media(self, kind, bitrate, duration, path):
+        if kind == 'video':
+            source = ['-f', 'lavfi', '-i', f'testsrc2=size=1280x720:rate=25:duration={duration}', '-vf', 'noise=alls=40:allf=t+u', '-c:v', 'mpeg4', '-b:v', str(bitrate), '-an']
+        else:
+            source = ['-f', 'lavfi', '-i', f'sine=frequency=440:duration={duration}', '-c:a', 'aac', '-b:a', str(bitrate), '-vn']
+        cmd = ['ffmpeg', '-v', 'error'] + source + ['-f', 'mp4', '-movflags', 'frag_keyframe+empty_moov+default_base_moof', '-y', path]
+        
+        if shutil.which('ffmpeg'):
+            try:
+                subprocess.run(cmd, capture_output=True, check=True)
+                return
+            except subprocess.CalledProcessError as e:
+                logger.warning('生成模拟媒体失败, 改用随机数据: %s', e.stderr.decode("utf-8", "ignore").strip())
+        
+        size = bitrate * duration // 8
+        generator = random.Random(f'{kind}:{bitrate}:{duration}')
+        with open(path, 'wb') as f:
+            while size > 0:
+                chunk = min(size, 1048576)
+                f.write(generator.randbytes(chunk))
+                size -= chunk
+    
+    def media_file(self, kind, bitrate, duration):
+        key = (kind, bitrate, duration)
+        with self._media_lock:
+            path = self._media_files.get(key)
+            if path is None:
+                path = os.path.join(self.media_dir, f'{kind}_{bitrate}_{duration}.m4s')
+                self._generate_media(kind, bitrate, duration, path)
+                self._media_files[key] = path
+        return path
+    
+    def serve_media(self, handler, path, query, is_backup):
+        try:
+            _, _, kind, bitrate, duration = path.split('/')
+            media_file = self.media_file(kind, int(bitrate), int(duration.split('.')[0]))
+        except ValueError:
+            handler.send_error(404)
+            return
+        
+        if self.url_ttl and float(query.get('deadline') or 0) < time.time():
+            self._count('cdn_expired')
+            handler.send_error(403)
+            return
+        
+        if not is_backup and self._chance(self.primary_failure_ratio):
+            self._count('cdn_failures')
+            handler.send_error(503)
+            return
+        
+        size = os.path.getsize(media_file)
+        start, end = 0, size - 1
+        range_header = handler.headers.get('Range')
+        if range_header and self._chance(self.ignore_range_ratio):
+            self._count('ignored_ranges')
+            range_header = None
+        if range_header and range_header.startswith('bytes='):
+            first, _, last = range_header[6:].partition('-')
+            start = int(first or 0)
+            end = min(int(last), size - 1) if last else size - 1
+            if start >= size:
+                handler.send_response(416)
+                handler.send_header('Content-Range', f'bytes */{size}')
+                handler.send_header('Content-Length', '0')
+                handler.end_headers()
+                return
+            handler.send_response(206)
+            handler.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            handler.send_response(200)
+        
+        length = end - start + 1
+        handler.send_header('Content-Type', 'video/mp4' if kind == 'video' else 'audio/mp4')
+        handler.send_header('Content-Length', str(length))
+        handler.send_header('Accept-Ranges', 'bytes')
+        handler.end_headers()
+        
+        limit = length
+        fault = None
+        if length > 1 and self._chance(self.reset_ratio):
+            fault = 'resets'
+        elif length > 1 and self._chance(self.truncate_ratio):
+            fault = 'truncations'
+        if fault:
+            limit = self.random.randrange(1, length)
+            self._count(fault)
+        
+        sent = 0
+        started = time.monotonic()
+        try:
+            with open(media_file, 'rb') as f:
+                f.seek(start)
+                while sent < limit:
+                    chunk = f.read(min(CHUNK_SIZE, limit - sent))
+                    if not chunk:
+                        break
+                    handler.wfile.write(chunk)
+                    sent += len(chunk)
+                    if self.throttle:
+                        delay = sent / self.throttle - (time.monotonic() - started)
+                        if delay > 0:
+                            time.sleep(delay)
+        finally:
+            self._count('cdn_bytes', sent)
+            self._count('cdn_requests')
+        
+        if fault:
+            handler.close_connection = True
+            if fault == 'resets':
+                handler.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                handler.connection.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='B站接口和CDN模拟服务 (用于离线测试和性能测试)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.0, help='每个API请求附加的延迟 (秒)')
+    parser.add_argument('--throttle', type=float, default=0.0, help='每个CDN连接的限速 (MB/s), 0 表示不限速')
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help='返回 -799 的请求比例')
+    parser.add_argument('--backup-hosts', type=int, default=0, help='备用CDN主机数量')
+    parser.add_argument('--primary-failure-ratio', type=float, default=0.0, help='主CDN主机返回 503 的比例')
+    parser.add_argument('--reset-ratio', type=float, default=0.0, help='在随机位置重置CDN连接的比例')
+    parser.add_argument('--truncate-ratio', type=float, default=0.0, help='提前结束CDN响应体的比例')
+    parser.add_argument('--ignore-range-ratio', type=float, default=0.0, help='忽略Range请求头并返回完整文件的比例')
+    parser.add_argument('--url-ttl', type=float, default=0, help='CDN地址的有效期 (秒), 过期后返回 403, 0 表示不过期')
+    parser.add_argument('--videos', type=int, default=3, help='单个视频数量')
+    parser.add_argument('--collection', type=int, default=30, help='合集中的视频数量')
+    parser.add_argument('--space', type=int, default=60, help='UP主空间中的视频数量')
+    parser.add_argument('--duration', type=int, default=30, help='每个视频的时长 (秒)')
+    args = parser.parse_args(argv)
+    
+    server = StandInServer(
+        args.host, args.port, args.latency, int(args.throttle * 1048576), args.rate_limit_ratio,
+        args.backup_hosts, args.primary_failure_ratio,
+        reset_ratio=args.reset_ratio, truncate_ratio=args.truncate_ratio,
+        ignore_range_ratio=args.ignore_range_ratio, url_ttl=args.url_ttl
+    ).start()
+    
+    links = [server.video_url(server.add_video(duration=args.duration)) for _ in range(args.videos)]
+    if args.collection:
+        links.append(server.add_collection(args.collection, args.duration))
+    if args.space:
+        links.append(server.add_space(args.space, args.duration))
+    
+    print(f'BILI_API_BASE={server.url} BILI_PASSPORT_BASE={server.url}')
+    for link in links:
+        print(link)
+    
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == '__main__':
+    main()
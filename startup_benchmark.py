@@ -0,0 +1,124 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(BASE_DIR, 'startup_baseline.json')
+CLI_IMPORT_SCRIPT = 'import time; started = time.perf_counter(); import cli; print((time.perf_counter() - started) * 1000)'
+GUI_TIMEOUT = 60
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def prepare_env(work_dir):
+    config_dir = os.path.join(work_dir, 'config')
+    os.makedirs(config_dir, exist_ok=True)
+    with open(os.path.join(config_dir, 'settings.json'), 'w', encoding='utf-8') as f:
+        json.dump({'instance_port': free_port(), 'auto_resume': False}, f)
+    env = dict(os.environ, BILI_DATA_DIR=os.path.join(work_dir, 'data'), BILI_CONFIG_DIR=config_dir, BILI_LOGS_DIR=os.path.join(work_dir, 'logs'))
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    return env
+
+def measure_cli(env):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', CLI_IMPORT_SCRIPT], cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True)
+    return {'cli_import_ms': round(float(result.stdout.strip().splitlines()[-1]), 1), 'cli_process_ms': round((time.perf_counter() - started) * 1000, 1)}
+
+def measure_gui(env, work_dir):
+    profile_file = os.path.join(work_dir, 'startup.json')
+    if os.path.exists(profile_file):
+        os.remove(profile_file)
+    started = time.perf_counter()
+    subprocess.run([sys.executable, os.path.join(BASE_DIR, 'main.py')], cwd=BASE_DIR, env=dict(env, BILI_STARTUP_PROFILE=profile_file), capture_output=True, timeout=GUI_TIMEOUT)
+    elapsed = round((time.perf_counter() - started) * 1000, 1)
+    if not os.path.exists(profile_file):
+        raise RuntimeError('主窗口未能启动')
+    with open(profile_file, 'r', encoding='utf-8') as f:
+        timings = json.load(f)
+    timings['gui_process_ms'] = elapsed
+    return timings
+
+def run(args):
+    work_dir = tempfile.mkdtemp(prefix='bili-startup-')
+    env = prepare_env(work_dir)
+    with_gui = not args.no_gui and importlib.util.find_spec('PyQt5') is not None
+    if not with_gui and not args.no_gui:
+        sys.stderr.write('未安装PyQt5, 只测试命令行模式的启动时间\n')
+    
+    samples = {}
+    for _ in range(args.warmup + args.runs):
+        run_timings = measure_cli(env)
+        if with_gui:
+            run_timings.update(measure_gui(env, work_dir))
+        for metric, value in run_timings.items():
+            samples.setdefault(metric, []).append(value)
+    return {metric: round(statistics.median(values[args.warmup:]), 1) for metric, values in samples.items()}
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    base = baseline.get('results') or {}
+    for metric, current in results.items():
+        previous = base.get(metric)
+        if not previous:
+            print(f'  {metric:<20} {current:>10}ms')
+            continue
+        
+        change = (current - previous) / previous
+        mark = ''
+        if change > tolerance:
+            mark = '  <- 退化'
+            regressions.append(metric)
+        elif -change > tolerance:
+            mark = '  <- 提升'
+        print(f'  {metric:<20} {current:>10}ms  基准 {previous:>10}ms  {change:+.1%}{mark}')
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='启动时间测试 (导入耗时和主窗口首次绘制耗时)')
+    parser.add_argument('-n', '--runs', type=int, default=5, help='测试次数, 取中位数')
+    parser.add_argument('--warmup', type=int, default=1, help='预热次数, 不计入结果')
+    parser.add_argument('--no-gui', action='store_true', help='只测试命令行模式')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='基准数据文件')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基准数据')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='允许的波动比例')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    
+    with redirect_stdout(sys.stderr if args.json else sys.stdout):
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        print(f'启动时间 (中位数, {args.runs} 次):')
+        regressions = compare(results, baseline, args.tolerance)
+        
+        if args.save_baseline:
+            with open(args.baseline, 'w', encoding='utf-8') as f:
+                json.dump({'platform': platform.platform(), 'python': platform.python_version(), 'results': results}, f, ensure_ascii=False, indent=2)
+            print(f'基准数据已保存: {args.baseline}')
+            return 0
+        if regressions:
+            print(f'\n启动时间退化: {", ".join(regressions)}')
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+from config import QUALITY_IDS, QUALITY_BITRATES, VIDEO_CODECS, AUDIO_OUTPUT_BITRATE
+
+CODEC_NAMES = {codec_id: name for name, codec_id in VIDEO_CODECS.items()}
+CODEC_COMPATIBLE_FORMATS = {
+    'mp4': ('avc', 'hevc', 'av1'),
+    'flv': ('avc',),
+    'avi': ('avc',)
+}
+BITRATE_TOLERANCE = 0.9
+
+def stream_url(stream):
+    return stream.get('baseUrl') or stream.get('base_url')
+
+def stream_urls(stream):
+    urls = [stream_url(stream)]
+    for url in stream.get('backupUrl') or stream.get('backup_url') or []:
+        if url and url not in urls:
+            urls.append(url)
+    return urls
+
+def _available_quality(videos, quality_id):
+    ids = sorted({video.get('id', 0) for video in videos})
+    fitting = [i for i in ids if i <= quality_id]
+    return fitting[-1] if fitting else ids[0]
+
+def select_video(dash, quality, format_type='mp4', codec='smallest'):
+    videos = dash.get('video') or []
+    if not videos:
+        return None
+    
+    quality_id = _available_quality(videos, QUALITY_IDS.get(quality, QUALITY_IDS['1080P']))
+    candidates = [video for video in videos if video.get('id') == quality_id]
+    
+    allowed = CODEC_COMPATIBLE_FORMATS.get(format_type, tuple(VIDEO_CODECS))
+    compatible = [video for video in candidates if CODEC_NAMES.get(video.get('codecid')) in allowed]
+    candidates = compatible or candidates
+    
+    if codec in VIDEO_CODECS:
+        preferred = [video for video in candidates if video.get('codecid') == VIDEO_CODECS[codec]]
+        candidates = preferred or candidates
+    return min(candidates, key=lambda video: video.get('bandwidth', 0))
+
+def select_audio(dash, format_type='mp4', target_bitrate=AUDIO_OUTPUT_BITRATE):
+    audios = list(dash.get('audio') or [])
+    
+    if format_type == 'flac':
+        flac = (dash.get('flac') or {}).get('audio')
+        if flac:
+            return flac
+    
+    if not audios:
+        return None
+    audios.sort(key=lambda audio: audio.get('bandwidth', 0))
+    
+    if format_type in ['mp3', 'aac']:
+        for audio in audios:
+            if audio.get('bandwidth', 0) >= target_bitrate * BITRATE_TOLERANCE:
+                return audio
+    return audios[-1]
+
+def stream_size(stream, duration):
+    if not stream:
+        return 0
+    return int((duration or 0) * stream.get('bandwidth', 0) / 8)
+
+def estimate_size(duration, quality):
+    duration = duration or 0
+    if isinstance(duration, str):
+        seconds = 0
+        for part in duration.split(':'):
+            seconds = seconds * 60 + (int(part) if part.isdigit() else 0)
+        duration = seconds
+    return int(duration * QUALITY_BITRATES.get(quality, QUALITY_BITRATES['1080P']) / 8)
+
+def describe_video(video):
+    quality = next((name for name, quality_id in QUALITY_IDS.items() if quality_id == video.get('id')), video.get('id'))
+    codec = CODEC_NAMES.get(video.get('codecid'), video.get('codecs'))
+    return f'{quality} {codec} {video.get("bandwidth", 0) // 1000} kbps'
+
+def describe_audio(audio):
+    return f'{audio.get("id")} {audio.get("bandwidth", 0) // 1000} kbps'
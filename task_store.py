@@ -0,0 +1,174 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from logger import get_logger
+from config import DATA_DIR
+
+logger = get_logger('download')
+
+TASK_DB_FILE = os.path.join(DATA_DIR, 'tasks.db')
+UNFINISHED_STATUSES = ('pending', 'downloading', 'paused')
+
+class TaskStore:
+    def __init__(self, db_file=TASK_DB_FILE, flush_interval=1.0):
+        self.db_file = db_file
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS tasks (
+                task_id TEXT PRIMARY KEY,
+                spec TEXT NOT NULL,
+                status TEXT NOT NULL,
+                downloaded_size INTEGER DEFAULT 0,
+                total_size INTEGER DEFAULT 0,
+                output_file TEXT,
+                error TEXT,
+                created REAL,
+                updated REAL
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks (status)')
+        self._conn.commit()
+        
+        self._db_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending_specs = {}
+        self._pending_states = {}
+        self._active_provider = None
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def set_active_provider(self, provider):
+        self._active_provider = provider
+    
+    def _state_row(self, task):
+        return (
+            task.status,
+            task.downloaded_size,
+            task.total_size,
+            task.output_file,
+            task.error,
+            time.time(),
+            task.task_id
+        )
+    
+    def save(self, task):
+        with self._pending_lock:
+            self._pending_specs[task.task_id] = (task.task_id, json.dumps(task.to_spec(), ensure_ascii=False), time.time())
+            self._pending_states[task.task_id] = self._state_row(task)
+    
+    def update(self, task):
+        with self._pending_lock:
+            self._pending_states[task.task_id] = self._state_row(task)
+    
+    def flush(self):
+        if self._active_provider is not None:
+            try:
+                for task in self._active_provider():
+                    self.update(task)
+            except Exception as e:
+                logger.error('读取任务进度失败: %s', e)
+        
+        with self._pending_lock:
+            specs = list(self._pending_specs.values())
+            states = list(self._pending_states.values())
+            self._pending_specs = {}
+            self._pending_states = {}
+        
+        if not specs and not states:
+            return
+        
+        try:
+            with self._db_lock:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR IGNORE INTO tasks (task_id, spec, status, created) VALUES (?, ?, 'pending', ?)",
+                        specs
+                    )
+                    self._conn.executemany(
+                        'UPDATE tasks SET status = ?, downloaded_size = ?, total_size = ?, output_file = ?, error = ?, updated = ? WHERE task_id = ?',
+                        states
+                    )
+        except Exception as e:
+            logger.error('保存任务状态失败: %s', e)
+    
+    def _writer_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+    
+    def load_unfinished(self):
+        self.flush()
+        placeholders = ', '.join('?' for _ in UNFINISHED_STATUSES)
+        with self._db_lock:
+            rows = self._conn.execute(
+                f'SELECT task_id, spec, status, downloaded_size, total_size, output_file FROM tasks WHERE status IN ({placeholders}) ORDER BY created',
+                UNFINISHED_STATUSES
+            ).fetchall()
+        
+        records = []
+        for task_id, spec, status, downloaded_size, total_size, output_file in rows:
+            try:
+                records.append({
+                    'task_id': task_id,
+                    'spec': json.loads(spec),
+                    'status': status,
+                    'downloaded_size': downloaded_size,
+                    'total_size': total_size,
+                    'output_file': output_file
+                })
+            except ValueError as e:
+                logger.error('任务记录损坏: %s, %s', task_id, e)
+        return records
+    
+    def load_history(self, limit=100, offset=0):
+        self.flush()
+        placeholders = ', '.join('?' for _ in UNFINISHED_STATUSES)
+        with self._db_lock:
+            rows = self._conn.execute(
+                f'SELECT task_id, spec, status, downloaded_size, total_size, output_file, error, updated FROM tasks WHERE status NOT IN ({placeholders}) ORDER BY updated DESC LIMIT ? OFFSET ?',
+                (*UNFINISHED_STATUSES, limit, offset)
+            ).fetchall()
+        
+        records = []
+        for task_id, spec, status, downloaded_size, total_size, output_file, error, updated in rows:
+            try:
+                title = json.loads(spec)['video_info'].get('title')
+            except (ValueError, KeyError):
+                title = None
+            records.append({
+                'task_id': task_id,
+                'title': title,
+                'status': status,
+                'downloaded_size': downloaded_size,
+                'total_size': total_size,
+                'output_file': output_file,
+                'error': error,
+                'updated': updated
+            })
+        return records
+    
+    def remove(self, task_id):
+        with self._pending_lock:
+            self._pending_specs.pop(task_id, None)
+            self._pending_states.pop(task_id, None)
+        with self._db_lock:
+            with self._conn:
+                self._conn.execute('DELETE FROM tasks WHERE task_id = ?', (task_id,))
+    
+    def close(self):
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        self._thread.join(timeout=5)
+        self.flush()
+        with self._db_lock:
+            self._conn.close()
+
+task_store = TaskStore()
@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from logger import get_logger
+
+logger = get_logger('monitor')
+
+MAX_TRACE_EVENTS = 200000
+
+def _now_us():
+    return time.perf_counter_ns() // 1000
+
+class Span:
+    __slots__ = ('tracer', 'name', 'category', 'args', 'start')
+    
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+    
+    def set(self, **args):
+        self.args.update(args)
+    
+    def __enter__(self):
+        self.start = _now_us()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self.args['error'] = str(exc)
+        self.tracer._record('X', self.name, self.category, self.start, self.args, _now_us() - self.start)
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+    
+    def set(self, **args):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+NULL_SPAN = _NullSpan()
+
+class Tracer:
+    def __init__(self, max_events=MAX_TRACE_EVENTS):
+        self.enabled = False
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        self._events = deque(maxlen=max_events)
+        self._tracks = {}
+    
+    def enable(self):
+        self.enabled = True
+        logger.info('性能追踪已开启')
+    
+    def disable(self):
+        self.enabled = False
+    
+    def clear(self):
+        with self._lock:
+            self._events.clear()
+            self._tracks.clear()
+    
+    def span(self, name, category='download', **args):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, args)
+    
+    def instant(self, name, category='download', **args):
+        if self.enabled:
+            self._record('i', name, category, _now_us(), args)
+    
+    def _record(self, phase, name, category, start, args, duration=None):
+        track = threading.current_thread().name
+        event = {'name': name, 'cat': category, 'ph': phase, 'ts': start, 'pid': self.pid, 'args': args}
+        if duration is not None:
+            event['dur'] = duration
+        if phase == 'i':
+            event['s'] = 't'
+        with self._lock:
+            tid = self._tracks.get(track)
+            if tid is None:
+                tid = self._tracks[track] = len(self._tracks) + 1
+            event['tid'] = tid
+            self._events.append(event)
+    
+    def to_chrome_trace(self):
+        with self._lock:
+            events = list(self._events)
+            tracks = dict(self._tracks)
+        
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'tid': 0, 'args': {'name': 'BilibiliDownload'}}]
+        for track, tid in tracks.items():
+            metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': track}})
+            metadata.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'sort_index': tid}})
+        return {'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}
+    
+    def export(self, path):
+        trace = self.to_chrome_trace()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(trace, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        logger.info('性能追踪已保存: %s (%s 个事件)', path, len(trace["traceEvents"]))
+        return path
+
+tracer = Tracer()
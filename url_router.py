@@ -0,0 +1,78 @@
+import re
+from collections import namedtuple
+
+VIDEO_PATH_PATTERN = re.compile(r'/video/(BV[a-zA-Z0-9]+|av\d+)', re.IGNORECASE)
+BVID_PATTERN = re.compile(r'BV[a-zA-Z0-9]+')
+AVID_PATTERN = re.compile(r'^av(\d+)$', re.IGNORECASE)
+SHORT_LINK_PATTERN = re.compile(r'(?:b23\.tv|bili2233\.cn)/([a-zA-Z0-9]+)')
+SPACE_PATTERN = re.compile(r'space\.bilibili\.com/(\d+)(?:/(?:upload/)?video)?/?(?:[?#]|$)')
+
+COLLECTION_PATTERNS = [
+    ('collection', re.compile(r'space\.bilibili\.com/\d+/lists/(\d+)\?(?:.*&)?type=season')),
+    ('series', re.compile(r'space\.bilibili\.com/\d+/lists/(\d+)\?(?:.*&)?type=series')),
+    ('collection', re.compile(r'space\.bilibili\.com/\d+/channel/collectiondetail\?(?:.*&)?sid=(\d+)')),
+    ('series', re.compile(r'space\.bilibili\.com/\d+/channel/seriesdetail\?(?:.*&)?sid=(\d+)')),
+    ('opus', re.compile(r'bilibili\.com/opus/(\d+)')),
+    ('collection', re.compile(r'bilibili\.com/collection/(\d+)')),
+    ('medialist', re.compile(r'bilibili\.com/medialist/detail/ml(\d+)')),
+    ('series', re.compile(r'bilibili\.com/series/(\d+)')),
+    ('list', re.compile(r'bilibili\.com/list/(\d+)'))
+]
+
+COLLECTION_KINDS = list(dict.fromkeys(kind for kind, _ in COLLECTION_PATTERNS))
+
+class Route(namedtuple('Route', ['kind', 'id', 'url'])):
+    __slots__ = ()
+    
+    @property
+    def key(self):
+        return f'{self.kind}:{self.id}'
+    
+    @property
+    def canonical_url(self):
+        if self.kind == 'video':
+            return f'https://www.bilibili.com/video/{self.id}'
+        elif self.kind == 'space':
+            return f'https://space.bilibili.com/{self.id}'
+        elif self.kind == 'short':
+            return f'https://b23.tv/{self.id}'
+        elif self.kind == 'medialist':
+            return f'https://www.bilibili.com/medialist/detail/ml{self.id}'
+        return f'https://www.bilibili.com/{self.kind}/{self.id}'
+
+def _video_route(video_id, url):
+    if video_id[:2].lower() == 'av':
+        return Route('video', 'av' + video_id[2:], url)
+    return Route('video', video_id, url)
+
+def route_url(url):
+    url = url.strip()
+    if not url:
+        return None
+    
+    match = VIDEO_PATH_PATTERN.search(url)
+    if match:
+        return _video_route(match.group(1), url)
+    
+    for kind, pattern in COLLECTION_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return Route(kind, match.group(1), url)
+    
+    match = SPACE_PATTERN.search(url)
+    if match:
+        return Route('space', match.group(1), url)
+    
+    match = BVID_PATTERN.search(url)
+    if match:
+        return Route('video', match.group(0), url)
+    
+    match = SHORT_LINK_PATTERN.search(url)
+    if match:
+        return Route('short', match.group(1), url)
+    
+    match = AVID_PATTERN.match(url)
+    if match:
+        return Route('video', f'av{match.group(1)}', url)
+    
+    return None